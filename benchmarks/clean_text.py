@@ -0,0 +1,97 @@
+"""Time of the row-wise clean_text apply vs the vectorized clean_text_column.
+
+    python -m benchmarks.clean_text --rows 100000 10000000
+
+Each mode runs in a fresh interpreter so peak RSS is not shared:
+
+  apply       df[col].astype(str).apply(clean_text), the old op pattern
+  vectorized  clean_text_column(df[col]) on pyarrow regex kernels
+
+The column mixes YouTube-style titles and descriptions (emoji, hashtags,
+punctuation, non-Latin scripts, newlines) with 5% nulls. At the smallest
+size both outputs are also compared row by row.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+MODES = ["apply", "vectorized"]
+SAMPLES = [
+    "Official Music Video (4K) | #pop #2024",
+    "Beyoncé – ÇUFF IT 🔥🔥 [Lyrics] feat. someone",
+    "LIVE @ Glastonbury!!! full set\n\nSubscribe → http://yt.be/x  #live",
+    "日本語のタイトル 【MV】 アーティスト",
+    "r&b / hip-hop mix... vol.2!? (slowed + reverb)",
+    "Стрим: новые треки\tи разговоры",
+    "Follow us:\n• Instagram: @band\n• TikTok: @band\n#music #newmusic #viral",
+]
+
+
+def synthetic_text(rows, seed=7):
+    rng = np.random.default_rng(seed)
+    pool = np.array([f"{SAMPLES[i % len(SAMPLES)]} {i}" for i in range(10_000)], dtype=object)
+    values = pd.Series(pool[rng.integers(0, len(pool), rows)], dtype="str")
+    return values.mask(rng.random(rows) < 0.05)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, rows):
+    from src.silver.silver import clean_text, clean_text_column
+
+    values = synthetic_text(rows)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "apply":
+        cleaned = values.astype(str).apply(clean_text)
+    else:
+        cleaned = clean_text_column(values)
+    elapsed = time.perf_counter() - start
+    return {"mode": mode, "rows": len(cleaned), "seconds": elapsed, "peak_mb": peak_rss_mb() - baseline}
+
+
+def check_equal(rows):
+    from src.silver.silver import clean_text, clean_text_column
+
+    values = synthetic_text(rows)
+    expected = values.apply(clean_text)
+    cleaned = clean_text_column(values)
+    assert cleaned.isna().equals(values.isna()), "null positions differ"
+    assert cleaned.dropna().tolist() == expected.dropna().tolist(), "cleaned text differs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 10_000_000])
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.rows[0])))
+        return
+
+    check_equal(min(args.rows))
+    print(f"outputs match on {min(args.rows)} rows")
+    print(f"{'mode':>10} {'rows':>10} {'seconds':>8} {'rows/s':>11} {'peak_mb':>8}")
+    for rows in args.rows:
+        for mode in MODES:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.clean_text", "--rows", str(rows), "--mode", mode],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{result['mode']:>10} {result['rows']:>10} {result['seconds']:>8.2f} "
+                  f"{result['rows'] / result['seconds']:>11,.0f} {result['peak_mb']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Memory and time of list-of-dict rows vs ColumnarBuilder for track records.
+
+    python -m benchmarks.columnar_builder --rows 1000000
+
+Each mode runs in a fresh interpreter so peak RSS is not shared:
+
+  dicts    rows.append({...}) then pd.DataFrame(rows), the old op pattern
+  builder  ColumnarBuilder(SPOTIFY_TRACK_SCHEMA) then .to_pandas()
+  parquet  ColumnarBuilder writing each 64k-row chunk straight to a Parquet
+           file as a row group (nothing is kept in memory)
+
+Records are shaped like the Spotify track rows and are generated one at a
+time, the way they arrive from paginated API responses.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ["dicts", "builder", "parquet"]
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_tracks(rows):
+    for i in range(rows):
+        yield {
+            "id": f"{i:022d}",
+            "name": f"track name {i}",
+            "artists": [{"name": f"artist {i % 5000}"}],
+            "duration_ms": 120000 + i % 180000,
+            "popularity": i % 100 if i % 7 else None,
+        }
+
+
+def run_mode(mode, rows):
+    import pandas as pd
+    from src.ingestion.columnar import ColumnarBuilder, SPOTIFY_TRACK_SCHEMA
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if mode == "dicts":
+        track_rows = []
+        for t in synthetic_tracks(rows):
+            track_rows.append({
+                "track_id": t["id"], "name": t["name"], "artist": t["artists"][0]["name"],
+                "album": "album", "release_date": "2024-01-01", "duration_ms": t["duration_ms"],
+                "popularity": t.get("popularity"), "query": "pop",
+            })
+        df = pd.DataFrame(track_rows)
+        result_rows = len(df)
+    else:
+        sink = tempfile.NamedTemporaryFile(suffix=".parquet", delete=False).name if mode == "parquet" else None
+        builder = ColumnarBuilder(SPOTIFY_TRACK_SCHEMA, sink=sink)
+        for t in synthetic_tracks(rows):
+            builder.append(t["id"], t["name"], t["artists"][0]["name"], "album", "2024-01-01",
+                           t["duration_ms"], t.get("popularity"), "pop")
+        if sink is None:
+            df = builder.to_pandas()
+            result_rows = len(df)
+        else:
+            builder.close()
+            result_rows = builder.num_rows
+            os.unlink(sink)
+    elapsed = time.perf_counter() - start
+    return {"mode": mode, "rows": result_rows, "seconds": elapsed, "peak_mb": peak_rss_mb() - baseline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.rows)))
+        return
+
+    print(f"{'mode':>8} {'rows':>10} {'seconds':>8} {'peak_mb':>8}")
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.columnar_builder", "--rows", str(args.rows), "--mode", mode],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{result['mode']:>8} {result['rows']:>10} {result['seconds']:>8.2f} {result['peak_mb']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
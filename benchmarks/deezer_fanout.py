@@ -0,0 +1,127 @@
+"""Wall-clock benchmark for the Deezer genre fan-out against a local stub API.
+
+    python -m benchmarks.deezer_fanout --sizes 5 50 500 --latency 0.05
+
+The stub answers /genre/{id}/artists and /artist/{id}/top with canned data
+after a fixed delay. The serial baseline replays the old loop (one request
+at a time plus the fixed 0.2s sleep); the concurrent run is
+fetch_genre_tracks with the shared quota limiter.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from src.ingestion import deezerapi
+
+GENRE_IDS = [132, 116, 152, 113, 106]
+
+
+class StubDeezer(BaseHTTPRequestHandler):
+    artists_per_genre = {}
+    latency = 0.0
+    request_times = deque()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.request_times.append(time.monotonic())
+        time.sleep(self.latency)
+        genre = re.match(r"/genre/(\d+)/artists", self.path)
+        artist = re.match(r"/artist/(\d+)/top", self.path)
+        if genre:
+            gid = int(genre.group(1))
+            count = self.artists_per_genre.get(gid, 0)
+            body = {"data": [{"id": gid * 100000 + i, "name": f"artist {gid}-{i}"} for i in range(count)]}
+        elif artist:
+            aid = int(artist.group(1))
+            body = {"data": [
+                {"id": aid * 10 + n, "title": f"track {aid}-{n}", "artist": {"name": f"artist {aid}"},
+                 "album": {"title": f"album {aid}"}, "link": f"https://deezer.test/{aid}/{n}", "duration": 180 + n}
+                for n in range(5)
+            ]}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def serial_genre_tracks(genre_ids):
+    # The pre-concurrency loop, kept verbatim apart from the base URL.
+    rows = []
+    for gid in genre_ids:
+        artists = deezerapi.deezer_request(f"{deezerapi.DEEZER_API_URL}/genre/{gid}/artists").get("data", [])
+        for artist in artists:
+            top_tracks = deezerapi.deezer_request(f"{deezerapi.DEEZER_API_URL}/artist/{artist['id']}/top?limit=50").get("data", [])
+            for t in top_tracks:
+                rows.append({
+                    "id": t["id"], "title": t["title"], "artist": t["artist"]["name"],
+                    "album": t["album"]["title"], "link": t["link"], "duration": t["duration"], "genre_id": gid
+                })
+            time.sleep(0.2)
+    return pd.DataFrame(rows)
+
+
+def peak_window_requests(window):
+    times = sorted(StubDeezer.request_times)
+    peak, start = 0, 0
+    for end, t in enumerate(times):
+        while t - times[start] > window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
+
+
+def timed(fn):
+    StubDeezer.request_times.clear()
+    start = time.perf_counter()
+    rows = fn(GENRE_IDS)
+    return rows, time.perf_counter() - start, peak_window_requests(deezerapi.DEEZER_QUOTA_WINDOW)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response delay in seconds")
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDeezer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    deezerapi.DEEZER_API_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    StubDeezer.latency = args.latency
+
+    print(f"{'artists':>8} {'serial_s':>10} {'concurrent_s':>13} {'speedup':>8} {'peak/5s':>8}")
+    try:
+        for size in args.sizes:
+            StubDeezer.artists_per_genre = {
+                gid: size // len(GENRE_IDS) + (1 if i < size % len(GENRE_IDS) else 0)
+                for i, gid in enumerate(GENRE_IDS)
+            }
+            concurrent_rows, concurrent_s, peak = timed(deezerapi.fetch_genre_tracks)
+            if args.skip_serial:
+                print(f"{size:>8} {'-':>10} {concurrent_s:>13.2f} {'-':>8} {peak:>8}")
+                continue
+            serial_rows, serial_s, _ = timed(serial_genre_tracks)
+            pd.testing.assert_frame_equal(serial_rows, concurrent_rows, check_dtype=False)
+            print(f"{size:>8} {serial_s:>10.2f} {concurrent_s:>13.2f} {serial_s / concurrent_s:>7.1f}x {peak:>8}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
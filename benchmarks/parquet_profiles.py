@@ -0,0 +1,128 @@
+"""Size and speed of each Parquet writer profile on source-shaped data.
+
+    python -m benchmarks.parquet_profiles --rows 1000000
+
+For each synthetic dataset and each profile in src.storage.profiles (plus
+"defaults", a plain pyarrow write with library defaults) this reports the
+object size, the write time through save_frame into a MemoryBackend, a full
+read, and a projected read of the key column plus one low-cardinality
+column. Times are the best of --repeat runs.
+"""
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from src.storage.arrow_fs import read_parquet
+from src.storage.backends import MemoryBackend
+from src.storage.datasets import BRONZE_DATASETS, save_frame
+from src.storage.profiles import PROFILES
+
+GENRES = ["pop", "electronic", "heavy metal", "country", "jazz", "hip hop",
+          "classical", "folk", "rock", "reggae", "blues", "r&b"]
+WORDS = np.array("love night baby heart dance fire time world girl dream rain home road light gold".split())
+
+
+def _text(rng, rows, words):
+    picks = WORDS[rng.integers(0, len(WORDS), size=(rows, words))]
+    return pd.Series([" ".join(row) for row in picks], dtype="str")
+
+
+def deezer_genres(rows, rng):
+    artist = rng.integers(0, max(rows // 20, 1), rows)
+    return pd.DataFrame({
+        "id": rng.permutation(rows).astype("int64") + 3_000_000_000,
+        "title": _text(rng, rows, 3),
+        "artist": pd.Series(artist).map("artist {}".format).astype("str"),
+        "album": pd.Series(artist * 4 + rng.integers(0, 4, rows)).map("album {}".format).astype("str"),
+        "link": pd.Series(rng.integers(0, 10**9, rows)).map("https://www.deezer.com/track/{}".format).astype("str"),
+        "duration": rng.integers(90, 420, rows),
+        "genre_id": rng.choice([132, 116, 152, 113, 106, 165, 85, 106, 466, 129], rows),
+    })
+
+
+def spotify_tracks(rows, rng):
+    artist = rng.integers(0, max(rows // 20, 1), rows)
+    return pd.DataFrame({
+        "track_id": pd.Series([f"{i:022x}" for i in rng.permutation(rows)], dtype="str"),
+        "name": _text(rng, rows, 3),
+        "artist": pd.Series(artist).map("artist {}".format).astype("str"),
+        "album": pd.Series(artist * 4 + rng.integers(0, 4, rows)).map("album {}".format).astype("str"),
+        "release_date": pd.Series(rng.integers(1990, 2026, rows)).map("{}-01-01".format).astype("str"),
+        "duration_ms": rng.integers(90_000, 420_000, rows),
+        "popularity": rng.integers(0, 100, rows),
+        "query": pd.Series(rng.choice(GENRES, rows), dtype="str"),
+    })
+
+
+def youtube_videos(rows, rng):
+    return pd.DataFrame({
+        "video_id": pd.Series([f"{i:011x}" for i in rng.permutation(rows)], dtype="str"),
+        "title": _text(rng, rows, 6),
+        "channel_id": pd.Series(rng.integers(0, max(rows // 50, 1), rows)).map("UC{:022d}".format).astype("str"),
+        "channel_title": pd.Series(rng.integers(0, max(rows // 50, 1), rows)).map("channel {}".format).astype("str"),
+        "published_at": pd.Series(rng.integers(1.2e9, 1.76e9, rows)).map(
+            lambda s: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(s))).astype("str"),
+        "duration_seconds": rng.integers(60, 900, rows).astype("float64"),
+        "views": rng.lognormal(12, 2, rows).astype("int64"),
+        "likes": rng.lognormal(8, 2, rows).astype("int64"),
+        "favorite_count": np.zeros(rows, dtype="int64"),
+        "comment_count": rng.lognormal(5, 2, rows).astype("int64"),
+        "tags": _text(rng, rows, 5).str.replace(" ", ",", regex=False),
+        "thumbnail_url": pd.Series(rng.integers(0, 10**9, rows)).map(
+            "https://i.ytimg.com/vi/{}/maxresdefault.jpg".format).astype("str"),
+    })
+
+
+DATASETS = {
+    "deezer_genres": (deezer_genres, "genre_id"),
+    "spotify_tracks": (spotify_tracks, "query"),
+    "youtube_videos": (youtube_videos, "channel_title"),
+}
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def write_defaults(storage, key, df, key_columns):
+    buffer = BytesIO()
+    df.to_parquet(buffer, index=False)
+    storage.write(key, buffer.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'dataset':15} {'profile':12} {'MiB':>8} {'write s':>8} {'read s':>8} {'proj s':>8}")
+    for name, (make, low_card_column) in DATASETS.items():
+        df = make(args.rows, np.random.default_rng(args.seed))
+        key_columns = BRONZE_DATASETS[name]
+        writers = {"defaults": lambda storage, key: write_defaults(storage, key, df, key_columns)}
+        for profile in PROFILES:
+            writers[profile] = lambda storage, key, profile=profile: save_frame(
+                storage, key, df, profile=profile, key_columns=key_columns)
+
+        for profile, write in writers.items():
+            storage = MemoryBackend()
+            key = f"{name}/{profile}.parquet"
+            write_s = best_of(args.repeat, lambda: write(storage, key))
+            size = storage.size(key)
+            read_s = best_of(args.repeat, lambda: read_parquet(storage, key))
+            proj_s = best_of(args.repeat, lambda: read_parquet(storage, key, columns=key_columns + [low_card_column]))
+            print(f"{name:15} {profile:12} {size / 2**20:8.1f} {write_s:8.3f} {read_s:8.3f} {proj_s:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Time of a full Postgres load, INSERT through DuckDB vs binary COPY.
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    python -m benchmarks.postgres_copy --dsn "host=localhost user=postgres password=postgres dbname=postgres" \\
+        --rows 1000000 10000000
+
+A synthetic table shaped like spotify_tracks (text ids and names, ints,
+a float, a boolean, a timestamp) is built in an in-memory DuckDB, then
+loaded into bench.spotify_tracks with full_load for each mode:
+
+  insert  CREATE TABLE ... WITH NO DATA + INSERT ... SELECT through the
+          DuckDB postgres extension, the old bronze load
+  copy    binary COPY FROM STDIN over psycopg, primary key added after
+
+Both modes drop and recreate the table and end with the same primary key.
+--dsn defaults to the POSTGRES_* variables the pipeline uses.
+"""
+import argparse
+import os
+import time
+
+import duckdb
+import psycopg
+
+from src.duckdb.postgres_load import COPY_BATCH_ROWS, full_load
+
+MODES = ["insert", "copy"]
+
+
+def default_dsn():
+    return (f"host={os.getenv('POSTGRES_HOST', 'localhost')} port={os.getenv('POSTGRES_PORT', '5432')} "
+            f"user={os.getenv('POSTGRES_USER', 'postgres')} password={os.getenv('POSTGRES_PASSWORD', '')} "
+            f"dbname={os.getenv('POSTGRES_DBNAME', 'postgres')}")
+
+
+def synthetic_tracks(con, rows):
+    con.execute(f"""
+        CREATE OR REPLACE TABLE spotify_tracks AS SELECT
+            printf('%022d', range) AS track_id,
+            'Track ' || range AS track_name,
+            'Artist ' || (range % 5000) AS artist_name,
+            (range % 101)::INTEGER AS popularity,
+            120000 + range % 240000 AS duration_ms,
+            (range % 997) / 997.0 AS danceability,
+            range % 7 = 0 AS explicit,
+            TIMESTAMP '2024-01-01' + INTERVAL (range % 100000) SECOND AS added_at
+        FROM range({rows})
+    """)
+
+
+def run_mode(mode, con, dsn):
+    with psycopg.connect(dsn, autocommit=True) as pg_conn:
+        start = time.perf_counter()
+        load = full_load(con, "bench", "spotify_tracks", ["track_id"], pg_conn if mode == "copy" else None)
+        return {"mode": mode, "rows": load["rows"], "seconds": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--dsn", default=default_dsn())
+    args = parser.parse_args()
+
+    with psycopg.connect(args.dsn, autocommit=True) as pg_conn:
+        pg_conn.execute("CREATE SCHEMA IF NOT EXISTS bench")
+
+    con = duckdb.connect()
+    if "insert" in args.modes:
+        con.execute("INSTALL postgres; LOAD postgres;")
+        con.execute(f"ATTACH '{args.dsn}' AS pg (TYPE postgres)")
+
+    print(f"copy batches of {COPY_BATCH_ROWS} rows")
+    print(f"{'mode':>8} {'rows':>10} {'seconds':>8} {'rows/s':>11}")
+    for rows in args.rows:
+        synthetic_tracks(con, rows)
+        for mode in args.modes:
+            result = run_mode(mode, con, args.dsn)
+            print(f"{result['mode']:>8} {result['rows']:>10} {result['seconds']:>8.2f} "
+                  f"{result['rows'] / result['seconds']:>11,.0f}")
+
+    with psycopg.connect(args.dsn, autocommit=True) as pg_conn:
+        pg_conn.execute("DROP SCHEMA bench CASCADE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Peak memory and throughput of the silver clean, in memory vs streamed.
+
+    python -m benchmarks.silver_streaming --rows 2000000 --workers 1 2 4
+
+A synthetic youtube_videos dataset (parts of --part-rows rows with ~1 KB
+descriptions) is written once to a LocalBackend under a temp directory.
+Then each mode runs clean_incremental(full_refresh=True) in a fresh
+interpreter so peak RSS is not shared:
+
+  memory        streaming=False: read every part, clean, write one frame
+  streaming:N   clean_parts_streaming with N worker processes
+
+peak_mb is the parent's RSS growth, sampled every 50 ms; worker_mb is the
+largest peak RSS of any child process (worker processes, and the helper
+subprocesses some imports start).
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.clean_text import SAMPLES
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def worker_peak_mb():
+    # largest ru_maxrss of any finished child (KiB on Linux)
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def write_source(root, rows, part_rows, seed=7):
+    from src.storage.backends import LocalBackend
+    from src.storage.datasets import append_partition
+
+    storage = LocalBackend(root)
+    rng = np.random.default_rng(seed)
+    pool = np.array([(s + " ") * 20 for s in SAMPLES], dtype=object)
+    for start in range(0, rows, part_rows):
+        n = min(part_rows, rows - start)
+        append_partition(storage, "youtube_videos", pd.DataFrame({
+            "video_id": [f"{i:011d}" for i in range(start, start + n)],
+            "title": pd.Series(pool[rng.integers(0, len(pool), n)]).str.slice(0, 80).astype("str"),
+            "description": pd.Series(pool[rng.integers(0, len(pool), n)], dtype="str"),
+            "views": rng.integers(0, 10**7, n),
+        }))
+
+
+def run_mode(mode, root, chunk_rows):
+    from src.silver.silver import clean_incremental
+    from src.storage.backends import LocalBackend
+
+    storage = LocalBackend(root)
+    samples, done = [], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            samples.append(rss_mb())
+            time.sleep(0.05)
+
+    baseline = rss_mb()
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        if mode == "memory":
+            summary = clean_incremental(storage, full_refresh=True, streaming=False)
+        else:
+            workers = int(mode.split(":")[1])
+            summary = clean_incremental(storage, full_refresh=True, workers=workers, chunk_rows=chunk_rows)
+    finally:
+        elapsed = time.perf_counter() - start
+        done.set()
+        sampler.join()
+    return {"mode": mode, "rows": summary["rows"], "seconds": elapsed, "peak_mb": max(samples) - baseline,
+            "worker_mb": worker_peak_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--part-rows", type=int, default=250_000)
+    parser.add_argument("--chunk-rows", type=int, default=65536)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.root, args.chunk_rows)))
+        return
+
+    with tempfile.TemporaryDirectory() as root:
+        write_source(root, args.rows, args.part_rows)
+        print(f"{'mode':>12} {'rows':>10} {'seconds':>8} {'rows/s':>10} {'peak_mb':>8} {'worker_mb':>9}")
+        for mode in ["memory"] + [f"streaming:{n}" for n in args.workers]:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.silver_streaming", "--mode", mode, "--root", root,
+                 "--chunk-rows", str(args.chunk_rows)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{result['mode']:>12} {result['rows']:>10} {result['seconds']:>8.2f} "
+                  f"{result['rows'] / result['seconds']:>10,.0f} {result['peak_mb']:>8.0f} {result['worker_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+{# Spotify release dates are 'YYYY' or 'YYYY-MM-DD'; anything else becomes null. #}
+{% macro parse_release_date(column) -%}
+    {{ return(adapter.dispatch('parse_release_date')(column)) }}
+{%- endmacro %}
+
+{% macro default__parse_release_date(column) -%}
+    case
+        when {{ column }} ~ '^[0-9]{4}$' then to_date({{ column }} || '-01-01', 'YYYY-MM-DD')
+        when {{ column }} ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$' then to_date({{ column }}, 'YYYY-MM-DD')
+        else null
+    end
+{%- endmacro %}
+
+{% macro duckdb__parse_release_date(column) -%}
+    case
+        when regexp_full_match({{ column }}, '[0-9]{4}') then strptime({{ column }} || '-01-01', '%Y-%m-%d')::date
+        when regexp_full_match({{ column }}, '[0-9]{4}-[0-9]{2}-[0-9]{2}') then strptime({{ column }}, '%Y-%m-%d')::date
+        else null
+    end
+{%- endmacro %}
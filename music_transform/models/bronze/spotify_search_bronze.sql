@@ -5,11 +5,7 @@ WITH source AS (
         album_id,
         trim(regexp_replace(lower(query), '[\(\)"-]', '', 'g')) as search_query,
         trim(regexp_replace(lower(artist), '[\(\)"-]', '', 'g')) as artist_name,
-        case 
-            when release_date ~ '^[0-9]{4}$' then to_date(release_date || '-01-01', 'YYYY-MM-DD')
-            when release_date ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$' then to_date(release_date, 'YYYY-MM-DD')
-            else null
-        end as release_date,
+        {{ parse_release_date('release_date') }} as release_date,
         CAST(total_tracks AS INT) AS total_tracks
     from {{ source('bronze', 'spotify_search') }}
     WHERE album_id IS NOT NULL
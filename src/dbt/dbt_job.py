@@ -1,37 +1,117 @@
-from dagster import job, op, resource
+from dagster import Field, Output, job, op, resource
 from dagster_dbt import DbtCliResource
+import os
+import psycopg
 import subprocess
+from src.duckdb.engine import DUCKDB_PATH, connect
+from src.duckdb.minio_to_duckdb import postgres_config
+from src.duckdb.postgres_load import publish_table
+from src.storage.backends import storage_resource
+from src.storage.datasets import migrate_legacy_object
+from src.storage.stage_inputs import (
+    SKIPPED, file_fingerprints, inputs_digest, inputs_unchanged, object_fingerprints, read_stage_manifest,
+    record_stage_inputs, stage_metadata,
+)
 
 # Paths
 DBT_PROJECT_DIR = "/Users/alisoncordoba/captone/music_and_marketing_audit/music_transform"
 DBT_PROFILES_DIR = "/Users/alisoncordoba/.dbt"  # Expanded tilde for clarity
+# postgres: models run in Postgres over the bronze load (profile in DBT_PROFILES_DIR).
+# duckdb: models run in DUCKDB_PATH straight off the lake (music_transform/profiles.yml)
+# and only PUBLISHED_MODELS are copied to Postgres.
+DBT_TARGET = os.getenv("DBT_TARGET", "postgres")
+DBT_TARGETS = ("postgres", "duckdb")
+STAGE = "dbt"
+# dbt reads what these stages loaded into Postgres
+UPSTREAM_STAGES = ["duckdb_to_postgres"]
+# the lake datasets the DuckDB target reads as sources
+SOURCE_DATASETS = ["deezer_charts", "deezer_genres", "spotify_search", "spotify_tracks", "youtube_search",
+                   "youtube_videos_clean"]
+# serving tables and the schema they live in, the same in DuckDB and Postgres
+PUBLISHED_MODELS = {
+    "alldata_silver": "bronze",
+    "artist_performance_gold": "bronze_gold",
+    "genre_trends_gold": "bronze_gold",
+}
 
 # Define dbt resource
 @resource
 def dbt_resource():
+    if DBT_TARGET not in DBT_TARGETS:
+        raise ValueError(f"Unknown DBT_TARGET {DBT_TARGET!r}; expected one of {DBT_TARGETS}")
+    if DBT_TARGET == "duckdb":
+        return DbtCliResource(project_dir=DBT_PROJECT_DIR, profiles_dir=DBT_PROJECT_DIR, target="duckdb")
     return DbtCliResource(
         project_dir=DBT_PROJECT_DIR,
         profiles_dir=DBT_PROFILES_DIR,
     )
 
+
+def dbt_inputs(storage):
+    # the upstream loads (or lake datasets) plus the project's models, macros and config
+    if DBT_TARGET == "duckdb":
+        # the sources glob the partitioned layout, so move any old single objects into it first
+        for dataset in SOURCE_DATASETS:
+            migrate_legacy_object(storage, dataset)
+        objects = object_fingerprints(storage, [f"{d}/" for d in SOURCE_DATASETS])
+        inputs = {f"object:{key}": etag for key, etag in objects.items()}
+    else:
+        inputs = {f"stage:{stage}": read_stage_manifest(storage, stage).get("digest") for stage in UPSTREAM_STAGES}
+    inputs.update({f"project:{path}": digest for path, digest in file_fingerprints(DBT_PROJECT_DIR).items()})
+    return inputs
+
+
 # Define ops for running and testing
-@op(required_resource_keys={"dbt"})
+@op(
+    required_resource_keys={"dbt", "storage"},
+    config_schema={"force": Field(bool, default_value=False, description="Run even if no input changed")},
+)
 def dbt_run(context):
+    storage = context.resources.storage
+    inputs = dbt_inputs(storage)
+    if not context.op_config["force"] and inputs_unchanged(storage, STAGE, inputs_digest(inputs)):
+        context.log.info("Postgres loads and dbt project are unchanged; skipping dbt run")
+        yield Output("skipped", metadata=stage_metadata(inputs, skipped=True))
+        return
+    published = {}
+    if DBT_TARGET == "duckdb":
+        # the profile reads these; paths are relative to the project dir there
+        os.environ["DUCKDB_PATH"] = os.path.abspath(DUCKDB_PATH)
+        os.environ.setdefault("DBT_LAKE_URI", storage.uri("").rstrip("/"))
     # Run dbt run command
-    result = context.resources.dbt.cli(["run"])
+    result = context.resources.dbt.cli(["run"]).wait()
+    if DBT_TARGET == "duckdb":
+        published = publish_models()
+    record_stage_inputs(storage, STAGE, inputs)
     # Don't return the full process object; just log completion
     context.log.info("dbt run completed successfully")
-    return "success"  # Return simple, serializable value
+    yield Output("success", metadata={"target": DBT_TARGET, "published": published,
+                                      **stage_metadata(inputs, skipped=False)})
+
+
+def publish_models():
+    """Copy the serving models from DuckDB to Postgres; returns {table: rows}."""
+    con = connect(DUCKDB_PATH, read_only=True)
+    try:
+        with psycopg.connect(**postgres_config()) as pg_conn:
+            return {f"{schema}.{table}": publish_table(con, pg_conn, schema, table)
+                    for table, schema in PUBLISHED_MODELS.items()}
+    finally:
+        con.close()
+
 
 @op(required_resource_keys={"dbt"})
 def dbt_test(context, run_status):
+    if run_status == "skipped":
+        context.log.info(f"Skipping tests, dbt run was {SKIPPED}")
+        return
     if run_status != "success":
         context.log.error("Skipping tests because dbt run failed")
         return
-    context.resources.dbt.cli(["test"])
+    context.resources.dbt.cli(["test"]).wait()
     context.log.info("dbt test completed successfully")
 
 # Define the job
-@job(resource_defs={"dbt": dbt_resource})
+@job(resource_defs={"dbt": dbt_resource, "storage": storage_resource})
 def dbt_job():
     dbt_test(dbt_run())
@@ -0,0 +1,55 @@
+import logging
+import os
+
+import duckdb
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", "music_data.duckdb")
+# Resource limits for every DuckDB connection the pipeline opens; empty or 0 keeps DuckDB's default
+# (80% of RAM, one thread per core, spilling next to the database file)
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "")
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0"))
+DUCKDB_TEMP_DIRECTORY = os.getenv("DUCKDB_TEMP_DIRECTORY", "")
+# Where extensions are installed; point workers at a pre-populated directory to skip downloads
+DUCKDB_EXTENSION_DIRECTORY = os.getenv("DUCKDB_EXTENSION_DIRECTORY", "")
+
+
+def engine_config(memory_limit=None, threads=None, temp_directory=None):
+    config = {
+        "memory_limit": memory_limit if memory_limit is not None else DUCKDB_MEMORY_LIMIT,
+        "threads": threads if threads is not None else DUCKDB_THREADS,
+        "temp_directory": temp_directory if temp_directory is not None else DUCKDB_TEMP_DIRECTORY,
+        "extension_directory": DUCKDB_EXTENSION_DIRECTORY,
+    }
+    return {name: value for name, value in config.items() if value}
+
+
+def ensure_extensions(con, extensions):
+    """Load extensions, installing only the ones that are missing; returns those installed."""
+    installed = {name for name, in con.execute(
+        "SELECT extension_name FROM duckdb_extensions() WHERE installed"
+    ).fetchall()}
+    missing = [name for name in extensions if name not in installed]
+    for name in missing:
+        con.execute(f"INSTALL {name}")
+        logger.info(f"Installed DuckDB extension {name}")
+    for name in extensions:
+        con.execute(f"LOAD {name}")
+    return missing
+
+
+def connect(database=DUCKDB_PATH, extensions=(), read_only=False, **limits):
+    """Open a DuckDB connection with the pipeline's resource limits and extensions loaded.
+
+    limits override DUCKDB_MEMORY_LIMIT, DUCKDB_THREADS and
+    DUCKDB_TEMP_DIRECTORY (memory_limit, threads, temp_directory).
+    """
+    config = engine_config(**limits)
+    con = duckdb.connect(database=database, read_only=read_only, config=config)
+    ensure_extensions(con, extensions)
+    logger.info(f"Opened DuckDB {database} with {config or 'default settings'}")
+    return con
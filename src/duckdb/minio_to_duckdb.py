@@ -1,8 +1,19 @@
-from dagster import op, OpExecutionContext
-import duckdb
+from dagster import Field, Output, op, OpExecutionContext
+import psycopg
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from src.duckdb.engine import DUCKDB_PATH, connect
+from src.duckdb.postgres_load import LOAD_MODES, LOADERS, full_load, incremental_load, rollback_table
+from src.ingestion.youtubeapi import SEARCH_GENRES
+from src.storage.datasets import DATASET_KEYS, PARTITION_COLUMN, dataset_glob, migrate_legacy_object, partition_column
+from src.storage.stage_inputs import (
+    SKIPPED, inputs_digest, inputs_unchanged, object_fingerprints, record_stage_inputs, stage_metadata,
+)
 
 # Load environment variables
 load_dotenv()
@@ -15,18 +26,27 @@ formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
-@op
-def load_and_update_duckdb_to_postgres(context: OpExecutionContext):
-    # Define files with full S3 paths including bronze-layer folder
-    files = [
-        "deezer_charts.parquet",
-        "deezer_genres.parquet",
-        "spotify_search.parquet",
-        "spotify_tracks.parquet",
-        "youtube_search.parquet",
-        "youtube_videos_clean.parquet"
-    ]
+# Tables keyed more coarsely than their dataset; youtube_search has always
+# been loaded as one row per video
+TABLE_KEYS = {
+    "youtube_search": ["video_id"],
+}
+# How such a table picks among a key's rows, ahead of the newest part: the
+# genre searched first, as the per-genre search tables have always been merged
+TABLE_ORDER = {
+    "youtube_search": "list_position([{}], genre) NULLS LAST".format(
+        ", ".join("'" + genre.replace("'", "''") + "'" for genre in SEARCH_GENRES)),
+}
+
+STAGE = "duckdb_to_postgres"
+# table: copy each source into the DuckDB file; view: query the Parquet in place
+SOURCE_MODES = ("table", "view")
+SCHEMA = "bronze"  # Change to "bronze-layer" if applicable
+# Postgres connections the load may hold at once, across all workers
+POSTGRES_MAX_CONNECTIONS = int(os.getenv("POSTGRES_MAX_CONNECTIONS", "4"))
+
 
+def postgres_config():
     # PostgreSQL configuration from environment variables
     pg_config = {
         "host": os.getenv("POSTGRES_HOST"),
@@ -36,47 +56,171 @@ def load_and_update_duckdb_to_postgres(context: OpExecutionContext):
         "dbname": os.getenv("POSTGRES_DBNAME")
     }
 
-
     # Validate PostgreSQL config
     if not all(pg_config.values()):
         logger.error("Missing PostgreSQL configuration in environment variables")
         raise ValueError("Incomplete PostgreSQL configuration")
+    return pg_config
+
+
+def configure_s3(con):
+    # Configure DuckDB for MinIO
+    con.execute(f"""
+        SET s3_endpoint='{os.getenv("MINIO_ENDPOINT")}';
+        SET s3_access_key_id='{os.getenv("MINIO_ACCESS_KEY")}';
+        SET s3_secret_access_key='{os.getenv("MINIO_SECRET_KEY")}';
+        SET s3_use_ssl=false;
+        SET s3_url_style='path';
+        SET s3_region='';
+    """)
+
+
+def read_table(con, storage, table_name, source_mode="table"):
+    """(Re)create the DuckDB table, or a view, over its Parquet files.
 
-    duckdb_path = "music_data.duckdb"
-    con = duckdb.connect(database=duckdb_path)
+    Returns the row count for tables; views are not scanned here.
+    """
+    if table_name in DATASET_KEYS:
+        # Partitioned dataset: keep the newest row per key across parts
+        migrate_legacy_object(storage, table_name)
+        s3_path = dataset_glob(storage, table_name)
+        keys = ", ".join(TABLE_KEYS.get(table_name, DATASET_KEYS[table_name]))
+        order = ", ".join(filter(None, [TABLE_ORDER.get(table_name), "filename DESC"]))
+        # ingest_date only exists in the path; other partition columns are also stored in the files
+        excluded = "ingest_date, filename" if partition_column(table_name) == PARTITION_COLUMN else "filename"
+        source_sql = f"""
+            SELECT * EXCLUDE ({excluded})
+            FROM read_parquet('{s3_path}', hive_partitioning = true, union_by_name = true, filename = true)
+            QUALIFY row_number() OVER (PARTITION BY {keys} ORDER BY {order}) = 1
+        """
+    else:
+        s3_path = storage.uri(table_name)
+        source_sql = f"SELECT * FROM read_parquet('{s3_path}')"
 
     try:
-        # Configure DuckDB for MinIO
-        con.execute("INSTALL httpfs; LOAD httpfs; INSTALL parquet; LOAD parquet;")
-        con.execute(f"""
-            SET s3_endpoint='{os.getenv("MINIO_ENDPOINT")}';
-            SET s3_access_key_id='{os.getenv("MINIO_ACCESS_KEY")}';
-            SET s3_secret_access_key='{os.getenv("MINIO_SECRET_KEY")}';
-            SET s3_use_ssl=false;
-            SET s3_url_style='path';
-            SET s3_region='';  
-        """)
-        logger.info("Configured MinIO access in DuckDB")
+        # a table and a view cannot replace each other, so drop one left by the other mode
+        existing = con.execute(
+            "SELECT table_type FROM information_schema.tables "
+            "WHERE table_catalog = current_database() AND table_schema = 'main' AND table_name = ?",
+            [table_name],
+        ).fetchone()
+        if existing and (existing[0] == "VIEW") != (source_mode == "view"):
+            con.execute(f"DROP {'VIEW' if existing[0] == 'VIEW' else 'TABLE'} {table_name}")
+        if source_mode == "view":
+            con.execute(f"CREATE OR REPLACE VIEW {table_name} AS {source_sql}")
+            logger.info(f"Registered DuckDB view {table_name} over {s3_path}")
+            return None
+        con.execute(f"CREATE OR REPLACE TABLE {table_name} AS {source_sql}")
+        count = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        logger.info(f"Loaded {count} rows from {s3_path} into DuckDB table {table_name}")
+        # Log column names
+        columns = [col[0] for col in con.execute(f"DESCRIBE {table_name}").fetchall()]
+        logger.info(f"DuckDB table {table_name} has columns: {columns}")
+        return count
+    except Exception as e:
+        logger.error(f"Failed to load {s3_path}: {str(e)}")
+        raise
+
 
-        # Load parquet files into DuckDB tables
-        bucket_name = os.getenv("BUCKET_NAME")  # Replace with your bucket
-        for filename in files:
-            table_name = filename.replace(".parquet", "")
-            s3_path = f"s3://{bucket_name}/{filename}"
+def load_table(con, storage, table, load_mode, pg_config, pg_slots, source_mode="table"):
+    """Read one table from storage into DuckDB, then update it in Postgres.
 
+    Runs on its own DuckDB cursor, so several tables can load at once.
+    Holding one of pg_slots covers every Postgres connection the table
+    uses. Returns the load counts with the time spent in each phase; with
+    views the Parquet reads happen during the Postgres phase.
+    """
+    cur = con.cursor()
+    try:
+        if storage.name == "minio":
+            configure_s3(cur)
+        start = time.perf_counter()
+        read_table(cur, storage, table, source_mode)
+        read_done = time.perf_counter()
+
+        keys = TABLE_KEYS.get(table, DATASET_KEYS[table])
+        # COPY needs its own psycopg connection; it is opened only for a full load, so a slot
+        # never holds it and an attached-database connection for a merge at the same time
+        pg_connect = (lambda: psycopg.connect(**pg_config)) if pg_config else None
+        with pg_slots:
+            slot_acquired = time.perf_counter()
             try:
-                con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM read_parquet('{s3_path}')")
-                count = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-                logger.info(f"Loaded {count} rows from {s3_path} into DuckDB table {table_name}")
-                # Log column names
-                columns = [col[0] for col in con.execute(f"DESCRIBE {table_name}").fetchall()]
-                logger.info(f"DuckDB table {table_name} has columns: {columns}")
+                if load_mode == "full":
+                    with pg_connect() if pg_connect else nullcontext() as pg_conn:
+                        # snapshotting a view would read its Parquet a second time; full mode does not need it
+                        load = full_load(cur, SCHEMA, table, keys, pg_conn, snapshot=source_mode == "table")
+                else:
+                    load = incremental_load(cur, SCHEMA, table, keys, pg_connect)
             except Exception as e:
-                logger.error(f"Failed to load {s3_path}: {str(e)}")
-                raise
+                logger.error(f"Failed to update pg.{SCHEMA}.{table}: {str(e)}")
+                raise e  # Propagate the specific exception
+        done = time.perf_counter()
+    finally:
+        cur.close()
+
+    timings = {
+        "read_seconds": round(read_done - start, 3),
+        "pg_wait_seconds": round(slot_acquired - read_done, 3),
+        "write_seconds": round(done - slot_acquired, 3),
+    }
+    logger.info(f"{table}: {timings}")
+    return {**load, **timings}
+
+
+@op(
+    required_resource_keys={"storage"},
+    config_schema={
+        "force": Field(bool, default_value=False, description="Reload even if no input changed"),
+        # full until incremental merges have been checked against the production tables
+        "load_mode": Field(str, default_value="full",
+                           description="incremental: merge only changed rows by primary key; full: drop and reload"),
+        "loader": Field(str, default_value="copy",
+                        description="copy: full loads stream binary COPY over psycopg; insert: INSERT ... SELECT via DuckDB"),
+        "source_mode": Field(str, default_value="table",
+                             description="table: copy the Parquet into music_data.duckdb; view: read it in place"),
+        "workers": Field(int, default_value=1,
+                         description="Tables loaded at once; Postgres connections are capped by POSTGRES_MAX_CONNECTIONS"),
+    },
+)
+def load_and_update_duckdb_to_postgres(context: OpExecutionContext):
+    storage = context.resources.storage
+    # Define files with full S3 paths including bronze-layer folder
+    files = [
+        "deezer_charts",
+        "deezer_genres",
+        "spotify_search",
+        "spotify_tracks",
+        "youtube_search",
+        "youtube_videos_clean"
+    ]
+
+    load_mode = context.op_config["load_mode"]
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load_mode {load_mode!r}; expected one of {LOAD_MODES}")
+    loader = context.op_config["loader"]
+    if loader not in LOADERS:
+        raise ValueError(f"Unknown loader {loader!r}; expected one of {LOADERS}")
+    source_mode = context.op_config["source_mode"]
+    if source_mode not in SOURCE_MODES:
+        raise ValueError(f"Unknown source_mode {source_mode!r}; expected one of {SOURCE_MODES}")
+    workers = max(1, min(context.op_config["workers"], len(files)))
+
+    inputs = object_fingerprints(storage, [f"{f}/" if f in DATASET_KEYS else f for f in files])
+    if not context.op_config["force"] and inputs_unchanged(storage, STAGE, inputs_digest(inputs)):
+        logger.info(f"None of the {len(inputs)} input objects changed since the last load; skipping")
+        yield Output(SKIPPED, metadata=stage_metadata(inputs, skipped=True))
+        return
+
+    pg_config = postgres_config()
+    con = connect(DUCKDB_PATH, extensions=["parquet", "postgres"] + (["httpfs"] if storage.name == "minio" else []))
+    pg_slots = threading.BoundedSemaphore(POSTGRES_MAX_CONNECTIONS)
+
+    try:
+        if storage.name == "minio":
+            configure_s3(con)
+            logger.info("Configured MinIO access in DuckDB")
 
         # Attach PostgreSQL
-        con.execute("INSTALL postgres; LOAD postgres;")
         con.execute(f"""
             ATTACH 'dbname={pg_config['dbname']} host={pg_config['host']}
             port={pg_config['port']} user={pg_config['user']}
@@ -84,33 +228,53 @@ def load_and_update_duckdb_to_postgres(context: OpExecutionContext):
         """)
         logger.info("Attached PostgreSQL database")
 
-        # Update PostgreSQL tables
-        schema = "bronze"  # Change to "bronze-layer" if applicable
-        for table in [f.replace(".parquet", "") for f in files]:
-            try:
-                # Get DuckDB table columns
-                columns = [col[0] for col in con.execute(f"DESCRIBE {table}").fetchall()]
-                columns_str = ", ".join(columns)
-                logger.info(f"PostgreSQL table {schema}.{table} will be created with columns: {columns}")
-
-                # Drop and recreate PostgreSQL table to match parquet schema
-                con.execute(f"DROP TABLE IF EXISTS pg.{schema}.{table}")
-                con.execute(f"CREATE TABLE pg.{schema}.{table} AS SELECT * FROM {table} WITH NO DATA")
-                logger.info(f"Created PostgreSQL table {schema}.{table}")
-
-                # Insert data
-                con.execute(f"""
-                    INSERT INTO pg.{schema}.{table} ({columns_str})
-                    SELECT {columns_str} FROM {table}
-                """)
-                count = con.execute(f"SELECT COUNT(*) FROM pg.{schema}.{table}").fetchone()[0]
-                logger.info(f"Updated pg.{schema}.{table}, now has {count} rows")
-            except Exception as e:
-                logger.error(f"Failed to update pg.{schema}.{table}: {str(e)}")
-                raise e  # Propagate the specific exception
+        # Read each table and update it in PostgreSQL
+        tables = [f.replace(".parquet", "") for f in files]
+        copy_config = pg_config if loader == "copy" else None
+        start = time.perf_counter()
+        if workers == 1:
+            loads = {table: load_table(con, storage, table, load_mode, copy_config, pg_slots, source_mode)
+                     for table in tables}
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                loads = dict(zip(tables, pool.map(
+                    lambda table: load_table(con, storage, table, load_mode, copy_config, pg_slots, source_mode), tables)))
+        elapsed = time.perf_counter() - start
     except Exception as e:
         logger.error(f"Error in DuckDB to Postgres operation: {str(e)}")
         raise
     finally:
         con.close()
-        logger.info("DuckDB connection closed")
\ No newline at end of file
+        logger.info("DuckDB connection closed")
+
+    record_stage_inputs(storage, STAGE, inputs)
+    yield Output("loaded", metadata={
+        "tables": len(files),
+        "loads": loads,
+        "load_mode": load_mode,
+        "loader": loader,
+        "source_mode": source_mode,
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "read_seconds": round(sum(load["read_seconds"] for load in loads.values()), 3),
+        "write_seconds": round(sum(load["write_seconds"] for load in loads.values()), 3),
+        "rows_inserted": sum(load.get("inserted", 0) for load in loads.values()),
+        "rows_updated": sum(load.get("updated", 0) for load in loads.values()),
+        "rows_deleted": sum(load.get("deleted", 0) for load in loads.values()),
+        "full_reloads": sum(load["mode"] == "full" for load in loads.values()),
+        **stage_metadata(inputs, skipped=False),
+    })
+
+
+@op(config_schema={"tables": Field([str], description="bronze tables to put back as they were before their last full load")})
+def rollback_postgres_tables(context: OpExecutionContext):
+    tables = context.op_config["tables"]
+    con = connect(DUCKDB_PATH)
+    try:
+        with psycopg.connect(**postgres_config()) as pg_conn:
+            for table in tables:
+                rollback_table(con, pg_conn, SCHEMA, table)
+    finally:
+        con.close()
+    logger.info(f"Rolled back {tables}; the next load with new inputs reloads them in full")
+    return tables
@@ -0,0 +1,371 @@
+import json
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from psycopg.errors import LockNotAvailable
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Keys and row hashes of what was last loaded into Postgres, one table per loaded table
+SNAPSHOT_PREFIX = "_loaded_"
+LOAD_MODES = ("incremental", "full")
+# copy: binary COPY over psycopg; insert: INSERT ... SELECT through the DuckDB postgres extension
+LOADERS = ("copy", "insert")
+COPY_BATCH_ROWS = int(os.getenv("POSTGRES_COPY_BATCH_ROWS", "100000"))
+# Full loads are built under <table>__staging and swapped in; the replaced table is kept for rollback
+STAGING_SUFFIX = "__staging"
+PREVIOUS_SUFFIX = "__previous"
+# The swap's renames need an ACCESS EXCLUSIVE lock on the live table. Rather
+# than queue behind a long reader (and make every later reader queue behind
+# it), a swap gives up after this long and is retried with backoff.
+SWAP_LOCK_TIMEOUT = os.getenv("POSTGRES_SWAP_LOCK_TIMEOUT", "2s")
+SWAP_RETRIES = int(os.getenv("POSTGRES_SWAP_RETRIES", "5"))
+SWAP_BACKOFF = float(os.getenv("POSTGRES_SWAP_BACKOFF", "1"))
+
+# DuckDB column types COPY can send as-is; anything else is cast to text
+POSTGRES_TYPES = {
+    "BOOLEAN": "boolean",
+    "TINYINT": "smallint",
+    "SMALLINT": "smallint",
+    "INTEGER": "integer",
+    "BIGINT": "bigint",
+    "UTINYINT": "smallint",
+    "USMALLINT": "integer",
+    "UINTEGER": "bigint",
+    "UBIGINT": "numeric",
+    "HUGEINT": "numeric",
+    "FLOAT": "real",
+    "DOUBLE": "double precision",
+    "VARCHAR": "text",
+    "BLOB": "bytea",
+    "UUID": "uuid",
+    "DATE": "date",
+    "TIME": "time",
+    "TIMESTAMP": "timestamp",
+    "TIMESTAMP_S": "timestamp",
+    "TIMESTAMP_MS": "timestamp",
+    "TIMESTAMP_NS": "timestamp",
+    "TIMESTAMP WITH TIME ZONE": "timestamptz",
+    "INTERVAL": "interval",
+}
+
+
+def quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def table_columns(con, table):
+    return con.execute(f"DESCRIBE {table}").fetchall()
+
+
+def postgres_table_exists(con, schema, table):
+    return con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE database_name = 'pg' AND schema_name = ? AND table_name = ?",
+        [schema, table],
+    ).fetchone()[0] > 0
+
+
+def postgres_execute(con, sql):
+    """Run SQL inside Postgres itself, as one round trip, and drop DuckDB's cached catalog."""
+    con.execute(f"CALL postgres_execute('pg', '{sql.replace(chr(39), chr(39) * 2)}')")
+    con.execute("CALL pg_clear_cache()")
+
+
+def primary_key_sql(schema, table, keys):
+    # named after the table so rename_sql can carry the index along
+    return f"ALTER TABLE {schema}.{table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({', '.join(quote(k) for k in keys)})"
+
+
+def rename_sql(schema, old, new):
+    return f"""
+        ALTER TABLE IF EXISTS {schema}.{old} RENAME TO {new};
+        ALTER INDEX IF EXISTS {schema}.{old}_pkey RENAME TO {new}_pkey;
+    """
+
+
+def swap_sql(schema, table):
+    """Put <table>__staging in place of table, keeping the replaced table as <table>__previous.
+
+    Must run as one transaction; it fails with lock_not_available instead of
+    waiting longer than SWAP_LOCK_TIMEOUT for the tables' locks.
+    """
+    previous = f"{table}{PREVIOUS_SUFFIX}"
+    return f"""
+        SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}';
+        DROP TABLE IF EXISTS {schema}.{previous};
+        {rename_sql(schema, table, previous)}
+        {rename_sql(schema, f"{table}{STAGING_SUFFIX}", table)}
+    """
+
+
+def is_lock_timeout(error):
+    # through the DuckDB attachment, Postgres errors arrive as DuckDB exceptions carrying the message
+    return isinstance(error, LockNotAvailable) or "due to lock timeout" in str(error)
+
+
+def retry_swap(swap, schema, table, retries=SWAP_RETRIES, backoff=SWAP_BACKOFF):
+    """Run swap() until it gets its locks, backing off exponentially; re-raises after retries."""
+    for attempt in range(retries + 1):
+        try:
+            return swap()
+        except Exception as e:
+            if not is_lock_timeout(e) or attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning(f"Swapping in {schema}.{table} timed out waiting for readers; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def rollback_sql(schema, table):
+    """Swap table and <table>__previous."""
+    previous, rolled_back = f"{table}{PREVIOUS_SUFFIX}", f"{table}__rollback"
+    return f"""
+        {rename_sql(schema, table, rolled_back)}
+        {rename_sql(schema, previous, table)}
+        {rename_sql(schema, rolled_back, previous)}
+    """
+
+
+def rollback_table(con, pg_conn, schema, table):
+    """Bring back the table as it was before the last full load.
+
+    The load being undone stays around as <table>__previous, so rolling back
+    twice restores it. The DuckDB snapshot no longer matches Postgres, so it
+    is dropped and the next incremental load becomes a full load.
+    """
+    with pg_conn.transaction():
+        previous = f"{schema}.{table}{PREVIOUS_SUFFIX}"
+        if pg_conn.execute("SELECT to_regclass(%s)", [previous]).fetchone()[0] is None:
+            raise ValueError(f"No {previous} to roll back to")
+        pg_conn.execute(rollback_sql(schema, table))
+    drop_snapshot(con, table)
+    logger.info(f"Rolled {schema}.{table} back to its previous load")
+
+
+def table_signature(con, table):
+    return json.dumps([[name, duckdb_type] for name, duckdb_type, *_ in table_columns(con, table)])
+
+
+def snapshot_signature(con, table):
+    """Column signature the table's snapshot was taken with, or None if there is no snapshot."""
+    row = con.execute(
+        "SELECT comment FROM duckdb_tables() WHERE database_name = current_database() AND table_name = ?",
+        [f"{SNAPSHOT_PREFIX}{table}"],
+    ).fetchone()
+    return row[0] if row else None
+
+
+def save_snapshot(con, table, keys):
+    """Record the keys and a hash of every row of the loaded table.
+
+    Eight bytes per row beyond the keys, instead of a second copy of the
+    data. The column names and types go in the snapshot's table comment, so
+    a schema change forces a full load.
+    """
+    snapshot = f"{SNAPSHOT_PREFIX}{table}"
+    key_list = ", ".join(quote(k) for k in keys)
+    signature = table_signature(con, table).replace("'", "''")
+    con.execute(f"CREATE OR REPLACE TABLE {snapshot} AS SELECT {key_list}, hash(*COLUMNS(*)) AS _row_hash FROM {table}")
+    con.execute(f"COMMENT ON TABLE {snapshot} IS '{signature}'")
+
+
+def drop_snapshot(con, table):
+    # without a snapshot the next incremental load falls back to a full load
+    con.execute(f"DROP TABLE IF EXISTS {SNAPSHOT_PREFIX}{table}")
+
+
+def postgres_type(duckdb_type):
+    """Postgres type for a DuckDB column type, or None when it has to go over as text."""
+    if duckdb_type.startswith("DECIMAL"):
+        return "numeric"
+    if duckdb_type.endswith("[]"):
+        element = postgres_type(duckdb_type[:-2])
+        return f"{element}[]" if element and not element.endswith("[]") else None
+    return POSTGRES_TYPES.get(duckdb_type)
+
+
+def copy_table(con, pg_conn, source, schema, table, keys=(), batch_rows=COPY_BATCH_ROWS):
+    """Rebuild schema.table from the DuckDB relation source, as binary COPY.
+
+    The rows go into <table>__staging, which gets its primary key (if any
+    keys) and statistics in one transaction. A second, short one swaps it
+    in, retried while readers hold the table. Readers keep seeing the old
+    table until the swap commits. Returns the row count of the COPY itself.
+    """
+    staging = f"{table}{STAGING_SUFFIX}"
+    select, column_defs, types = [], [], []
+    for name, duckdb_type, *_ in table_columns(con, source):
+        pg_type = postgres_type(duckdb_type)
+        select.append(quote(name) if pg_type else f"CAST({quote(name)} AS VARCHAR)")
+        column_defs.append(f"{quote(name)} {pg_type or 'text'}")
+        types.append(pg_type or "text")
+
+    with pg_conn.transaction():
+        cur = pg_conn.cursor()
+        cur.execute(f"DROP TABLE IF EXISTS {schema}.{staging}")
+        cur.execute(f"CREATE TABLE {schema}.{staging} ({', '.join(column_defs)})")
+        result = con.execute(f"SELECT {', '.join(select)} FROM {source}")
+        with cur.copy(f"COPY {schema}.{staging} FROM STDIN (FORMAT BINARY)") as copy:
+            copy.set_types(types)
+            while rows := result.fetchmany(batch_rows):
+                for row in rows:
+                    copy.write_row(row)
+        count = cur.rowcount
+        if keys:
+            cur.execute(primary_key_sql(schema, staging, keys))
+        cur.execute(f"ANALYZE {schema}.{staging}")
+
+    def swap():
+        with pg_conn.transaction():
+            pg_conn.execute(swap_sql(schema, table))
+
+    # staging is committed first, so a swap retry does not redo the COPY
+    retry_swap(swap, schema, table)
+    return count
+
+
+def copy_load(con, pg_conn, schema, table, keys, batch_rows=COPY_BATCH_ROWS, snapshot=True):
+    """Full load of the DuckDB table through copy_table, snapshotting what was loaded unless told not to."""
+    count = copy_table(con, pg_conn, table, schema, table, keys, batch_rows)
+    if snapshot:
+        save_snapshot(con, table, keys)
+    else:
+        drop_snapshot(con, table)
+    logger.info(f"Copied {count} rows into {schema}.{table}")
+    return {"mode": "full", "rows": count}
+
+
+def publish_table(con, pg_conn, schema, table):
+    """Copy DuckDB schema.table to the same name in Postgres, for serving."""
+    pg_conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    pg_conn.commit()
+    count = copy_table(con, pg_conn, f"{schema}.{table}", schema, table)
+    logger.info(f"Published {count} rows to {schema}.{table}")
+    return count
+
+
+def full_load(con, schema, table, keys, pg_conn=None, snapshot=True):
+    """Replace pg.schema.table with the DuckDB table, with keys as its primary key.
+
+    The new table is built and analyzed under <table>__staging, then renamed
+    into place in one transaction.
+
+    With a psycopg connection the rows go over as binary COPY, otherwise as
+    INSERT ... SELECT through the attached database. snapshot=False skips
+    the DuckDB copy incremental loads diff against (and drops a stale one).
+    """
+    if pg_conn is not None:
+        load = copy_load(con, pg_conn, schema, table, keys, snapshot=snapshot)
+        # the attached catalog has not seen the new table yet
+        if con.execute("SELECT count(*) FROM duckdb_databases() WHERE database_name = 'pg'").fetchone()[0]:
+            con.execute("CALL pg_clear_cache()")
+        return load
+
+    staging = f"{table}{STAGING_SUFFIX}"
+    columns = [col[0] for col in table_columns(con, table)]
+    columns_str = ", ".join(quote(c) for c in columns)
+    logger.info(f"PostgreSQL table {schema}.{table} will be created with columns: {columns}")
+
+    con.execute(f"DROP TABLE IF EXISTS pg.{schema}.{staging}")
+    con.execute(f"CREATE TABLE pg.{schema}.{staging} AS SELECT * FROM {table} WITH NO DATA")
+    con.execute(f"INSERT INTO pg.{schema}.{staging} ({columns_str}) SELECT {columns_str} FROM {table}")
+    # ON CONFLICT in later incremental loads needs the key constraint
+    postgres_execute(con, f"""
+        {primary_key_sql(schema, staging, keys)};
+        ANALYZE {schema}.{staging};
+    """)
+    # one query string is one implicit transaction, rolled back whole on a lock timeout
+    retry_swap(lambda: postgres_execute(con, swap_sql(schema, table)), schema, table)
+    count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    if snapshot:
+        save_snapshot(con, table, keys)
+    else:
+        drop_snapshot(con, table)
+    logger.info(f"Reloaded pg.{schema}.{table} with {count} rows")
+    return {"mode": "full", "rows": count}
+
+
+def diff_snapshot(con, table, keys):
+    """Rows changed since the last load, as temp tables _changed_<table> and _deleted_<table>.
+
+    _changed holds the whole new and updated rows, found by comparing row
+    hashes with the snapshot's (nulls hash alike); _deleted holds the keys
+    that disappeared. A 64-bit hash collision between a row's old and new
+    values would hide that update. Returns the counts, or None when there
+    is no snapshot or the table's columns changed since it was taken; those
+    tables need a full load.
+    """
+    snapshot = f"{SNAPSHOT_PREFIX}{table}"
+    if snapshot_signature(con, table) != table_signature(con, table):
+        return None
+    key_list = ", ".join(quote(k) for k in keys)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _changed_{table} AS
+        SELECT * EXCLUDE (_row_hash)
+        FROM (SELECT *, hash(*COLUMNS(*)) AS _row_hash FROM {table})
+        ANTI JOIN {snapshot} USING ({key_list}, _row_hash)
+    """)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _deleted_{table} AS
+        SELECT {key_list} FROM {snapshot} EXCEPT SELECT {key_list} FROM {table}
+    """)
+    changed = con.execute(f"SELECT count(*) FROM _changed_{table}").fetchone()[0]
+    inserted = con.execute(
+        f"SELECT count(*) FROM _changed_{table} c ANTI JOIN {snapshot} s USING ({key_list})"
+    ).fetchone()[0]
+    deleted = con.execute(f"SELECT count(*) FROM _deleted_{table}").fetchone()[0]
+    return {"inserted": inserted, "updated": changed - inserted, "deleted": deleted}
+
+
+def merge_sql(schema, table, columns, keys):
+    """Upsert the staged rows and delete the staged keys, in one Postgres transaction."""
+    key_list = ", ".join(quote(k) for k in keys)
+    column_list = ", ".join(quote(c) for c in columns)
+    updates = ", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in columns if c not in keys)
+    on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    key_match = " AND ".join(f"t.{quote(k)} = d.{quote(k)}" for k in keys)
+    return f"""
+        BEGIN;
+        INSERT INTO {schema}.{table} ({column_list})
+        SELECT {column_list} FROM {schema}._stage_{table}
+        ON CONFLICT ({key_list}) {on_conflict};
+        DELETE FROM {schema}.{table} t USING {schema}._stage_{table}_deleted d WHERE {key_match};
+        DROP TABLE {schema}._stage_{table};
+        DROP TABLE {schema}._stage_{table}_deleted;
+        COMMIT;
+    """
+
+
+def incremental_load(con, schema, table, keys, pg_connect=None):
+    """Apply only the inserts, updates and deletes since the last load.
+
+    Changed rows and deleted keys are copied to staging tables in Postgres,
+    then merged with INSERT ... ON CONFLICT and DELETE ... USING. Falls
+    back to full_load when there is nothing to diff against; pg_connect,
+    if given, opens the psycopg connection that load COPYs over. Merges
+    only use the attached database, so no other connection is opened.
+    """
+    counts = diff_snapshot(con, table, keys) if postgres_table_exists(con, schema, table) else None
+    if counts is None:
+        logger.info(f"No usable snapshot of pg.{schema}.{table}; doing a full load")
+        if pg_connect is None:
+            return full_load(con, schema, table, keys)
+        with pg_connect() as pg_conn:
+            return full_load(con, schema, table, keys, pg_conn)
+    if not any(counts.values()):
+        logger.info(f"pg.{schema}.{table} is up to date")
+        return {"mode": "incremental", **counts}
+
+    for stage, source in [(f"_stage_{table}", f"_changed_{table}"), (f"_stage_{table}_deleted", f"_deleted_{table}")]:
+        con.execute(f"DROP TABLE IF EXISTS pg.{schema}.{stage}")
+        con.execute(f"CREATE TABLE pg.{schema}.{stage} AS SELECT * FROM {source}")
+    columns = [col[0] for col in table_columns(con, table)]
+    postgres_execute(con, merge_sql(schema, table, columns, keys))
+    # Only once Postgres committed; a failed merge is retried from the old snapshot
+    save_snapshot(con, table, keys)
+    logger.info(f"Merged into pg.{schema}.{table}: {counts}")
+    return {"mode": "incremental", **counts}
@@ -0,0 +1,110 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEEZER_TRACK_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("title", pa.string()),
+    ("artist", pa.string()),
+    ("album", pa.string()),
+    ("link", pa.string()),
+    ("duration", pa.int64()),
+])
+DEEZER_GENRE_TRACK_SCHEMA = DEEZER_TRACK_SCHEMA.append(pa.field("genre_id", pa.int64()))
+
+SPOTIFY_SEARCH_SCHEMA = pa.schema([
+    ("album_id", pa.string()),
+    ("name", pa.string()),
+    ("artist", pa.string()),
+    ("release_date", pa.string()),
+    ("total_tracks", pa.int64()),
+    ("query", pa.string()),
+])
+SPOTIFY_TRACK_SCHEMA = pa.schema([
+    ("track_id", pa.string()),
+    ("name", pa.string()),
+    ("artist", pa.string()),
+    ("album", pa.string()),
+    ("release_date", pa.string()),
+    ("duration_ms", pa.int64()),
+    ("popularity", pa.int64()),
+    ("query", pa.string()),
+])
+
+YOUTUBE_VIDEO_SCHEMA = pa.schema([
+    ("video_id", pa.string()),
+    ("title", pa.string()),
+    ("channel_id", pa.string()),
+    ("channel_title", pa.string()),
+    ("published_at", pa.string()),
+    ("duration_seconds", pa.float64()),
+    ("views", pa.int64()),
+    ("likes", pa.int64()),
+    ("favorite_count", pa.int64()),
+    ("comment_count", pa.int64()),
+    ("tags", pa.string()),
+    ("thumbnail_url", pa.string()),
+])
+
+# Plain to_pandas turns an integer column with any null into float64; these
+# map to pandas' nullable dtypes instead, so the frame (and the Parquet
+# written from it) keeps the schema's integer types.
+PANDAS_DTYPES = {
+    pa.int64(): pd.Int64Dtype(),
+}
+
+
+class ColumnarBuilder:
+    """Accumulates records into typed Arrow record batches.
+
+    Values are appended positionally in schema order. Every chunk_size
+    records the pending tuples are transposed and converted to Arrow with
+    the declared types, so there is no dict per record and no type
+    inference. With a sink (path or writable file) each finished batch is
+    written straight out as a Parquet row group and dropped from memory.
+    """
+
+    def __init__(self, schema, chunk_size=65536, sink=None, **writer_kwargs):
+        self.schema = schema
+        self.chunk_size = chunk_size
+        self.num_rows = 0
+        self._pending = []
+        self._batches = []
+        self._writer = pq.ParquetWriter(sink, schema, **writer_kwargs) if sink is not None else None
+
+    def append(self, *values):
+        self._pending.append(values)
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        columns = zip(*self._pending)
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema,
+        )
+        self.num_rows += batch.num_rows
+        self._pending = []
+        if self._writer is not None:
+            self._writer.write_batch(batch)
+        else:
+            self._batches.append(batch)
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def to_table(self):
+        self.close()
+        return pa.Table.from_batches(self._batches, schema=self.schema)
+
+    def to_pandas(self):
+        return self.to_table().to_pandas(types_mapper=PANDAS_DTYPES.get)
+
+    def __len__(self):
+        return self.num_rows + len(self._pending)
+
@@ -1,12 +1,14 @@
 import requests
 import pandas as pd
 import os
-from io import BytesIO
-import time
-from dagster import op, Out, Output, resource
-from minio import Minio
+from concurrent.futures import ThreadPoolExecutor
+from dagster import op, Out, Output
 import logging
 from dotenv import load_dotenv
+from src.ingestion.ratelimit import TokenBucket
+from src.ingestion.http_client import get_http_client
+from src.storage.datasets import append_partition
+from src.ingestion.columnar import ColumnarBuilder, DEEZER_TRACK_SCHEMA, DEEZER_GENRE_TRACK_SCHEMA
 
 
 load_dotenv()
@@ -18,117 +20,101 @@ formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
-@resource
-def minio_resource(context):
-    import os
-    client = Minio(
-        endpoint=os.getenv("MINIO_ENDPOINT"),
-        access_key=os.getenv("MINIO_ACCESS_KEY"),
-        secret_key=os.getenv("MINIO_SECRET_KEY"),
-        secure=os.getenv("MINIO_SECURE", "False").lower() == "true"
-    )
-    return client
+DEEZER_API_URL = os.getenv("DEEZER_API_URL", "https://api.deezer.com")
+DEEZER_MAX_WORKERS = int(os.getenv("DEEZER_MAX_WORKERS", "8"))
 
-
-def load_from_minio(minio_client, filename):
-    bucket = os.getenv("BUCKET_NAME")
-    try:
-        obj = minio_client.get_object(bucket, filename)
-        return pd.read_parquet(BytesIO(obj.read()))
-    except:
-        return pd.DataFrame()
-
-def upload_to_minio(minio_client, df, filename):
-    if df.empty:
-        logger.warning(f"Nothing to upload for {filename}, DataFrame is empty")
-        return
-    
-    bucket = os.getenv("BUCKET_NAME")
-    buffer = BytesIO()
-    df.to_parquet(buffer, index=False)
-    buffer.seek(0)
-    minio_client.put_object(bucket, filename, buffer, length=len(buffer.getvalue()))
-    logger.info(f"Uploaded {filename} successfully")
+# Deezer allows 50 requests per 5 seconds per client; one bucket is shared by
+# every request this module makes, whichever thread it comes from.
+DEEZER_QUOTA_REQUESTS = 50
+DEEZER_QUOTA_WINDOW = 5
+deezer_limiter = TokenBucket.for_quota(DEEZER_QUOTA_REQUESTS, DEEZER_QUOTA_WINDOW, burst=10)
 
 def deezer_request(url, retries=3, delay=1):
-    for _ in range(retries):
-        resp = requests.get(url)
-        if resp.status_code == 200:
-            return resp.json()
-        time.sleep(delay)
-    logger.warning(f"Failed request: {url}")
+    # retries counts attempts, as it always has here; the client counts retries after the first
+    try:
+        resp = get_http_client().get(url, retries=retries - 1, backoff_factor=delay, limiter=deezer_limiter)
+    except requests.RequestException as e:
+        logger.warning(f"Failed request: {url} ({e})")
+        return None
+    if resp.status_code == 200:
+        return resp.json()
+    logger.warning(f"Failed request: {url} ({resp.status_code})")
     return None
 
-@op(out={"charts_df": Out()}, required_resource_keys={"minio"})
+@op(out={"charts_df": Out()}, required_resource_keys={"storage"})
 def deezer_charts_op(context):
-    minio_client = context.resources.minio
-    chart_data = deezer_request("https://api.deezer.com/chart")
+    storage = context.resources.storage
+    chart_data = deezer_request(f"{DEEZER_API_URL}/chart")
     chart_tracks = chart_data.get("tracks", {}).get("data", []) if chart_data else []
     
-    rows = [{"id": t["id"], "title": t["title"], "artist": t["artist"]["name"],
-             "album": t["album"]["title"], "link": t["link"], "duration": t["duration"]}
-            for t in chart_tracks]
+    builder = ColumnarBuilder(DEEZER_TRACK_SCHEMA)
+    for t in chart_tracks:
+        builder.append(t["id"], t["title"], t["artist"]["name"], t["album"]["title"], t["link"], t["duration"])
     
-    df = pd.DataFrame(rows)
-    existing_df = load_from_minio(minio_client, "deezer_charts.parquet")
-    if not existing_df.empty:
-        df = pd.concat([existing_df, df]).drop_duplicates(subset=["id"], keep="last")
-    
-    upload_to_minio(minio_client, df, "deezer_charts.parquet")
+    df = builder.to_pandas()
+    # Only this run's rows are written; readers and compaction keep the newest row per id
+    append_partition(storage, "deezer_charts", df, skip_seen=False)
     context.log.info(f"Charts DF rows: {len(df)}")
+    get_http_client().log_stats(context.log)
+    storage.log_stats(context.log)
     yield Output(df, output_name="charts_df", metadata={"rows": len(df)})
 
 
-@op(out={"genre_df": Out()}, required_resource_keys={"minio"})
+def get_genre_artists(genre_id):
+    data = deezer_request(f"{DEEZER_API_URL}/genre/{genre_id}/artists")
+    return data.get("data", []) if data else []
+
+def get_artist_top_tracks(artist_id, limit=50):
+    data = deezer_request(f"{DEEZER_API_URL}/artist/{artist_id}/top?limit={limit}")
+    return data.get("data", []) if data else []
+
+def fetch_genre_tracks(genre_ids, max_workers=DEEZER_MAX_WORKERS):
+    # pool.map keeps results in submission order, so rows come out exactly as
+    # the old genre -> artist -> track loop produced them.
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        genre_artists = list(pool.map(get_genre_artists, genre_ids))
+        jobs = [(gid, artist["id"]) for gid, artists in zip(genre_ids, genre_artists) for artist in artists]
+        top_tracks = pool.map(lambda job: get_artist_top_tracks(job[1]), jobs)
+
+        builder = ColumnarBuilder(DEEZER_GENRE_TRACK_SCHEMA)
+        for (gid, _), tracks in zip(jobs, top_tracks):
+            for t in tracks:
+                builder.append(t["id"], t["title"], t["artist"]["name"], t["album"]["title"], t["link"], t["duration"], gid)
+    logger.info(f"Fetched {len(builder)} genre tracks from {len(jobs)} artists")
+    return builder.to_pandas()
+
+@op(out={"genre_df": Out()}, required_resource_keys={"storage"})
 def deezer_genres_op(context):
-    minio_client = context.resources.minio
+    storage = context.resources.storage
     genre_ids = [132, 116, 152, 113, 106]  
-    rows = []
-
-    for gid in genre_ids:
-        artists = deezer_request(f"https://api.deezer.com/genre/{gid}/artists").get("data", [])
-        for artist in artists:
-            top_tracks = deezer_request(f"https://api.deezer.com/artist/{artist['id']}/top?limit=50").get("data", [])
-            for t in top_tracks:
-                rows.append({
-                    "id": t["id"], "title": t["title"], "artist": t["artist"]["name"],
-                    "album": t["album"]["title"], "link": t["link"], "duration": t["duration"], "genre_id": gid
-                })
-            time.sleep(0.2)
-    
-    df = pd.DataFrame(rows)
-    existing_df = load_from_minio(minio_client, "deezer_genres.parquet")
-    if not existing_df.empty:
-        df = pd.concat([existing_df, df]).drop_duplicates(subset=["id"], keep="last")
+    df = fetch_genre_tracks(genre_ids)
     
-    upload_to_minio(minio_client, df, "deezer_genres.parquet")
+    # Only this run's rows are written; readers and compaction keep the newest row per id
+    append_partition(storage, "deezer_genres", df, skip_seen=False)
     context.log.info(f"Genre DF rows: {len(df)}")
+    get_http_client().log_stats(context.log)
+    storage.log_stats(context.log)
     yield Output(df, output_name="genre_df", metadata={"rows": len(df)})
 
 def get_album_tracks(album_id):
-    data = deezer_request(f"https://api.deezer.com/album/{album_id}/tracks")
+    data = deezer_request(f"{DEEZER_API_URL}/album/{album_id}/tracks")
     return data.get("data", []) if data else []
 
-@op(out={"albums_df": Out()}, required_resource_keys={"minio"})
+@op(out={"albums_df": Out()}, required_resource_keys={"storage"})
 def deezer_albums_op(context, charts_df: pd.DataFrame):
-    minio_client = context.resources.minio
+    storage = context.resources.storage
     album_ids = charts_df["album"].unique().tolist()
-    rows = []
+    builder = ColumnarBuilder(DEEZER_TRACK_SCHEMA)
 
     for aid in album_ids:
         tracks = get_album_tracks(aid)
         for t in tracks:
-            rows.append({
-                "id": t["id"], "title": t["title"], "artist": t["artist"]["name"],
-                "album": t["album"]["title"], "link": t["link"], "duration": t["duration"]
-            })
-        time.sleep(0.2)
-    
-    df = pd.DataFrame(rows)
-    existing_df = load_from_minio(minio_client, "deezer_albums.parquet")
-    if not existing_df.empty:
-        df = pd.concat([existing_df, df]).drop_duplicates(subset=["id"], keep="last")
+            builder.append(t["id"], t["title"], t["artist"]["name"], t["album"]["title"], t["link"], t["duration"])
     
-    upload_to_minio(minio_client, df, "deezer_albums.parquet")
+    df = builder.to_pandas()
+    # Only this run's rows are written; readers and compaction keep the newest row per id
+    append_partition(storage, "deezer_albums", df, skip_seen=False)
     context.log.info(f"Albums DF rows: {len(df)}")
+    get_http_client().log_stats(context.log)
+    storage.log_stats(context.log)
     yield Output(df, output_name="albums_df", metadata={"rows": len(df)})
\ No newline at end of file
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH", ".http_cache.sqlite")
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# (regex on host + path, ttl in seconds); the first match wins and endpoints
+# that match nothing are never cached.
+CACHE_TTLS = [
+    (r"^api\.spotify\.com/v1/albums", 30 * DAY),
+    (r"^api\.deezer\.com/album/[^/]+/tracks", 30 * DAY),
+    (r"^api\.deezer\.com/artist/[^/]+/top", DAY),
+    (r"^api\.deezer\.com/genre/[^/]+/artists", DAY),
+    (r"^api\.deezer\.com/chart", HOUR),
+]
+
+
+def cacheable(response):
+    """Whether a 200 response may be stored.
+
+    Deezer reports quota and other errors as HTTP 200 with a top-level
+    "error" object; caching one would serve it for the endpoint's whole TTL.
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return not (isinstance(body, dict) and "error" in body)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+class CachedResponse:
+    def __init__(self, key, url, status, headers, body, etag, last_modified, expires_at):
+        self.key = key
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def is_fresh(self):
+        return time.time() < self.expires_at
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self):
+        response = requests.Response()
+        response.status_code = self.status
+        response._content = self.body
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.url = self.url
+        response.from_cache = True
+        return response
+
+
+class ResponseCache:
+    """On-disk cache for GET responses of slow-changing catalog endpoints.
+
+    Entries live in a single SQLite file keyed by method, URL and params.
+    Expired entries that carry an ETag or Last-Modified are revalidated
+    with a conditional request instead of being refetched. The file is
+    kept under max_bytes by evicting the least recently used entries.
+    Responses the cacheable check rejects are passed through unstored.
+    """
+
+    def __init__(self, path=HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_BYTES, ttls=CACHE_TTLS, cacheable=cacheable):
+        self.path = path
+        self.cacheable = cacheable
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.counters = {"hits": 0, "misses": 0, "revalidated": 0, "stores": 0, "rejected": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+
+    def ttl_for(self, endpoint):
+        for pattern, ttl in self.ttls:
+            if pattern.search(endpoint):
+                return ttl
+        return None
+
+    @staticmethod
+    def key_for(method, url, params=None):
+        # Auth headers are deliberately left out: a refreshed token must not
+        # turn every entry into a miss.
+        raw = json.dumps([method.upper(), url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, status, headers, body, etag, last_modified, expires_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        url, status, headers, body, etag, last_modified, expires_at = row
+        return CachedResponse(key, url, status, json.loads(headers), body, etag, last_modified, expires_at)
+
+    def put(self, key, url, response, ttl):
+        body = response.content
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, response.status_code, json.dumps(dict(response.headers)), body, len(body),
+                 response.headers.get("ETag"), response.headers.get("Last-Modified"), now + ttl, now),
+            )
+            self.counters["stores"] += 1
+            self._evict()
+
+    def renew(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?",
+                               (now + ttl, now, key))
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self.counters["evictions"] += evicted
+        logger.info(f"Evicted {evicted} cached responses to stay under {self.max_bytes} bytes")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {**self.counters, "entries": entries, "bytes": size}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,213 @@
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.ingestion.http_cache import HTTP_CACHE_PATH, ResponseCache
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "1"))
+HTTP_MAX_RETRY_AFTER = float(os.getenv("HTTP_MAX_RETRY_AFTER", "60"))
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+HOST_TIMEOUTS = {
+    "api.deezer.com": (5, 15),
+    "api.spotify.com": (5, 30),
+    "accounts.spotify.com": (5, 15),
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_ID_SEGMENT = re.compile(r"^(\d+|[A-Za-z0-9]{16,})$")
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    retries: int = 0
+    errors: int = 0
+    bytes: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "latency_avg_ms": round(1000 * self.latency_total / self.requests, 1) if self.requests else 0.0,
+            "latency_max_ms": round(1000 * self.latency_max, 1),
+        }
+
+
+def endpoint_key(url):
+    # Collapse ids in the path so /artist/123/top and /artist/456/top count
+    # towards the same endpoint.
+    parts = urlsplit(url)
+    segments = ["{id}" if _ID_SEGMENT.match(seg) else seg for seg in parts.path.split("/")]
+    return f"{parts.netloc}{'/'.join(segments)}"
+
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """Keep-alive session shared by the ingestion modules.
+
+    Retries connection errors and RETRY_STATUSES with exponential backoff,
+    waiting for Retry-After instead when the server sends one. The final
+    response is returned whatever its status, so callers keep their own
+    error handling; an exception is raised only if no response arrived.
+
+    With a ResponseCache, GETs to endpoints that have a TTL are served from
+    disk while fresh and revalidated with ETag/Last-Modified once stale.
+    Cache hits skip the limiter and do not count as requests.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES,
+                 backoff_factor=HTTP_BACKOFF_FACTOR, timeouts=None, default_timeout=DEFAULT_TIMEOUT, cache=None):
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeouts = dict(HOST_TIMEOUTS if timeouts is None else timeouts)
+        self.default_timeout = default_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def timeout_for(self, url):
+        return self.timeouts.get(urlsplit(url).hostname, self.default_timeout)
+
+    def _record(self, endpoint, **changes):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            for name, value in changes.items():
+                if name == "latency":
+                    stats.latency_total += value
+                    stats.latency_max = max(stats.latency_max, value)
+                else:
+                    setattr(stats, name, getattr(stats, name) + value)
+
+    def _wait(self, attempt, backoff_factor, response=None):
+        delay = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if delay is None:
+            delay = backoff_factor * (2 ** attempt)
+        delay = min(delay, HTTP_MAX_RETRY_AFTER)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def request(self, method, url, retries=None, backoff_factor=None, limiter=None, **kwargs):
+        endpoint = endpoint_key(url)
+        ttl = self.cache.ttl_for(endpoint) if self.cache is not None and method.upper() == "GET" else None
+        if not ttl:
+            return self._send(method, url, endpoint, retries, backoff_factor, limiter, **kwargs)
+
+        key = self.cache.key_for(method, url, kwargs.get("params"))
+        cached = self.cache.get(key)
+        if cached is not None and cached.is_fresh:
+            self.cache.count("hits")
+            return cached.to_response()
+
+        if cached is not None and cached.validators():
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **cached.validators()}
+        response = self._send(method, url, endpoint, retries, backoff_factor, limiter, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.cache.count("revalidated")
+            self.cache.renew(key, ttl)
+            return cached.to_response()
+
+        self.cache.count("misses")
+        if response.status_code == 200:
+            if self.cache.cacheable(response):
+                self.cache.put(key, url, response, ttl)
+            else:
+                self.cache.count("rejected")
+                logger.warning(f"Not caching {endpoint}: response body reports an error")
+        return response
+
+    def _send(self, method, url, endpoint, retries, backoff_factor, limiter, **kwargs):
+        retries = self.max_retries if retries is None else retries
+        backoff_factor = self.backoff_factor if backoff_factor is None else backoff_factor
+        kwargs.setdefault("timeout", self.timeout_for(url))
+
+        for attempt in range(retries + 1):
+            if attempt:
+                self._record(endpoint, retries=1)
+            if limiter is not None:
+                limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(endpoint, requests=1, errors=1, latency=time.perf_counter() - start)
+                if attempt == retries:
+                    logger.error(f"{method} {url} failed after {attempt + 1} attempts: {e}")
+                    raise
+                delay = self._wait(attempt, backoff_factor)
+                logger.warning(f"{method} {endpoint} raised {type(e).__name__}, retrying in {delay:.1f}s")
+                continue
+
+            self._record(endpoint, requests=1, bytes=len(response.content), latency=time.perf_counter() - start,
+                         errors=int(response.status_code >= 400))
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            delay = self._wait(attempt, backoff_factor, response)
+            logger.warning(f"{method} {endpoint} returned {response.status_code}, retrying in {delay:.1f}s")
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in sorted(self._stats.items())}
+
+    def log_stats(self, log=logger):
+        for endpoint, stats in self.stats().items():
+            log.info(f"HTTP {endpoint}: {stats}")
+        if self.cache is not None:
+            log.info(f"HTTP cache: {self.cache.stats()}")
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(cache=ResponseCache(HTTP_CACHE_PATH) if HTTP_CACHE_PATH else None)
+        return _client
@@ -0,0 +1,38 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker hitting the same API.
+
+    Callers reserve a token up front and sleep off any deficit outside the
+    lock, so concurrent workers queue fairly instead of spinning.
+    """
+
+    def __init__(self, rate, capacity):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_quota(cls, requests, window_seconds, burst):
+        # Any window of `window_seconds` sees at most burst + rate * window
+        # requests, so size the refill rate to keep that under the quota.
+        if burst >= requests:
+            raise ValueError("burst must be smaller than the quota")
+        return cls(rate=(requests - burst) / window_seconds, capacity=burst)
+
+    def acquire(self, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -1,13 +1,14 @@
 import os
-import requests
-import pandas as pd
-from io import BytesIO
+import json
+import tempfile
+import threading
+import time
 import logging
 from dotenv import load_dotenv
-import time
-from dagster import op, Out, Output, resource
-from minio import Minio
-from minio.error import S3Error
+from dagster import op, Out, Output
+from src.ingestion.http_client import get_http_client
+from src.storage.datasets import append_partition
+from src.ingestion.columnar import ColumnarBuilder, SPOTIFY_SEARCH_SCHEMA, SPOTIFY_TRACK_SCHEMA
 
 # Setup logging with console and file output
 logger = logging.getLogger(__name__)
@@ -24,8 +25,7 @@ logger.addHandler(file_handler)
 load_dotenv()
 
 # Validate environment variables
-required_vars = ["SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET", "MINIO_ENDPOINT", 
-                 "MINIO_ACCESS_KEY", "MINIO_SECRET_KEY", "BUCKET_NAME"]
+required_vars = ["SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET"]
 missing_vars = [var for var in required_vars if not os.getenv(var)]
 if missing_vars:
     logger.error(f"Missing environment variables: {missing_vars}")
@@ -33,96 +33,12 @@ if missing_vars:
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
-MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT")
-MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY")
-MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
-MINIO_BUCKET = os.getenv("BUCKET_NAME")
-MINIO_SECURE = os.getenv("MINIO_SECURE", "False").lower() == "true"
-
-@resource
-def minio_resource(context):
-    try:
-        client = Minio(
-            endpoint=MINIO_ENDPOINT,
-            access_key=MINIO_ACCESS_KEY,
-            secret_key=MINIO_SECRET_KEY,
-            secure=MINIO_SECURE
-        )
-        # Check if bucket exists, create if it doesn't
-        if not client.bucket_exists(MINIO_BUCKET):
-            client.make_bucket(MINIO_BUCKET)
-            context.log.info(f"Created MinIO bucket: {MINIO_BUCKET}")
-        else:
-            context.log.info(f"MinIO bucket {MINIO_BUCKET} already exists")
-        client.list_buckets()  # Test connectivity
-        context.log.info("Connected to MinIO successfully")
-        logger.info("Connected to MinIO successfully")
-        return client
-    except Exception as e:
-        logger.error(f"Failed to initialize MinIO client: {e}")
-        context.log.error(f"Failed to initialize MinIO client: {e}")
-        raise ValueError(f"Failed to initialize MinIO client: {e}")
-
-def load_from_minio(minio_client, filename, context):
-    try:
-        context.log.info(f"Attempting to load {filename} from MinIO bucket {MINIO_BUCKET}")
-        logger.info(f"Attempting to load {filename} from MinIO bucket {MINIO_BUCKET}")
-        obj = minio_client.get_object(MINIO_BUCKET, filename)
-        df = pd.read_parquet(BytesIO(obj.read()))
-        context.log.info(f"Loaded {filename} from MinIO: shape={df.shape}")
-        logger.info(f"Loaded {filename} from MinIO: shape={df.shape}")
-        return df
-    except S3Error as e:
-        if e.code == "NoSuchKey":
-            context.log.info(f"No existing {filename} found in MinIO; starting fresh")
-            logger.info(f"No existing {filename} found in MinIO; starting fresh")
-            return pd.DataFrame()
-        else:
-            context.log.error(f"MinIO S3Error while loading {filename}: {e}")
-            logger.error(f"MinIO S3Error while loading {filename}: {e}")
-            raise
-    except Exception as e:
-        context.log.error(f"Error loading {filename} from MinIO: {e}")
-        logger.error(f"Error loading {filename} from MinIO: {e}")
-        raise
-
-def upload_to_minio(minio_client, df, filename, context, format="parquet"):
-    if df is None or df.empty:
-        context.log.warning(f"Nothing to upload for {filename}, DataFrame is empty")
-        logger.warning(f"Nothing to upload for {filename}, DataFrame is empty")
-        return
-
-    buffer = BytesIO()
-    if format == "parquet":
-        df.to_parquet(buffer, index=False)
-    else:
-        df.to_csv(buffer, index=False)
-    buffer.seek(0)
-    size = len(buffer.getvalue())
-    
-    context.log.info(f"Uploading {filename} ({size} bytes) to MinIO bucket {MINIO_BUCKET}")
-    logger.info(f"Uploading {filename} ({size} bytes) to MinIO bucket {MINIO_BUCKET}")
-
-    try:
-        minio_client.put_object(
-            bucket_name=MINIO_BUCKET,
-            object_name=filename,
-            data=buffer,
-            length=size,
-            content_type="application/octet-stream"
-        )
-        context.log.info(f"Uploaded {filename} successfully")
-        logger.info(f"Uploaded {filename} successfully")
-    except S3Error as e:
-        context.log.error(f"MinIO S3Error while uploading {filename}: {e}")
-        logger.error(f"MinIO S3Error while uploading {filename}: {e}")
-        raise
-    except Exception as e:
-        context.log.error(f"Failed to upload {filename}: {e}")
-        logger.error(f"Failed to upload {filename}: {e}")
-        raise
+SPOTIFY_ALBUM_BATCH_SIZE = 20
+# Optional path where the access token is shared between processes
+SPOTIFY_TOKEN_CACHE = os.getenv("SPOTIFY_TOKEN_CACHE", "")
+SPOTIFY_TOKEN_REFRESH_MARGIN = int(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "300"))
 
-def get_spotify_token():
+def request_spotify_token():
     url = "https://accounts.spotify.com/api/token"
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     data = {
@@ -130,31 +46,100 @@ def get_spotify_token():
         "client_id": SPOTIFY_CLIENT_ID,
         "client_secret": SPOTIFY_CLIENT_SECRET,
     }
-    response = requests.post(url, headers=headers, data=data)
+    response = get_http_client().post(url, headers=headers, data=data)
     if response.status_code != 200:
         logger.error(f"Failed to get token: {response.status_code} - {response.text}")
         raise Exception(f"Token retrieval failed: {response.text}")
-    token = response.json()["access_token"]
     logger.info("Spotify token retrieved successfully")
-    return token
+    return response.json()
 
-def spotify_request(url, token, retries=3):
-    headers = {"Authorization": f"Bearer {token}"}
-    for attempt in range(retries):
-        response = requests.get(url, headers=headers)
-        if response.status_code == 429:
-            wait = int(response.headers.get("Retry-After", 1))
-            logger.warning(f"Rate limit exceeded, retrying in {wait} seconds...")
-            time.sleep(wait)
-            continue
-        elif response.status_code != 200:
-            logger.error(f"Spotify API request failed: {response.status_code} - {response.text}")
-            raise Exception(f"Spotify API request failed: {response.text}")
-        return response.json()
-    logger.error(f"Failed after {retries} retries: {url}")
-    raise Exception(f"Spotify API request failed after {retries} retries")
+class SpotifyTokenProvider:
+    """Caches the client-credentials token until shortly before it expires.
+
+    Safe to share between threads. With a cache_path the token is also
+    written to disk (atomically, mode 0600) so other processes can reuse it
+    instead of requesting their own.
+    """
+
+    def __init__(self, fetch_token, cache_path=None, refresh_margin=SPOTIFY_TOKEN_REFRESH_MARGIN):
+        self._fetch_token = fetch_token
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._rejected = set()
+        self._lock = threading.Lock()
 
-def paginate_search_by_genre(query, token, limit_per_page=50, max_results=2000):
+    def _is_fresh(self, token, expires_at):
+        return token is not None and token not in self._rejected and time.time() < expires_at - self.refresh_margin
+
+    def _read_cache(self):
+        if not self.cache_path:
+            return None, 0.0
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            return cached["access_token"], float(cached["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None, 0.0
+
+    def _write_cache(self):
+        if not self.cache_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".spotify_token")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"access_token": self._token, "expires_at": self._expires_at}, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not persist Spotify token to {self.cache_path}: {e}")
+
+    def get_token(self):
+        with self._lock:
+            if self._is_fresh(self._token, self._expires_at):
+                return self._token
+            token, expires_at = self._read_cache()
+            if self._is_fresh(token, expires_at):
+                logger.info("Reusing Spotify token from shared cache")
+                self._token, self._expires_at = token, expires_at
+                return self._token
+            data = self._fetch_token()
+            self._token = data["access_token"]
+            self._expires_at = time.time() + int(data.get("expires_in", 3600))
+            self._write_cache()
+            return self._token
+
+    def invalidate(self, token):
+        # Only the token that was actually rejected is dropped, so concurrent
+        # 401s trigger a single refresh.
+        with self._lock:
+            self._rejected.add(token)
+            if self._token == token:
+                self._token, self._expires_at = None, 0.0
+
+spotify_tokens = SpotifyTokenProvider(request_spotify_token, cache_path=SPOTIFY_TOKEN_CACHE or None)
+
+def get_spotify_token():
+    return spotify_tokens.get_token()
+
+def spotify_request(url, token=None, retries=3):
+    # Retries and Retry-After on 429 are handled by the shared client; an
+    # expired or revoked token is refreshed once on 401.
+    token = token or get_spotify_token()
+    response = get_http_client().get(url, headers={"Authorization": f"Bearer {token}"}, retries=retries)
+    if response.status_code == 401:
+        logger.warning("Spotify token rejected, refreshing and retrying once")
+        spotify_tokens.invalidate(token)
+        token = get_spotify_token()
+        response = get_http_client().get(url, headers={"Authorization": f"Bearer {token}"}, retries=retries)
+    if response.status_code != 200:
+        logger.error(f"Spotify API request failed: {response.status_code} - {response.text}")
+        raise Exception(f"Spotify API request failed: {response.text}")
+    return response.json()
+
+def paginate_search_by_genre(query, token=None, limit_per_page=50, max_results=2000):
     import math
     results = []
     total_fetched = 0
@@ -184,10 +169,9 @@ def paginate_search_by_genre(query, token, limit_per_page=50, max_results=2000):
     logger.info(f"Total tracks retrieved for genre '{query}': {len(results)}")
     return results
 
-def get_album_tracks(album_id, token, market="US"):
+def get_album_tracks(album_id, token=None, market="US", offset=0):
     tracks = []
     limit = 50
-    offset = 0
     while True:
         url = f"https://api.spotify.com/v1/albums/{album_id}/tracks?market={market}&limit={limit}&offset={offset}"
         try:
@@ -213,76 +197,103 @@ def get_album_tracks(album_id, token, market="US"):
     logger.info(f"Retrieved total {len(tracks)} tracks for album {album_id}")
     return tracks
 
-@op(out={"search_df": Out(), "tracks_df": Out()}, required_resource_keys={"minio"})
+def get_several_albums(album_ids, token=None, market="US"):
+    # /v1/albums accepts up to 20 ids and embeds the first page (50 tracks)
+    # of each album's track list, so most albums need no further requests.
+    albums = {}
+    for i in range(0, len(album_ids), SPOTIFY_ALBUM_BATCH_SIZE):
+        batch = album_ids[i:i + SPOTIFY_ALBUM_BATCH_SIZE]
+        url = f"https://api.spotify.com/v1/albums?ids={','.join(batch)}&market={market}"
+        try:
+            data = spotify_request(url, token)
+        except Exception as e:
+            logger.error(f"Error fetching album batch {batch}: {e}")
+            continue
+        for album in (data or {}).get("albums", []):
+            if album:
+                albums[album["id"]] = album
+    logger.info(f"Retrieved {len(albums)} of {len(album_ids)} albums in batches of {SPOTIFY_ALBUM_BATCH_SIZE}")
+    return albums
+
+def get_album_tracks_batched(album_ids, token=None, market="US"):
+    tracks_by_album = {}
+    albums = get_several_albums(album_ids, token, market)
+    for album_id in album_ids:
+        album = albums.get(album_id)
+        if album is None:
+            tracks_by_album[album_id] = []
+            continue
+        page = album.get("tracks") or {}
+        items = page.get("items", [])
+        if page.get("next") or page.get("total", len(items)) > len(items):
+            # Long albums (> 50 tracks) continue on the paginated endpoint
+            # after the embedded first page.
+            items = items + get_album_tracks(album_id, token, market, offset=len(items))
+        tracks_by_album[album_id] = items
+    return tracks_by_album
+
+@op(out={"search_df": Out(), "tracks_df": Out()}, required_resource_keys={"storage"})
 def spotify_search_op(context):
-    minio_client = context.resources.minio
+    storage = context.resources.storage
     context.log.info("Starting Spotify ETL")
     logger.info("Starting Spotify ETL")
 
-    token = get_spotify_token()
-    context.log.debug(f"Spotify token (first 10 chars): {token[:10]}...")
-
-    # Load existing parquet data from MinIO
-    existing_search_df = load_from_minio(minio_client, "spotify_search.parquet", context)
-    existing_tracks_df = load_from_minio(minio_client, "spotify_tracks.parquet", context)
+    # Fail fast on bad credentials; later calls reuse the cached token
+    get_spotify_token()
 
     # List of queries/genres to search
     queries = ["pop", "electronic", "heavy metal", "country", "jazz",
                "hip hop", "classical", "folk", "rock", "reggae", "blues", "r&b"]
     
-    search_rows = []
-    track_rows = []
-    album_map = {}
+    search_rows = ColumnarBuilder(SPOTIFY_SEARCH_SCHEMA)
+    track_rows = ColumnarBuilder(SPOTIFY_TRACK_SCHEMA)
+    search_hits = []
 
     # Search albums by query
     for q in queries:
         search_url = f"https://api.spotify.com/v1/search?q={q}&type=album&limit=50"
-        data = spotify_request(search_url, token)
+        data = spotify_request(search_url)
         albums = data.get("albums", {}).get("items", [])
         context.log.info(f"Query '{q}' returned {len(albums)} albums")
 
         for album in albums:
-            album_id = album["id"]
-            album_map[album_id] = q  # store query/genre mapping
-            search_rows.append({
-                "album_id": album_id,
-                "name": album["name"],
-                "artist": album["artists"][0]["name"],
-                "release_date": album["release_date"],
-                "total_tracks": album["total_tracks"],
-                "query": q
-            })
+            search_hits.append((album, q))
+            search_rows.append(
+                album["id"],
+                album["name"],
+                album["artists"][0]["name"],
+                album["release_date"],
+                album["total_tracks"],
+                q,
+            )
 
-            # Get tracks for the album
-            album_tracks = get_album_tracks(album_id, token)
-            for t in album_tracks:
-                track_rows.append({
-                    "track_id": t["id"],
-                    "name": t["name"],
-                    "artist": t["artists"][0]["name"],
-                    "album": album["name"],
-                    "release_date": album["release_date"],
-                    "duration_ms": t["duration_ms"],
-                    "popularity": t.get("popularity"),
-                    "query": q
-                })
-            time.sleep(0.5)
+    # Get tracks for every album found, 20 albums per request
+    album_ids = list(dict.fromkeys(album["id"] for album, _ in search_hits))
+    tracks_by_album = get_album_tracks_batched(album_ids)
+    for album, q in search_hits:
+        for t in tracks_by_album.get(album["id"], []):
+            track_rows.append(
+                t["id"],
+                t["name"],
+                t["artists"][0]["name"],
+                album["name"],
+                album["release_date"],
+                t["duration_ms"],
+                t.get("popularity"),
+                q,
+            )
 
     # Convert to DataFrames
-    search_df = pd.DataFrame(search_rows)
-    tracks_df = pd.DataFrame(track_rows)
-
-    # Merge with existing data
-    if not existing_search_df.empty:
-        search_df = pd.concat([existing_search_df, search_df]).drop_duplicates(subset=["album_id"])
-    if not existing_tracks_df.empty:
-        tracks_df = pd.concat([existing_tracks_df, tracks_df]).drop_duplicates(subset=["track_id"])
+    search_df = search_rows.to_pandas()
+    tracks_df = track_rows.to_pandas()
 
-    # Upload updated parquet files to MinIO
-    upload_to_minio(minio_client, search_df, "spotify_search.parquet", context)
-    upload_to_minio(minio_client, tracks_df, "spotify_tracks.parquet", context)
+    # Append this run's rows; history is deduplicated on read and by compaction
+    append_partition(storage, "spotify_search", search_df)
+    append_partition(storage, "spotify_tracks", tracks_df)
 
     context.log.info(f"Spotify ETL complete: {len(search_df)} albums, {len(tracks_df)} tracks")
+    get_http_client().log_stats(context.log)
+    storage.log_stats(context.log)
     logger.info(f"Spotify ETL complete: {len(search_df)} albums, {len(tracks_df)} tracks")
 
     yield Output(search_df, output_name="search_df", metadata={"rows": len(search_df)})
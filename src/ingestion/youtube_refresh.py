@@ -0,0 +1,80 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+VIDEOS_LIST_BATCH_SIZE = 50
+# videos.list costs 1 unit per call, however many ids (up to 50) it carries
+VIDEOS_LIST_QUOTA_COST = 1
+YOUTUBE_REFRESH_QUOTA = int(os.getenv("YOUTUBE_REFRESH_QUOTA", "100"))
+
+# (max video age in days, days between refreshes); None is the catch-all tier
+REFRESH_TIERS = [(7, 1), (30, 3), (365, 7), (None, 30)]
+
+# All the planner needs from the stored videos; titles and descriptions,
+# most of the bytes, are never read
+REFRESH_COLUMNS = ["video_id", "published_at", "views", "views_prev", "stats_fetched_at", "stats_prev_fetched_at"]
+
+
+def refresh_interval_days(age_days):
+    conditions = [age_days < max_age for max_age, _ in REFRESH_TIERS if max_age is not None]
+    choices = [interval for max_age, interval in REFRESH_TIERS if max_age is not None]
+    return pd.Series(np.select(conditions, choices, default=REFRESH_TIERS[-1][1]), index=age_days.index)
+
+
+def view_velocity(videos_df, now):
+    # Views per day since the previous refresh when we have one, otherwise
+    # averaged over the video's lifetime.
+    published = pd.to_datetime(videos_df["published_at"], utc=True)
+    age_days = ((now - published).dt.total_seconds() / 86400).clip(lower=1)
+    velocity = videos_df["views"] / age_days
+    if {"views_prev", "stats_prev_fetched_at", "stats_fetched_at"} <= set(videos_df.columns):
+        span_days = (
+            pd.to_datetime(videos_df["stats_fetched_at"], utc=True)
+            - pd.to_datetime(videos_df["stats_prev_fetched_at"], utc=True)
+        ).dt.total_seconds() / 86400
+        recent = (videos_df["views"] - videos_df["views_prev"]) / span_days.where(span_days > 0)
+        velocity = recent.where(recent.notna(), velocity)
+    return velocity
+
+
+def plan_stats_refresh(videos_df, max_ids, now=None, exclude=()):
+    """Pick up to max_ids known video ids whose statistics are due a refresh.
+
+    A video is due once its tier interval (by age) has passed since
+    stats_fetched_at; videos never refreshed are always due. Due videos are
+    ranked by view velocity so the budget goes to the ones that move.
+    """
+    if videos_df is None or videos_df.empty or max_ids <= 0:
+        return []
+    now = now or pd.Timestamp.now(tz="UTC")
+    df = videos_df[~videos_df["video_id"].isin(set(exclude))]
+    if df.empty:
+        return []
+
+    published = pd.to_datetime(df["published_at"], utc=True)
+    age_days = (now - published).dt.total_seconds() / 86400
+    interval = refresh_interval_days(age_days)
+    if "stats_fetched_at" in df.columns:
+        since_fetch = (now - pd.to_datetime(df["stats_fetched_at"], utc=True)).dt.total_seconds() / 86400
+        due = since_fetch.isna() | (since_fetch >= interval)
+    else:
+        due = pd.Series(True, index=df.index)
+
+    ranked = (
+        df.assign(_velocity=view_velocity(df, now).fillna(0))[due]
+        .sort_values("_velocity", ascending=False, kind="stable")
+    )
+    selected = ranked["video_id"].head(max_ids).tolist()
+    logger.info(f"Stats refresh: {int(due.sum())} of {len(df)} known videos due, refreshing {len(selected)}")
+    return selected
+
+
+def refresh_capacity(missing_count, budget_units=YOUTUBE_REFRESH_QUOTA):
+    # The refresh budget buys whole videos.list batches; the unused slots in
+    # the last batch of new ids come for free.
+    free_slots = (-missing_count) % VIDEOS_LIST_BATCH_SIZE
+    return (budget_units // VIDEOS_LIST_QUOTA_COST) * VIDEOS_LIST_BATCH_SIZE + free_slots
@@ -1,16 +1,19 @@
 import os
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timezone
 import isodate
-from io import BytesIO
 from dotenv import load_dotenv
 import logging
 import time
 from googleapiclient.errors import HttpError
-from dagster import op, Out, In, Output, resource
-from minio import Minio
-from minio.error import S3Error
+from dagster import op, Out, In, Output
 from googleapiclient.discovery import build
+from src.storage.datasets import append_partition, read_dataset, read_partition, update_manifest
+from src.ingestion.columnar import ColumnarBuilder, YOUTUBE_VIDEO_SCHEMA
+from src.ingestion.youtube_refresh import (
+    REFRESH_COLUMNS, VIDEOS_LIST_BATCH_SIZE, VIDEOS_LIST_QUOTA_COST, YOUTUBE_REFRESH_QUOTA, plan_stats_refresh,
+    refresh_capacity,
+)
 
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -20,19 +23,13 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 API_KEY = os.getenv("YOUTUBE_API_KEY")
-MINIO_BUCKET = os.getenv("BUCKET_NAME", "bronze-layer")
 YOUTUBE_API_SERVICE_NAME = "youtube"
 YOUTUBE_API_VERSION = "v3"
-
-
-@resource
-def minio_resource(context):
-    return Minio(
-        endpoint=os.getenv("MINIO_ENDPOINT", "localhost:9000"),
-        access_key=os.getenv("MINIO_ACCESS_KEY"),
-        secret_key=os.getenv("MINIO_SECRET_KEY"),
-        secure=False
-    )
+# search.list costs 100 quota units per call regardless of maxResults
+SEARCH_LIST_QUOTA_COST = 100
+# Searched in this order; a video found under several genres is kept under the first
+SEARCH_GENRES = ["pop", "electronic", "heavy metal", "country", "jazz", "hip hop",
+                 "classical", "folk", "rock", "reggae", "blues", "r&b"]
 
 
 def init_youtube_client(api_key):
@@ -45,10 +42,11 @@ def init_youtube_client(api_key):
         raise
 
 
-def fetch_videos(youtube, video_ids, retries=3, backoff_factor=2):
-    video_data = []
-    quota_cost = len(video_ids) * 3  
-    logger.info(f"Estimated quota cost for videos.list: {quota_cost} units")
+def fetch_videos(youtube, video_ids, retries=3, backoff_factor=2, builder=None):
+    # Rows go straight into the (optionally shared) columnar builder
+    video_data = builder if builder is not None else ColumnarBuilder(YOUTUBE_VIDEO_SCHEMA)
+    fetched = 0
+    logger.info(f"Estimated quota cost for videos.list: {VIDEOS_LIST_QUOTA_COST} units for {len(video_ids)} ids")
     for attempt in range(retries):
         try:
             logger.debug(f"Fetching videos for IDs: {video_ids}, attempt {attempt + 1}")
@@ -60,24 +58,25 @@ def fetch_videos(youtube, video_ids, retries=3, backoff_factor=2):
             logger.debug(f"videos.list response: {response}")
             for item in response.get("items", []):
                 try:
-                    video_data.append({
-                        "video_id": item["id"],
-                        "title": item["snippet"]["title"],
-                        "channel_id": item["snippet"]["channelId"],
-                        "channel_title": item["snippet"]["channelTitle"],
-                        "published_at": item["snippet"]["publishedAt"],
-                        "duration_seconds": isodate.parse_duration(item["contentDetails"]["duration"]).total_seconds(),
-                        "views": int(item["statistics"].get("viewCount", 0)),
-                        "likes": int(item["statistics"].get("likeCount", 0)),
-                        "favorite_count": int(item["statistics"].get("favoriteCount", 0)),
-                        "comment_count": int(item["statistics"].get("commentCount", 0)),
-                        "tags": ",".join(item["snippet"].get("tags", [])),
-                        "thumbnail_url": item["snippet"]["thumbnails"].get("maxres", {}).get("url", "")
-                    })
+                    video_data.append(
+                        item["id"],
+                        item["snippet"]["title"],
+                        item["snippet"]["channelId"],
+                        item["snippet"]["channelTitle"],
+                        item["snippet"]["publishedAt"],
+                        isodate.parse_duration(item["contentDetails"]["duration"]).total_seconds(),
+                        int(item["statistics"].get("viewCount", 0)),
+                        int(item["statistics"].get("likeCount", 0)),
+                        int(item["statistics"].get("favoriteCount", 0)),
+                        int(item["statistics"].get("commentCount", 0)),
+                        ",".join(item["snippet"].get("tags", [])),
+                        item["snippet"]["thumbnails"].get("maxres", {}).get("url", "")
+                    )
+                    fetched += 1
                 except KeyError as e:
                     logger.error(f"KeyError processing video {item.get('id')}: {e}")
                     continue
-            logger.info(f"Fetched {len(video_data)} videos")
+            logger.info(f"Fetched {fetched} videos")
             return video_data
         except HttpError as e:
             logger.error(f"Error fetching videos: {e}")
@@ -88,29 +87,25 @@ def fetch_videos(youtube, video_ids, retries=3, backoff_factor=2):
                 time.sleep(backoff_factor ** attempt)
             else:
                 logger.error("Max retries reached for video fetch.")
-                return []
-    return []
+                return video_data
+    return video_data
 
 
-def search_videos(youtube, search_queries, max_results_per_query=50, minio_client=None):
+def search_videos(youtube, search_queries, storage, max_results_per_query=50):
+    # Each genre's cached results come from its own youtube_search partition,
+    # so only the queried genres are read; only ids not seen before for a
+    # genre are appended afterwards.
     all_data_list = []
     all_video_ids = []
+    fetched = {}
 
     for query in search_queries:
-        filename = f"youtube_search_{query}.parquet"
-
-        try:
-            obj = minio_client.get_object(MINIO_BUCKET, filename)
-            cached_df = pd.read_parquet(BytesIO(obj.read()))
-            cached_df["genre"] = query
-            logger.info(f"[CACHE HIT] Loaded {len(cached_df)} videos for '{query}' from MinIO.")
-        except S3Error as e:
-            if e.code == "NoSuchKey":
-                logger.info(f"[CACHE MISS] No cached data for '{query}', will fetch fresh results...")
-                cached_df = pd.DataFrame()
-            else:
-                logger.error(f"Error accessing {filename} in MinIO: {e}")
-                continue
+        cached_df = read_partition(storage, "youtube_search", query, columns=["genre", "video_id"])
+        if cached_df.empty:
+            cached_df = pd.DataFrame(columns=["video_id", "genre"])
+            logger.info(f"[CACHE MISS] No cached data for '{query}', will fetch fresh results...")
+        else:
+            logger.info(f"[CACHE HIT] Loaded {len(cached_df)} videos for '{query}' from storage.")
 
         try:
             # Fetch fresh search results
@@ -127,20 +122,12 @@ def search_videos(youtube, search_queries, max_results_per_query=50, minio_clien
             new_df = pd.DataFrame({"video_id": video_ids, "genre": query})
 
             # Merge cached + new
-            df = pd.concat([cached_df, new_df], ignore_index=True).drop_duplicates("video_id")
-
-            # Save back to MinIO
-            buffer = BytesIO()
-            df.to_parquet(buffer, index=False)
-            buffer.seek(0)
-            minio_client.put_object(
-                MINIO_BUCKET,
-                filename,
-                buffer,
-                length=buffer.getbuffer().nbytes,
-                content_type="application/octet-stream"
-            )
-            logger.info(f"[API CALL] Saved {len(new_df)} new videos for '{query}' (total {len(df)}) to MinIO.")
+            df = pd.concat([cached_df[["video_id", "genre"]], new_df], ignore_index=True).drop_duplicates("video_id")
+
+            # Only ids the key index has not seen for this genre are written
+            append_partition(storage, "youtube_search", new_df, partition=query)
+            fetched[query] = {"rows": len(df), "last_fetched_at": datetime.now(timezone.utc).isoformat()}
+            logger.info(f"[API CALL] Fetched {len(new_df)} videos for '{query}' (total {len(df)}).")
 
             # Update accumulators
             all_data_list.append(df)
@@ -154,6 +141,9 @@ def search_videos(youtube, search_queries, max_results_per_query=50, minio_clien
                 logger.error(f"Error fetching search results for '{query}': {e}")
                 continue
 
+    if fetched:
+        update_manifest(storage, "youtube_search", fetched)
+
     if all_data_list:
         merged_df = pd.concat(all_data_list, ignore_index=True).drop_duplicates("video_id")
     else:
@@ -162,8 +152,9 @@ def search_videos(youtube, search_queries, max_results_per_query=50, minio_clien
     return merged_df, all_video_ids, all_data_list
 
 
-def merge_search_tables(all_data_list, minio_client, search_queries=None, merged_filename="youtube_search.parquet"):
-
+def merge_search_tables(all_data_list, search_queries=None):
+    # The youtube_search dataset already holds every genre's rows, so the
+    # merged view is built in memory (or by DuckDB) instead of written again.
     if not all_data_list:
         logger.warning("No search tables to merge")
         return pd.DataFrame()
@@ -174,78 +165,52 @@ def merge_search_tables(all_data_list, minio_client, search_queries=None, merged
             df["search_query"] = search_queries[i]
 
     merged_df = pd.concat(all_data_list, ignore_index=True).drop_duplicates(subset=["video_id"])
-
-    try:
-        upload_to_minio(minio_client, merged_df, merged_filename)
-        logger.info(f"Merged search table saved: {merged_filename} with {len(merged_df)} rows")
-    except Exception as e:
-        logger.error(f"Error uploading merged search table: {e}")
-        raise
-
+    logger.info(f"Merged search tables: {len(merged_df)} rows")
     return merged_df
 
 
-def load_from_minio(minio_client, filename):
-    try:
-        obj = minio_client.get_object(bucket_name=MINIO_BUCKET, object_name=filename)
-        df = pd.read_parquet(BytesIO(obj.read()))
-        logger.info(f"Loaded {filename} from MinIO: shape={df.shape}")
-        return df
-    except S3Error as e:
-        if e.code == "NoSuchKey":
-            logger.info(f"No existing {filename} found in MinIO; starting fresh")
-            return pd.DataFrame()
-        logger.error(f"Error loading {filename} from MinIO: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"Error loading {filename} from MinIO: {e}")
-        raise
-
-
-def upload_to_minio(minio_client, df, filename, format="parquet"):
-    try:
-        if df is None or (isinstance(df, pd.DataFrame) and df.empty):
-            logger.warning(f"Cannot upload {filename}: DataFrame is None or empty")
-            return
-        buffer = BytesIO()
-        if format == "parquet":
-            df.to_parquet(buffer, index=False)
-        else:
-            df.to_csv(buffer, index=False)
-        buffer.seek(0)
-        minio_client.put_object(bucket_name=MINIO_BUCKET, object_name=filename, data=buffer, length=len(buffer.getvalue()))
-        logger.info(f"Uploaded {filename} to MinIO bucket {MINIO_BUCKET}")
-    except Exception as e:
-        logger.error(f"Error uploading {filename} to MinIO: {e}")
-        raise
-
-@op(out={"videos_df": Out()}, required_resource_keys={"minio"})
+@op(out={"videos_df": Out(), "search_results": Out()}, required_resource_keys={"storage"})
 def youtube_videos_op(context):
-    minio_client = context.resources.minio
+    storage = context.resources.storage
     youtube = init_youtube_client(API_KEY)
-    genres = ["pop", "electronic", "heavy metal", "country", "jazz", "hip hop",
-              "classical", "folk", "rock", "reggae", "blues", "r&b"]
+    genres = SEARCH_GENRES
     
     try:
 
-        search_df, all_video_ids, _ = search_videos(youtube, genres, max_results_per_query=100, minio_client=minio_client)
+        search_df, all_video_ids, all_data_list = search_videos(youtube, genres, max_results_per_query=100, storage=storage)
         
 
-        existing_videos_df = load_from_minio(minio_client, "youtube_videos.parquet")
+        existing_videos_df = read_dataset(storage, "youtube_videos", columns=REFRESH_COLUMNS)
         existing_ids = set(existing_videos_df["video_id"].tolist()) if not existing_videos_df.empty else set()
 
 
         missing_ids = list(set(all_video_ids) - existing_ids)
         logger.info(f"Missing videos to fetch: {len(missing_ids)}")
 
-        video_data_list = []
-        for i in range(0, len(missing_ids), 50):
-            batch_ids = missing_ids[i:i+50]
-            video_data_list.extend(fetch_videos(youtube, batch_ids))
-            time.sleep(0.5)
+        # Known videos whose stats are due ride along in the same full batches
+        now = pd.Timestamp.now(tz="UTC")
+        refresh_ids = plan_stats_refresh(existing_videos_df, refresh_capacity(len(missing_ids)), now=now, exclude=missing_ids)
+        fetch_ids = missing_ids + refresh_ids
 
-        new_videos_df = pd.DataFrame(video_data_list)
-        videos_df = pd.concat([existing_videos_df, new_videos_df]).drop_duplicates(subset=["video_id"], keep="last") if not new_videos_df.empty else existing_videos_df
+        video_data = ColumnarBuilder(YOUTUBE_VIDEO_SCHEMA)
+        for i in range(0, len(fetch_ids), VIDEOS_LIST_BATCH_SIZE):
+            batch_ids = fetch_ids[i:i+VIDEOS_LIST_BATCH_SIZE]
+            fetch_videos(youtube, batch_ids, builder=video_data)
+            time.sleep(0.5)
+        videos_list_calls = -(-len(fetch_ids) // VIDEOS_LIST_BATCH_SIZE)
+        logger.info(f"Fetched {len(missing_ids)} new and {len(refresh_ids)} refreshed videos in {videos_list_calls} videos.list calls")
+
+        new_videos_df = video_data.to_pandas()
+        if not new_videos_df.empty:
+            new_videos_df["stats_fetched_at"] = now
+            if refresh_ids:
+                previous = existing_videos_df.set_index("video_id")
+                new_videos_df["views_prev"] = new_videos_df["video_id"].map(previous["views"])
+                if "stats_fetched_at" in previous.columns:
+                    new_videos_df["stats_prev_fetched_at"] = new_videos_df["video_id"].map(previous["stats_fetched_at"])
+        # Only new and refreshed rows are written; the newest row per
+        # video_id wins when the dataset is read or compacted.
+        videos_df = new_videos_df
 
         if not videos_df.empty:
             videos_df["published_at"] = pd.to_datetime(videos_df["published_at"])
@@ -254,30 +219,44 @@ def youtube_videos_op(context):
                 videos_df["favorite_count"] + videos_df["comment_count"]
             ) / videos_df["views"].replace(0, 1)
 
-            upload_to_minio(minio_client, videos_df, "youtube_videos.parquet")
+            # Refreshed rows re-use known video_ids on purpose
+            append_partition(storage, "youtube_videos", videos_df, skip_seen=False)
             logger.info("Video Metrics (first 5 rows):")
             logger.info(f"\n{videos_df[['title', 'views', 'likes', 'engagement_rate']].head().to_string()}")
 
-        yield Output(videos_df, output_name="videos_df", metadata={"rows": len(videos_df)})
+        storage.log_stats(context.log)
+        yield Output(videos_df, output_name="videos_df", metadata={
+            "rows": len(videos_df),
+            "new_videos": len(missing_ids),
+            "refreshed_videos": len(refresh_ids),
+            "refresh_quota_budget": YOUTUBE_REFRESH_QUOTA,
+            "videos_list_quota_units": videos_list_calls * VIDEOS_LIST_QUOTA_COST,
+        })
+        # Handed to youtube_search_op so it does not repeat the search.list calls
+        yield Output(all_data_list, output_name="search_results", metadata={
+            "queries": len(genres),
+            "search_quota_units": len(genres) * SEARCH_LIST_QUOTA_COST,
+        })
 
     except Exception as e:
         if "Quota exceeded" in str(e):
             logger.error("Pipeline stopped due to YouTube API quota limit. Schedule retry after midnight PT.")
         raise
 
-@op(out={"search_df": Out()}, ins={"videos_df": In()}, required_resource_keys={"minio"})
-def youtube_search_op(context, videos_df):
-    minio_client = context.resources.minio
-    youtube = init_youtube_client(API_KEY)
-    genres = ["pop", "electronic", "heavy metal", "country", "jazz", "hip hop",
-              "classical", "folk", "rock", "reggae", "blues", "r&b"]
+@op(out={"search_df": Out()}, ins={"search_results": In()})
+def youtube_search_op(context, search_results):
+    genres = SEARCH_GENRES
     
     try:
 
-        _, _, all_data_list = search_videos(youtube, genres, max_results_per_query=100, minio_client=minio_client)
-        
-   
-        search_df = merge_search_tables(all_data_list, minio_client)
+        # Reuse the per-genre results youtube_videos_op already fetched this run
+        search_df = merge_search_tables(search_results)
+        # One search.list call saved per genre upstream actually returned;
+        # genres whose search failed there are simply missing
+        search_calls_saved = len(search_results)
+        quota_saved = search_calls_saved * SEARCH_LIST_QUOTA_COST
+        logger.info(f"Reused {search_calls_saved} of {len(genres)} genre search tables from upstream; "
+                    f"saved {quota_saved} quota units")
         
         if not search_df.empty:
             logger.info("Videos Found by Genre Query (first 5 rows):")
@@ -285,7 +264,11 @@ def youtube_search_op(context, videos_df):
         else:
             logger.warning("No search data available")
         
-        yield Output(search_df, output_name="search_df", metadata={"rows": len(search_df)})
+        yield Output(search_df, output_name="search_df", metadata={
+            "rows": len(search_df),
+            "search_calls_saved": search_calls_saved,
+            "quota_units_saved": quota_saved,
+        })
     except Exception as e:
         logger.error(f"Error in youtube_search_op: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -1,38 +1,47 @@
-from dagster import job, ScheduleDefinition, Definitions
+from dagster import job, DagsterRunStatus, Definitions, RunRequest, ScheduleDefinition, run_status_sensor
 from src.ingestion.youtubeapi import youtube_videos_op, youtube_search_op
 from src.ingestion.spotifyapi import spotify_search_op
 from src.ingestion.deezerapi import deezer_charts_op, deezer_genres_op, deezer_albums_op
-from src.minioclient import minio_resource
-from src.duckdb.minio_to_duckdb import load_and_update_duckdb_to_postgres
+from src.storage.backends import storage_resource
+from src.duckdb.minio_to_duckdb import load_and_update_duckdb_to_postgres, rollback_postgres_tables
 from src.silver.silver import youtube_videos_clean_op
 from src.dbt.dbt_job import dbt_job
+from src.storage.compaction import compact_bronze_op
 
 
 
-@job(resource_defs={"minio": minio_resource})
+@job(resource_defs={"storage": storage_resource})
 def youtube_job():
-    videos_df = youtube_videos_op()
-    youtube_search_op(videos_df=videos_df)
+    videos_df, search_results = youtube_videos_op()
+    youtube_search_op(search_results=search_results)
 
-@job(resource_defs={"minio": minio_resource})
+@job(resource_defs={"storage": storage_resource})
 def youtube_clean_job():
     youtube_videos_clean_op()
 
-@job(resource_defs={"minio": minio_resource})
+@job(resource_defs={"storage": storage_resource})
 def spotify_job():
     spotify_search_op()
 
 
-@job(resource_defs={"minio": minio_resource})
+@job(resource_defs={"storage": storage_resource})
 def deezer_job():
     charts_df = deezer_charts_op()
     deezer_genres_op()
     deezer_albums_op(charts_df=charts_df)
 
-@job(resource_defs={"minio": minio_resource})
+@job(resource_defs={"storage": storage_resource})
 def duckdb_to_postgres_job():
     load_and_update_duckdb_to_postgres()
 
+@job
+def postgres_rollback_job():
+    rollback_postgres_tables()
+
+@job(resource_defs={"storage": storage_resource})
+def bronze_compaction_job():
+    compact_bronze_op()
+
 
 youtube_schedule = ScheduleDefinition(
     job=youtube_job,
@@ -64,15 +73,24 @@ duckdb_schedule = ScheduleDefinition(
     execution_timezone="America/Chicago",
 )
 
-dbt_schedule = ScheduleDefinition(
-    job=dbt_job,
-    cron_schedule="30 10 * * *",  # runs daily at 10:30 AM CDT
+# dbt runs once the bronze load has finished rather than at a fixed time: a long
+# load can still hold the DuckDB file the duckdb target runs in
+@run_status_sensor(run_status=DagsterRunStatus.SUCCESS, monitored_jobs=[duckdb_to_postgres_job], request_job=dbt_job)
+def dbt_after_load_sensor(context):
+    return RunRequest(run_key=context.dagster_run.run_id)
+
+bronze_compaction_schedule = ScheduleDefinition(
+    job=bronze_compaction_job,
+    cron_schedule="0 4 * * 0",  # Sundays 4:00 AM CDT, before the daily ingests
     execution_timezone="America/Chicago",
 )
 
 
 defs = Definitions(
-    jobs=[youtube_job, spotify_job, deezer_job, duckdb_to_postgres_job, youtube_clean_job,  dbt_job],
-    schedules=[youtube_schedule, spotify_schedule, deezer_schedule, duckdb_schedule, youtube_clean_schedule, dbt_schedule],
-    resources={"minio": minio_resource},
+    jobs=[youtube_job, spotify_job, deezer_job, duckdb_to_postgres_job, youtube_clean_job,  dbt_job, bronze_compaction_job,
+          postgres_rollback_job],
+    schedules=[youtube_schedule, spotify_schedule, deezer_schedule, duckdb_schedule, youtube_clean_schedule,
+               bronze_compaction_schedule],
+    sensors=[dbt_after_load_sensor],
+    resources={"storage": storage_resource},
 )
@@ -1,11 +1,28 @@
-from dagster import op, OpExecutionContext
-from minio import Minio
-import pandas as pd
-from io import BytesIO
+from dagster import Field, Output, op, OpExecutionContext
+import itertools
+import json
+import multiprocessing
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import re
 import logging
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from src.storage.arrow_fs import arrow_filesystem, iter_parquet_batches, parquet_schema
+from src.storage.datasets import (
+    DATASET_KEYS, DATASET_PROFILES, append_partition, key_index, list_parts, new_part_name, part_stamp,
+    partition_prefix, read_dataset_parts,
+)
+from src.storage.profiles import get_profile
+from src.storage.stage_inputs import (
+    SKIPPED, inputs_digest, inputs_unchanged, object_fingerprints, record_stage_inputs, stage_metadata,
+)
+from src.storage.streaming import ParquetObjectWriter
 
 
 load_dotenv()
@@ -18,6 +35,16 @@ formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
+SOURCE_DATASET = "youtube_videos"
+CLEAN_DATASET = "youtube_videos_clean"
+# Stamp of the newest source part already cleaned
+WATERMARK_KEY = f"{CLEAN_DATASET}/_watermark.json"
+TEXT_COLUMNS = ["title", "description"]
+STAGE = "youtube_clean"
+SILVER_CHUNK_ROWS = int(os.getenv("SILVER_CHUNK_ROWS", "65536"))
+# 0: one worker process per available core
+SILVER_WORKERS = int(os.getenv("SILVER_WORKERS", "0"))
+
 
 def clean_text(text: str) -> str:
     if pd.isna(text):
@@ -30,43 +57,213 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-@op
-def youtube_videos_clean_op(context: OpExecutionContext):
-   
-    client = Minio(
-        os.getenv("MINIO_ENDPOINT", "localhost:9000"),
-        access_key=os.getenv("MINIO_ACCESS_KEY"),
-        secret_key=os.getenv("MINIO_SECRET_KEY"),
-        secure=False
-    )
 
+# RE2 (pyarrow) spellings of Python's Unicode \w and \s; RE2's own \w and \s
+# are ASCII-only. They agree with re on every code point Python's Unicode
+# database assigns; RE2 also knows letters added in later Unicode versions.
+WORD_CHARS = r"\p{L}\p{N}_"
+SPACE_CHARS = r"\t\n\v\f\r\x1c-\x1f\x85\p{Z}"
+DISALLOWED_CHARS = f"[^{WORD_CHARS}{SPACE_CHARS}.,!?-]+"
+# Whitespace other than a plain space (\p{Z} minus U+0020, spelled out)
+OTHER_SPACE_CHARS = r"\t\n\v\f\r\x1c-\x1f\x85\xa0\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}"
+# Runs that are not already a single space; those need no rewrite
+SPACE_RUN = f"[{SPACE_CHARS}]{{2,}}|[{OTHER_SPACE_CHARS}]"
+CLEAN_TEXT_DTYPE = pd.StringDtype("pyarrow", na_value=np.nan)
+
+
+def _replace_matching(text, pattern, replacement):
+    # pyarrow matches ~10x faster than it replaces, so only rewrite the rows that match
+    hits = pc.fill_null(pc.match_substring_regex(text, pattern), False)
+    if not pc.any(hits).as_py():
+        return text
+    replaced = pc.replace_substring_regex(pc.filter(text, hits), pattern, replacement)
+    return pc.replace_with_mask(text, hits, replaced)
+
+
+def clean_text_array(text):
+    """Vectorized clean_text over an Arrow string array: same output per string, nulls stay null.
+
+    clean_text's hashtag pass is left out; "#" is already removed by the
+    first pass, so it never matches.
+    """
+    if isinstance(text, pa.ChunkedArray):
+        return pa.chunked_array([clean_text_array(chunk) for chunk in text.chunks], type=text.type)
+    text = _replace_matching(text, DISALLOWED_CHARS, "")
+    text = _replace_matching(text, SPACE_RUN, " ")
+    # runs are single spaces now, so this is the same as str.strip()
+    return pc.utf8_trim(text, " ")
+
+
+def clean_text_column(values: pd.Series) -> pd.Series:
+    text = clean_text_array(pa.array(values, type=pa.large_string(), from_pandas=True))
+    cleaned = text.to_pandas(types_mapper={pa.large_string(): CLEAN_TEXT_DTYPE}.get)
+    return pd.Series(cleaned.array, index=values.index, name=values.name)
+
+
+def clean_batch(batch):
+    """Clean the text columns of one record batch; runs in the worker processes."""
+    columns = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if name in TEXT_COLUMNS:
+            column = clean_text_array(column)
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, schema=batch.schema)
+
+
+def read_watermark(storage):
+    try:
+        return json.loads(storage.read(WATERMARK_KEY))
+    except FileNotFoundError:
+        return {}
 
-    response = client.get_object("bronze-layer", "youtube_videos.parquet")
-    data = BytesIO(response.read())
-    response.close()
-    response.release_conn()
 
-    df = pd.read_parquet(data)
-    logger.info(f"Loaded raw YouTube videos: {df.shape[0]} rows")
+def write_watermark(storage, last_part_stamp, rows):
+    watermark = {
+        "source": SOURCE_DATASET,
+        "last_part_stamp": last_part_stamp,
+        "rows": rows,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    storage.write(WATERMARK_KEY, json.dumps(watermark, indent=2).encode(), content_type="application/json")
+    return watermark
 
 
-    if "title" in df.columns:
-        df["title"] = df["title"].astype(str).apply(clean_text)
-    if "description" in df.columns:
-        df["description"] = df["description"].astype(str).apply(clean_text)
+def pending_parts(storage, watermark):
+    """Source parts written after the watermark.
 
-    logger.info("Sample of cleaned data:\n" + str(df.head()))
+    Part names carry their write time, and compaction names a merged part
+    after the newest part it replaces, so a compacted part is only picked up
+    again if it absorbed rows that were not processed yet.
+    """
+    last = watermark.get("last_part_stamp", "")
+    return [key for key in list_parts(storage, SOURCE_DATASET) if part_stamp(key) > last]
 
-    out_data = BytesIO()
-    df.to_parquet(out_data, index=False)
-    out_data.seek(0)
 
-    client.put_object(
-        "bronze-layer",
-        "youtube_videos_cleaned.parquet",
-        out_data,
-        length=len(out_data.getvalue()),
-        content_type="application/parquet"
-    )
+def clean_videos(df):
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            df[column] = clean_text_column(df[column])
+    return df
 
-    logger.info("✅ Cleaned data uploaded back to MinIO as youtube_videos_cleaned.parquet")
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def _conform(batch, schema):
+    # parts written before a column existed get it as nulls
+    columns = [batch.column(name) if name in batch.schema.names else pa.nulls(batch.num_rows, field.type)
+               for name, field in zip(schema.names, schema)]
+    return pa.RecordBatch.from_arrays(columns, names=schema.names).cast(schema)
+
+
+def _ordered_map(pool, fn, items, max_in_flight):
+    """Like pool.map, but submits lazily so at most max_in_flight items are held."""
+    if pool is None:
+        yield from map(fn, items)
+        return
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def clean_parts_streaming(storage, parts, workers=SILVER_WORKERS, chunk_rows=SILVER_CHUNK_ROWS):
+    """Clean source parts chunk by chunk in a process pool and stream the result into one new part.
+
+    Chunks are read one row group at a time and written back in read order,
+    so the newest row per key still wins when the dataset is read. At most
+    2 * workers chunks are in flight, which bounds memory by chunk_rows *
+    2 * workers rows however large the input is. Returns the cleaned key
+    column as a DataFrame (empty if there was nothing to write).
+    """
+    workers = workers or available_cores()
+    key_columns = DATASET_KEYS[CLEAN_DATASET]
+    filesystem = arrow_filesystem(storage)
+    schema = pa.unify_schemas([parquet_schema(storage, part, filesystem).remove_metadata() for part in parts],
+                              promote_options="permissive")
+    batches = (_conform(batch, schema) for part in parts
+               for batch in iter_parquet_batches(storage, part, chunk_rows, filesystem=filesystem))
+    first = next(batches, None)
+    if first is None:
+        return pd.DataFrame(columns=key_columns)
+
+    profile = get_profile(DATASET_PROFILES[CLEAN_DATASET])
+    options = profile.writer_options(first.to_pandas(), key_columns)
+    key = partition_prefix(CLEAN_DATASET, datetime.now(timezone.utc).date().isoformat()) + new_part_name()
+    keys = []
+    # spawn, not fork: the upload thread is already running when workers start
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+    try:
+        with ParquetObjectWriter(storage, key, schema, **options) as writer:
+            for cleaned in _ordered_map(pool, clean_batch, itertools.chain([first], batches), 2 * workers):
+                writer.write_table(pa.Table.from_batches([cleaned]), row_group_size=chunk_rows)
+                keys.append(cleaned.select(key_columns))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    keys = pa.Table.from_batches(keys).to_pandas()
+    key_index(storage, CLEAN_DATASET).add(keys)
+    logger.info(f"Streamed {len(keys)} cleaned rows from {len(parts)} parts to {key} with {workers} workers")
+    return keys
+
+
+def clean_incremental(storage, full_refresh=False, streaming=True, workers=SILVER_WORKERS, chunk_rows=SILVER_CHUNK_ROWS):
+    """Clean the source rows ingested since the last run and append them.
+
+    New and refreshed videos both arrive as new youtube_videos parts, so
+    re-cleaned rows simply supersede older ones by video_id. full_refresh
+    ignores the watermark, cleans every part and then drops the old output.
+    streaming=False loads the new rows into one DataFrame instead of going
+    chunk by chunk through clean_parts_streaming.
+    """
+    watermark = {} if full_refresh else read_watermark(storage)
+    parts = pending_parts(storage, watermark)
+    if not parts:
+        logger.info(f"No {SOURCE_DATASET} parts after {watermark.get('last_part_stamp')}; nothing to clean")
+        return {"parts": 0, "rows": 0, "full_refresh": full_refresh}
+
+    replaced = list_parts(storage, CLEAN_DATASET) if full_refresh else []
+    if streaming:
+        df = clean_parts_streaming(storage, parts, workers, chunk_rows)
+    else:
+        df = read_dataset_parts(storage, SOURCE_DATASET, parts)
+        logger.info(f"Loaded {df.shape[0]} raw YouTube videos from {len(parts)} new parts")
+        df = clean_videos(df)
+        append_partition(storage, CLEAN_DATASET, df, skip_seen=False)
+    if full_refresh:
+        for key in replaced:
+            storage.delete(key)
+        key_index(storage, CLEAN_DATASET).rebuild(df)
+    # Only advanced once the cleaned rows are stored; a failed run is retried
+    write_watermark(storage, max(part_stamp(key) for key in parts), len(df))
+    return {"parts": len(parts), "rows": len(df), "full_refresh": full_refresh, "streaming": streaming}
+
+
+@op(
+    required_resource_keys={"storage"},
+    config_schema={
+        "full_refresh": Field(bool, default_value=False,
+                              description="Re-clean every youtube_videos part and replace the output"),
+        "streaming": Field(bool, default_value=True, description="Clean chunk by chunk in a process pool"),
+        "workers": Field(int, default_value=SILVER_WORKERS, description="Worker processes; 0 means one per core"),
+        "chunk_rows": Field(int, default_value=SILVER_CHUNK_ROWS),
+    },
+)
+def youtube_videos_clean_op(context: OpExecutionContext):
+    storage = context.resources.storage
+    config = context.op_config
+    inputs = object_fingerprints(storage, [f"{SOURCE_DATASET}/"])
+    if not config["full_refresh"] and inputs_unchanged(storage, STAGE, inputs_digest(inputs)):
+        context.log.info(f"{SOURCE_DATASET} is unchanged since the last clean; skipping")
+        yield Output(SKIPPED, metadata=stage_metadata(inputs, skipped=True))
+        return
+    summary = clean_incremental(storage, full_refresh=config["full_refresh"], streaming=config["streaming"],
+                                workers=config["workers"], chunk_rows=config["chunk_rows"])
+    record_stage_inputs(storage, STAGE, inputs)
+    logger.info(f"Cleaned YouTube videos into {CLEAN_DATASET}: {summary}")
+    storage.log_stats(context.log)
+    yield Output(summary, metadata={**summary, **stage_metadata(inputs, skipped=False)})
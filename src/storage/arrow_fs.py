@@ -0,0 +1,170 @@
+import logging
+import threading
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+
+class RangeFile:
+    """Seekable read-only file over one stored object; every read is a range read."""
+
+    def __init__(self, handler, key, size):
+        self._handler = handler
+        self.key = key
+        self._size = size
+        self._pos = 0
+        self.closed = False
+
+    def read(self, nbytes=-1):
+        if nbytes is None or nbytes < 0:
+            nbytes = self._size - self._pos
+        nbytes = min(nbytes, self._size - self._pos)
+        if nbytes <= 0:
+            return b""
+        data = self._handler.get_range(self.key, self._pos, nbytes)
+        if self._pos + len(data) == self._size:
+            self._handler.remember_tail(self.key, self._pos, data)
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._size
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def size(self):
+        return self._size
+
+    def close(self):
+        self.closed = True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+
+class StorageFileSystemHandler(pafs.FileSystemHandler):
+    """Read-only pyarrow filesystem over a StorageBackend.
+
+    Paths are storage keys. Opened files issue ranged reads, so Parquet
+    readers only fetch the footer and the column chunks (and row groups)
+    they actually need; the backend's read counters show what was fetched.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._tails = {}
+
+    def get_range(self, key, offset, length):
+        # Dataset discovery and the scan both read the footer; serve the
+        # second read from the tail already fetched.
+        tail = self._tails.get(key)
+        if tail is not None and tail[0] <= offset and offset + length <= tail[0] + len(tail[1]):
+            start = offset - tail[0]
+            return tail[1][start:start + length]
+        return self.storage.read(key, offset, length)
+
+    def remember_tail(self, key, offset, data):
+        with self._lock:
+            self._tails[key] = (offset, data)
+
+    def get_type_name(self):
+        return f"storage-{self.storage.name}"
+
+    def equals(self, other):
+        return isinstance(other, StorageFileSystemHandler) and other.storage is self.storage
+
+    def normalize_path(self, path):
+        return path.strip("/")
+
+    def _file_info(self, path):
+        key = path.strip("/")
+        try:
+            return pafs.FileInfo(path, pafs.FileType.File, size=self.storage.size(key))
+        except FileNotFoundError:
+            pass
+        if self.storage.list(key.rstrip("/") + "/"):
+            return pafs.FileInfo(path, pafs.FileType.Directory)
+        return pafs.FileInfo(path, pafs.FileType.NotFound)
+
+    def get_file_info(self, paths):
+        return [self._file_info(path) for path in paths]
+
+    def get_file_info_selector(self, selector):
+        base = selector.base_dir.strip("/")
+        prefix = base + "/" if base else ""
+        infos, dirs = [], set()
+        for obj in self.storage.list(prefix):
+            relative = obj.key[len(prefix):].split("/")
+            if len(relative) > 1 and not selector.recursive:
+                dirs.add(prefix + relative[0])
+                continue
+            infos.append(pafs.FileInfo(obj.key, pafs.FileType.File, size=obj.size))
+        infos.extend(pafs.FileInfo(d, pafs.FileType.Directory) for d in sorted(dirs))
+        if not infos and not selector.allow_not_found:
+            raise FileNotFoundError(selector.base_dir)
+        return infos
+
+    def open_input_file(self, path):
+        info = self._file_info(path)
+        if info.type != pafs.FileType.File:
+            raise FileNotFoundError(path)
+        return pa.PythonFile(RangeFile(self, path.strip("/"), info.size), mode="r")
+
+    def open_input_stream(self, path):
+        return self.open_input_file(path)
+
+    def _read_only(self, *args, **kwargs):
+        raise NotImplementedError("StorageFileSystemHandler is read-only; write through src.storage.streaming")
+
+    create_dir = delete_dir = delete_dir_contents = delete_root_dir_contents = _read_only
+    delete_file = move = copy_file = open_output_stream = open_append_stream = _read_only
+
+
+def arrow_filesystem(storage):
+    return pafs.PyFileSystem(StorageFileSystemHandler(storage))
+
+
+def read_parquet(storage, key, columns=None, filters=None, filesystem=None):
+    """Read one Parquet object with column projection and filter pushdown.
+
+    Requested columns missing from the file are skipped rather than failing,
+    so older parts written before a column existed can still be read.
+    filters takes the pyarrow/pandas DNF form, e.g. [("views", ">", 0)];
+    row groups whose statistics cannot match are never downloaded.
+    """
+    filesystem = filesystem or arrow_filesystem(storage)
+    dataset = ds.dataset(key, filesystem=filesystem, format="parquet")
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def parquet_schema(storage, key, filesystem=None):
+    filesystem = filesystem or arrow_filesystem(storage)
+    with filesystem.open_input_file(key) as f:
+        return pq.read_schema(f)
+
+
+def iter_parquet_batches(storage, key, batch_size, columns=None, filesystem=None):
+    """Yield one Parquet object as record batches, fetching one row group at a time."""
+    filesystem = filesystem or arrow_filesystem(storage)
+    with filesystem.open_input_file(key) as f:
+        yield from pq.ParquetFile(f).iter_batches(batch_size=batch_size, columns=columns)
@@ -0,0 +1,358 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+
+import urllib3
+from dagster import resource
+from dotenv import load_dotenv
+from minio import Minio
+from minio.commonconfig import CopySource
+from minio.error import S3Error
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "minio")
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "data/lake")
+BUCKET_NAME = os.getenv("BUCKET_NAME", "bronze-layer")
+STORAGE_POOL_SIZE = int(os.getenv("STORAGE_POOL_SIZE", "16"))
+# S3 multipart parts must be at least 5 MiB (except the last one)
+MINIO_PART_SIZE = max(int(os.getenv("MINIO_PART_SIZE", str(16 * 2**20))), 5 * 2**20)
+MINIO_PARALLEL_UPLOADS = int(os.getenv("MINIO_PARALLEL_UPLOADS", "2"))
+MISSING_CODES = ("NoSuchKey", "NoSuchObject")
+COPY_CHUNK_SIZE = 2**20
+
+# etag changes whenever the object is rewritten: the S3 ETag on MinIO, the
+# mtime and size of the file locally, an MD5 of the bytes in memory
+ObjectInfo = namedtuple("ObjectInfo", ["key", "size", "etag"], defaults=[None])
+
+
+@dataclass
+class OperationStats:
+    calls: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self):
+        return {"calls": self.calls, "bytes": self.bytes, "seconds": round(self.seconds, 3)}
+
+
+class StorageBackend:
+    """Key/value object store rooted at one bucket or directory.
+
+    Every backend has the same semantics: keys are "/"-separated, read and
+    size raise FileNotFoundError for a missing key, list returns ObjectInfo
+    (key, size, etag) sorted by key, and delete of a missing key is a no-op.
+    Each operation is counted (calls, bytes moved, wall time) per backend
+    instance.
+    """
+
+    name = "base"
+    # Largest single read a backend makes from a stream passed to write_stream
+    stream_read_size = COPY_CHUNK_SIZE
+
+    def __init__(self):
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @contextmanager
+    def _timed(self, operation):
+        moved = [0]
+        start = time.perf_counter()
+        try:
+            yield moved
+        finally:
+            with self._stats_lock:
+                stats = self._stats.setdefault(operation, OperationStats())
+                stats.calls += 1
+                stats.bytes += moved[0]
+                stats.seconds += time.perf_counter() - start
+
+    def read(self, key, offset=0, length=None):
+        with self._timed("read") as moved:
+            data = self._read(key, offset, length)
+            moved[0] = len(data)
+        return data
+
+    def write(self, key, data, content_type="application/octet-stream"):
+        with self._timed("write") as moved:
+            self._write_stream(key, BytesIO(data), content_type)
+            moved[0] = len(data)
+
+    def write_stream(self, key, stream, content_type="application/octet-stream"):
+        """Store everything read from a file-like object, without buffering it all."""
+        counted = _CountingReader(stream)
+        with self._timed("write") as moved:
+            self._write_stream(key, counted, content_type)
+            moved[0] = counted.bytes_read
+
+    def size(self, key):
+        with self._timed("stat"):
+            return self._size(key)
+
+    def exists(self, key):
+        try:
+            self.size(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self, prefix=""):
+        with self._timed("list"):
+            return sorted(self._list(prefix))
+
+    def delete(self, key):
+        with self._timed("delete"):
+            self._delete(key)
+
+    def copy(self, source, target):
+        with self._timed("copy"):
+            self._copy(source, target)
+
+    def uri(self, key):
+        """Location of a key (or glob) for engines that read storage directly, like DuckDB."""
+        raise NotImplementedError(f"{self.name} storage has no external URI")
+
+    def stats(self):
+        with self._stats_lock:
+            return {operation: stats.as_dict() for operation, stats in self._stats.items()}
+
+    def log_stats(self, log=logger):
+        for operation, stats in sorted(self.stats().items()):
+            log.info(f"Storage {self.name} {operation}: {stats}")
+
+
+class _CountingReader:
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class MinioBackend(StorageBackend):
+    name = "minio"
+
+    def __init__(self, client, bucket=BUCKET_NAME, part_size=MINIO_PART_SIZE, parallel_uploads=MINIO_PARALLEL_UPLOADS):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.part_size = part_size
+        self.parallel_uploads = parallel_uploads
+        # put_object reads part_size + 1 bytes to detect the last part
+        self.stream_read_size = part_size + 1
+
+    @classmethod
+    def from_env(cls, bucket=BUCKET_NAME, pool_size=STORAGE_POOL_SIZE):
+        endpoint = os.getenv("MINIO_ENDPOINT")
+        access_key = os.getenv("MINIO_ACCESS_KEY")
+        secret_key = os.getenv("MINIO_SECRET_KEY")
+        if not all([endpoint, access_key, secret_key]):
+            raise ValueError("Incomplete MinIO configuration. Please set MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY")
+        # One pool shared by every thread using this backend
+        http_client = urllib3.PoolManager(
+            maxsize=pool_size,
+            timeout=urllib3.Timeout(connect=10, read=300),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
+        client = Minio(
+            endpoint=endpoint,
+            access_key=access_key,
+            secret_key=secret_key,
+            secure=os.getenv("MINIO_SECURE", "false").lower() == "true",
+            http_client=http_client,
+        )
+        return cls(client, bucket)
+
+    def ensure_bucket(self):
+        if not self.client.bucket_exists(self.bucket):
+            self.client.make_bucket(self.bucket)
+            logger.info(f"Created MinIO bucket: {self.bucket}")
+
+    @contextmanager
+    def _translate_missing(self, key):
+        try:
+            yield
+        except S3Error as e:
+            if e.code in MISSING_CODES:
+                raise FileNotFoundError(f"{self.bucket}/{key}") from e
+            raise
+
+    def _read(self, key, offset, length):
+        with self._translate_missing(key):
+            obj = self.client.get_object(self.bucket, key, offset=offset, length=length or 0)
+        try:
+            return obj.read()
+        finally:
+            obj.close()
+            obj.release_conn()
+
+    def _write_stream(self, key, stream, content_type):
+        # length=-1 makes put_object upload part by part as it reads
+        self.client.put_object(
+            self.bucket, key, stream, length=-1, part_size=self.part_size,
+            num_parallel_uploads=self.parallel_uploads, content_type=content_type,
+        )
+
+    def _size(self, key):
+        with self._translate_missing(key):
+            return self.client.stat_object(self.bucket, key).size
+
+    def _list(self, prefix):
+        return [
+            ObjectInfo(obj.object_name, obj.size, (obj.etag or "").strip('"'))
+            for obj in self.client.list_objects(self.bucket, prefix=prefix, recursive=True)
+        ]
+
+    def _delete(self, key):
+        self.client.remove_object(self.bucket, key)
+
+    def _copy(self, source, target):
+        with self._translate_missing(source):
+            self.client.copy_object(self.bucket, target, CopySource(self.bucket, source))
+
+    def uri(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+
+class LocalBackend(StorageBackend):
+    """Objects as files under a root directory; writes are atomic renames."""
+
+    name = "local"
+
+    def __init__(self, root=STORAGE_LOCAL_ROOT):
+        super().__init__()
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def _read(self, key, offset, length):
+        with open(self._path(key), "rb") as f:
+            f.seek(offset)
+            return f.read(-1 if length is None else length)
+
+    def _write_stream(self, key, stream, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def _list(self, prefix):
+        # Walk only the prefix's deepest directory; its last fragment
+        # ("youtube_search_" in "youtube_search_") narrows the top level
+        directory, _, fragment = prefix.rpartition("/")
+        start = self._path(directory) if directory else self.root
+        objects = []
+        for dirpath, dirnames, filenames in os.walk(start):
+            if dirpath == start and fragment:
+                dirnames[:] = [name for name in dirnames if name.startswith(fragment)]
+                filenames = [name for name in filenames if name.startswith(fragment)]
+            for filename in filenames:
+                if filename.startswith(".tmp-"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    stat = os.stat(path)
+                    objects.append(ObjectInfo(key, stat.st_size, f"{stat.st_mtime_ns:x}-{stat.st_size:x}"))
+        return objects
+
+    def _delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _copy(self, source, target):
+        with open(self._path(source), "rb") as f:
+            self._write_stream(target, f, None)
+
+    def uri(self, key):
+        return self._path(key)
+
+
+class MemoryBackend(StorageBackend):
+    """In-process dict of objects, for tests and offline runs."""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise FileNotFoundError(key) from None
+
+    def _read(self, key, offset, length):
+        data = self._get(key)
+        return data[offset:] if length is None else data[offset:offset + length]
+
+    def _write_stream(self, key, stream, content_type):
+        chunks = []
+        while chunk := stream.read(COPY_CHUNK_SIZE):
+            chunks.append(chunk)
+        with self._lock:
+            self.objects[key] = b"".join(chunks)
+
+    def _size(self, key):
+        return len(self._get(key))
+
+    def _list(self, prefix):
+        with self._lock:
+            return [ObjectInfo(key, len(data), hashlib.md5(data).hexdigest())
+                    for key, data in self.objects.items() if key.startswith(prefix)]
+
+    def _delete(self, key):
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def _copy(self, source, target):
+        data = self._get(source)
+        with self._lock:
+            self.objects[target] = data
+
+
+def storage_from_env(backend=STORAGE_BACKEND):
+    if backend == "minio":
+        return MinioBackend.from_env()
+    if backend == "local":
+        return LocalBackend(STORAGE_LOCAL_ROOT)
+    if backend == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected minio, local or memory")
+
+
+@resource
+def storage_resource(init_context):
+    storage = storage_from_env()
+    if isinstance(storage, MinioBackend):
+        storage.ensure_bucket()
+    init_context.log.info(f"Using {storage.name} storage")
+    return storage
@@ -0,0 +1,86 @@
+import logging
+from collections import defaultdict
+
+import pandas as pd
+from dagster import Field, Output, op
+
+from src.storage.datasets import (
+    COMPACTION_PROFILE, DATASET_KEYS, PARTITION_COLUMNS, key_index, list_parts, part_stamp, partition_of,
+    read_parts, save_frame, update_manifest,
+)
+
+logger = logging.getLogger(__name__)
+
+def compact_dataset(storage, dataset):
+    """Merge each partition's parts into one file and drop superseded rows.
+
+    A row is kept only in the newest part that contains its key, so after
+    compaction every key appears once across the whole dataset. The merged
+    part is named after the newest part it replaces, which keeps the
+    dataset's key order equal to ingest order. New parts are written before
+    old ones are removed; a reader in between sees duplicates, which it
+    already drops by key.
+    """
+    keys = list_parts(storage, dataset)
+    if not keys:
+        return {"dataset": dataset, "parts_before": 0, "parts_after": 0, "rows_dropped": 0}
+
+    key_columns = DATASET_KEYS[dataset]
+    frames = read_parts(storage, keys)
+    tagged = [frame.assign(_part=key) for key, frame in zip(keys, frames)]
+    combined = pd.concat(tagged, ignore_index=True)
+    kept = combined.drop_duplicates(subset=key_columns, keep="last")
+    rows_dropped = len(combined) - len(kept)
+
+    parts_by_partition = defaultdict(list)
+    for key in keys:
+        parts_by_partition[partition_of(key)].append(key)
+
+    written, removed = [], []
+    for partition, partition_keys in parts_by_partition.items():
+        rows = kept[kept["_part"].isin(partition_keys)].drop(columns="_part")
+        unchanged = len(partition_keys) == 1 and len(rows) == len(frames[keys.index(partition_keys[0])])
+        if unchanged:
+            continue
+        if not rows.empty:
+            target = f"{dataset}/{partition}/part-{part_stamp(partition_keys[-1])}-compacted.parquet"
+            save_frame(storage, target, rows, profile=COMPACTION_PROFILE, key_columns=key_columns)
+            written.append(target)
+        removed.extend(key for key in partition_keys if key not in written)
+
+    for key in removed:
+        storage.delete(key)
+    # Compaction has every key in hand, so it also heals the index; merged,
+    # not overwritten, so keys appended while it ran are kept
+    key_index(storage, dataset).merge(kept)
+    if dataset in PARTITION_COLUMNS:
+        counts = kept[PARTITION_COLUMNS[dataset]].value_counts()
+        update_manifest(storage, dataset, {str(value): {"rows": int(rows)} for value, rows in counts.items()})
+
+    summary = {
+        "dataset": dataset,
+        "parts_before": len(keys),
+        "parts_after": len(keys) - len(removed) + len([k for k in written if k not in keys]),
+        "rows_dropped": rows_dropped,
+    }
+    logger.info(f"Compacted {dataset}: {summary}")
+    return summary
+
+
+@op(
+    required_resource_keys={"storage"},
+    config_schema={"datasets": Field([str], is_required=False, description="Defaults to every bronze and silver dataset")},
+)
+def compact_bronze_op(context):
+    storage = context.resources.storage
+    datasets = context.op_config.get("datasets") or list(DATASET_KEYS)
+    summaries = []
+    for dataset in datasets:
+        summaries.append(compact_dataset(storage, dataset))
+        context.log.info(f"Compacted {dataset}: {summaries[-1]}")
+    storage.log_stats(context.log)
+    yield Output(summaries, metadata={
+        "datasets": len(summaries),
+        "parts_removed": sum(s["parts_before"] - s["parts_after"] for s in summaries),
+        "rows_dropped": sum(s["rows_dropped"] for s in summaries),
+    })
@@ -0,0 +1,271 @@
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import pandas as pd
+
+from src.storage.arrow_fs import arrow_filesystem, read_parquet
+from src.storage.key_index import KeyIndex
+from src.storage.profiles import DEFAULT_PROFILE, get_profile
+from src.storage.streaming import stream_frame
+
+logger = logging.getLogger(__name__)
+
+# Append-only bronze datasets and the key columns rows are deduplicated on.
+# Each run writes <dataset>/ingest_date=YYYY-MM-DD/part-<stamp>-<id>.parquet;
+# readers keep the newest row per key and compaction merges the small files.
+BRONZE_DATASETS = {
+    "deezer_charts": ["id"],
+    "deezer_genres": ["id"],
+    "deezer_albums": ["id"],
+    "spotify_search": ["album_id"],
+    "spotify_tracks": ["track_id"],
+    "youtube_videos": ["video_id"],
+    "youtube_search": ["genre", "video_id"],
+}
+# Silver datasets use the same layout, appended to by the silver ops
+SILVER_DATASETS = {
+    "youtube_videos_clean": ["video_id"],
+}
+DATASET_KEYS = {**BRONZE_DATASETS, **SILVER_DATASETS}
+
+# Writer profile (src.storage.profiles) for each dataset's appended parts.
+# Compaction always rewrites with COMPACTION_PROFILE.
+DATASET_PROFILES = {
+    "deezer_charts": "fast-ingest",
+    "deezer_genres": "fast-ingest",
+    # a whole catalogue per run, rarely superseded
+    "deezer_albums": "archive",
+    "spotify_search": "fast-ingest",
+    "spotify_tracks": "archive",
+    # refreshed statistics supersede rows often; compaction archives them
+    "youtube_videos": "fast-ingest",
+    "youtube_search": "fast-ingest",
+    "youtube_videos_clean": "fast-ingest",
+}
+COMPACTION_PROFILE = "archive"
+
+PARTITION_COLUMN = "ingest_date"
+# Datasets partitioned on one of their own columns instead of ingest date.
+# The column stays inside the files too, so readers that ignore the path
+# still see it.
+PARTITION_COLUMNS = {
+    "youtube_search": "genre",
+}
+MANIFEST_NAME = "_manifest.json"
+# Single-object files written before the datasets were partitioned land in
+# this partition when migrated, so they sort before any real ingest date.
+LEGACY_INGEST_DATE = "1970-01-01"
+LEGACY_PART_NAME = "part-00000000T000000000000-legacy.parquet"
+# Per-partition objects that predate a dataset, e.g. youtube_search_pop.parquet
+LEGACY_PREFIXES = {
+    "youtube_search": "youtube_search_",
+}
+
+
+def partition_column(dataset):
+    return PARTITION_COLUMNS.get(dataset, PARTITION_COLUMN)
+
+
+def partition_prefix(dataset, value):
+    # Values like "r&b" or "hip hop" are percent-encoded, as hive paths expect
+    return f"{dataset}/{partition_column(dataset)}={quote(str(value), safe='')}/"
+
+
+def new_part_name(stamp=None):
+    # Part names sort by write time, so key order within a partition is
+    # also ingest order.
+    stamp = stamp or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return f"part-{stamp}-{uuid.uuid4().hex[:8]}.parquet"
+
+
+def part_stamp(key):
+    return key.rsplit("/", 1)[-1].split("-")[1]
+
+
+def partition_of(key):
+    return key.rsplit("/", 2)[-2]
+
+
+def dataset_glob(storage, dataset):
+    return storage.uri(f"{dataset}/*/*.parquet")
+
+
+def save_frame(storage, key, df, format="parquet", profile=DEFAULT_PROFILE, key_columns=()):
+    """Write a DataFrame as one object; returns the bytes written."""
+    if format == "parquet":
+        profile = get_profile(profile)
+        df = profile.prepare(df, key_columns)
+        return stream_frame(storage, key, df, profile.row_group_size, **profile.writer_options(df, key_columns))
+    data = df.to_csv(index=False).encode()
+    storage.write(key, data, content_type="text/csv")
+    return len(data)
+
+
+def load_frame(storage, key, columns=None, filters=None):
+    """Read one Parquet object, or an empty DataFrame if it does not exist."""
+    try:
+        return read_parquet(storage, key, columns, filters)
+    except FileNotFoundError:
+        logger.info(f"No existing {key} found in {storage.name} storage; starting fresh")
+        return pd.DataFrame()
+
+
+def manifest_key(dataset):
+    return f"{dataset}/{MANIFEST_NAME}"
+
+
+def read_manifest(storage, dataset):
+    """Per-partition summary of a dataset ({"partitions": {value: {...}}}), or {} if none."""
+    try:
+        return json.loads(storage.read(manifest_key(dataset)))
+    except FileNotFoundError:
+        return {}
+
+
+def update_manifest(storage, dataset, partitions):
+    """Merge partition entries into the dataset manifest and write it back."""
+    manifest = read_manifest(storage, dataset)
+    merged = manifest.setdefault("partitions", {})
+    for value, entry in partitions.items():
+        merged.setdefault(value, {}).update(entry)
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+    storage.write(manifest_key(dataset), json.dumps(manifest, indent=2, sort_keys=True).encode(),
+                  content_type="application/json")
+    return manifest
+
+
+def key_index(storage, dataset):
+    key_columns = DATASET_KEYS[dataset]
+    return KeyIndex(storage, dataset, key_columns, lambda: read_dataset(storage, dataset, columns=key_columns))
+
+
+def legacy_objects(storage, dataset):
+    keys = [f"{dataset}.parquet"] if storage.exists(f"{dataset}.parquet") else []
+    prefix = LEGACY_PREFIXES.get(dataset)
+    if prefix:
+        keys += [obj.key for obj in storage.list(prefix) if "/" not in obj.key and obj.key.endswith(".parquet")]
+    return keys
+
+
+def migrate_legacy_object(storage, dataset):
+    """Move a dataset's pre-partitioning objects into its partitioned layout.
+
+    Called by every reader and writer of the layout before it lists parts,
+    so old history is visible from the first run, not only after the weekly
+    compaction. A no-op (one existence check) once the objects are gone.
+    """
+    legacy_keys = legacy_objects(storage, dataset)
+    if not legacy_keys:
+        return None
+    key_columns = DATASET_KEYS[dataset]
+    if dataset not in PARTITION_COLUMNS:
+        target = partition_prefix(dataset, LEGACY_INGEST_DATE) + LEGACY_PART_NAME
+        storage.copy(legacy_keys[0], target)
+        storage.delete(legacy_keys[0])
+        # Deleted first: rebuilding a missing index lists parts, which migrates again
+        key_index(storage, dataset).add(load_frame(storage, target, columns=key_columns))
+        logger.info(f"Migrated {legacy_keys[0]} to {target}")
+        return target
+
+    # Split the old objects by the partition column; they carry it as data
+    column = PARTITION_COLUMNS[dataset]
+    legacy = pd.concat([load_frame(storage, key) for key in legacy_keys], ignore_index=True)
+    legacy = legacy.drop_duplicates(subset=key_columns)
+    targets = []
+    for value, rows in legacy.groupby(column, sort=True):
+        target = partition_prefix(dataset, value) + LEGACY_PART_NAME
+        save_frame(storage, target, rows, profile=COMPACTION_PROFILE, key_columns=key_columns)
+        targets.append(target)
+    for key in legacy_keys:
+        storage.delete(key)
+    key_index(storage, dataset).add(legacy)
+    logger.info(f"Migrated {legacy_keys} to {len(targets)} {column} partitions of {dataset}")
+    return targets
+
+
+def append_partition(storage, dataset, df, partition=None, skip_seen=True):
+    """Write df as a new part of dataset and record its keys in the key index.
+
+    partition is the ingest date (today by default), or the partition
+    column's value for datasets in PARTITION_COLUMNS. With skip_seen, rows
+    whose key was written before (or repeats within df) are dropped first,
+    so the earliest row per key is kept. Pass skip_seen=False where the
+    newest row should win, such as refreshed statistics or Deezer
+    catalogue data; readers keep the last row per key.
+    """
+    if df is None or df.empty:
+        logger.warning(f"Nothing to append to {dataset}, DataFrame is empty")
+        return None
+    migrate_legacy_object(storage, dataset)
+    index = key_index(storage, dataset)
+    if skip_seen:
+        batch_rows = len(df)
+        df = df.drop_duplicates(subset=index.key_columns)
+        df = df[~index.contains(df)]
+        if len(df) < batch_rows:
+            logger.info(f"Skipped {batch_rows - len(df)} already-seen rows for {dataset}")
+        if df.empty:
+            return None
+    if partition is None:
+        if dataset in PARTITION_COLUMNS:
+            raise ValueError(f"{dataset} is partitioned by {partition_column(dataset)}; pass partition=")
+        partition = datetime.now(timezone.utc).date().isoformat()
+    key = partition_prefix(dataset, partition) + new_part_name()
+    size = save_frame(storage, key, df, profile=DATASET_PROFILES.get(dataset, DEFAULT_PROFILE),
+                      key_columns=index.key_columns)
+    # Index after the data: a crash in between only leaves a duplicate row,
+    # which readers drop; never a key marked seen without its row.
+    index.add(df)
+    logger.info(f"Appended {len(df)} rows ({size} bytes) to {dataset} as {key}")
+    return key
+
+
+def list_parts(storage, dataset):
+    migrate_legacy_object(storage, dataset)
+    return [obj.key for obj in storage.list(f"{dataset}/") if obj.key.endswith(".parquet")]
+
+
+def read_parts(storage, keys, columns=None, filters=None):
+    filesystem = arrow_filesystem(storage)
+    return [read_parquet(storage, key, columns, filters, filesystem) for key in keys]
+
+
+def read_dataset(storage, dataset, columns=None, filters=None):
+    """Read every part of a bronze dataset, newest row per key.
+
+    Only the requested columns (plus the key columns) are fetched, using
+    range reads. Filters are applied per part before deduplication, so they
+    should only reference key columns; otherwise an older row can win over
+    a newer one that was filtered out.
+    """
+    return read_dataset_parts(storage, dataset, list_parts(storage, dataset), columns, filters)
+
+
+def read_partition(storage, dataset, value, columns=None, filters=None):
+    """Like read_dataset, but only the parts of one partition.
+
+    After compaction a partition is a single object, so this is one footer
+    read plus the requested column chunks.
+    """
+    migrate_legacy_object(storage, dataset)
+    keys = [obj.key for obj in storage.list(partition_prefix(dataset, value)) if obj.key.endswith(".parquet")]
+    return read_dataset_parts(storage, dataset, keys, columns, filters)
+
+
+def read_dataset_parts(storage, dataset, keys, columns=None, filters=None):
+    """Newest row per key across the given parts of dataset."""
+    if not keys:
+        logger.info(f"No parts found for {dataset}; starting fresh")
+        return pd.DataFrame()
+    key_columns = DATASET_KEYS[dataset]
+    if columns is not None:
+        columns = list(dict.fromkeys(key_columns + list(columns)))
+    frames = [frame for frame in read_parts(storage, keys, columns, filters) if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=key_columns, keep="last")
+    logger.info(f"Loaded {dataset} from {len(keys)} parts: shape={df.shape}")
+    return df.reset_index(drop=True)
@@ -0,0 +1,109 @@
+import logging
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "_index/keys.npy"
+
+
+def _sorted_unique(values):
+    # np.sort plus a neighbour compare; much faster than np.unique here
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+
+def _lookup(keys, values):
+    """Insertion positions of values in the sorted keys array, and which are present."""
+    pos = np.searchsorted(keys, values)
+    if not len(keys):
+        return pos, np.zeros(len(values), dtype=bool)
+    return pos, keys[pos.clip(max=len(keys) - 1)] == values
+
+
+class KeyIndex:
+    """Sorted array of every key already written to a bronze dataset.
+
+    Stored next to the data as <dataset>/_index/keys.npy. Keys are reduced
+    to a 64-bit hash of the key columns (pandas hash_pandas_object), so a
+    lookup costs 8 bytes per stored key and O(batch * log(history)) time
+    instead of reading and deduplicating the rows themselves. The chance of
+    any collision stays below 1e-5 up to ~10M keys, and a collision only
+    means one new row is wrongly treated as seen.
+
+    The index is derived data: when it is missing or unreadable it is
+    rebuilt from the dataset's key columns, and compaction merges its keys
+    in. There is no lock; add and merge re-read the stored index just
+    before saving, so a writer that saved meanwhile (an ingest during
+    compaction, say) is only lost if it lands in that read-modify-write
+    window.
+    """
+
+    def __init__(self, storage, dataset, key_columns, read_keys):
+        self.storage = storage
+        self.dataset = dataset
+        self.key_columns = list(key_columns)
+        # returns the dataset's stored key columns; used to rebuild
+        self.read_keys = read_keys
+        self.object_key = f"{dataset}/{INDEX_NAME}"
+        self._keys = None
+
+    def key_values(self, df):
+        return pd.util.hash_pandas_object(df[self.key_columns], index=False, categorize=False).to_numpy(dtype=np.uint64)
+
+    def _read_stored(self):
+        """The saved index, or None when it is missing or unreadable."""
+        try:
+            return np.load(BytesIO(self.storage.read(self.object_key)), allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Unreadable key index for {self.dataset} ({e})")
+            return None
+
+    def load(self):
+        if self._keys is None:
+            stored = self._read_stored()
+            self._keys = stored if stored is not None else self.rebuild()
+        return self._keys
+
+    def contains(self, df):
+        """Boolean mask of the rows whose key is already in the index."""
+        return _lookup(self.load(), self.key_values(df))[1]
+
+    def add(self, df):
+        # Not the cached copy: another writer may have saved since it was read
+        self._keys = None
+        keys = self.load()
+        values = _sorted_unique(self.key_values(df))
+        pos, found = _lookup(keys, values)
+        # sorted insert of the new keys; linear, unlike re-sorting everything
+        self._save(np.insert(keys, pos[~found], values[~found]))
+
+    def rebuild(self, df=None):
+        """Recompute the index from the stored rows (or from df if given) and save it."""
+        if df is None:
+            df = self.read_keys()
+        values = self.key_values(df) if not df.empty else np.array([], dtype=np.uint64)
+        keys = _sorted_unique(values)
+        self._save(keys)
+        logger.info(f"Rebuilt key index for {self.dataset}: {len(keys)} keys")
+        return keys
+
+    def merge(self, df):
+        """Like rebuild(df), but keeps the keys already saved, such as ones appended after df was read."""
+        stored = self._read_stored()
+        if stored is None:
+            return self.rebuild(df)
+        keys = _sorted_unique(np.concatenate([stored, self.key_values(df)]))
+        self._save(keys)
+        logger.info(f"Merged {len(keys) - len(stored)} keys into the key index for {self.dataset}")
+        return keys
+
+    def _save(self, keys):
+        buffer = BytesIO()
+        np.save(buffer, keys, allow_pickle=False)
+        self.storage.write(self.object_key, buffer.getvalue())
+        self._keys = keys
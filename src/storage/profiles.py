@@ -0,0 +1,70 @@
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from src.storage.streaming import PARQUET_ROW_GROUP_SIZE
+
+load_dotenv()
+
+PARQUET_ARCHIVE_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ARCHIVE_ROW_GROUP_SIZE", str(1024 * 1024)))
+
+
+@dataclass(frozen=True)
+class WriterProfile:
+    """Named set of Parquet writer options.
+
+    Dictionaries are per column chunk, so a column is dictionary-encoded
+    when its first row group's worth of rows has at most dictionary_ratio
+    distinct values (genre, query, artist, genre_id, ...); the rest are
+    written plain instead of first trying a dictionary that overflows.
+    statistics is "all" or "keys" (min/max only on key columns, which is
+    what filter pushdown on our readers uses).
+    """
+
+    name: str
+    compression: str
+    row_group_size: int
+    compression_level: int = None
+    sort_by_key: bool = False
+    statistics: str = "all"
+    dictionary_ratio: float = 0.5
+
+    def prepare(self, df, key_columns=()):
+        if self.sort_by_key and key_columns and len(df) > 1:
+            # stable, so rows sharing a key keep their order (the last one wins on read)
+            df = df.sort_values(list(key_columns), kind="stable", ignore_index=True)
+        return df
+
+    def dictionary_columns(self, df):
+        sample = df.head(self.row_group_size)
+        limit = max(1, self.dictionary_ratio * len(sample))
+        return [column for column in sample.columns if sample[column].nunique() <= limit]
+
+    def writer_options(self, df, key_columns=()):
+        options = {
+            "compression": self.compression,
+            "use_dictionary": self.dictionary_columns(df),
+            "write_statistics": True if self.statistics == "all" else list(key_columns),
+        }
+        if self.compression_level is not None:
+            options["compression_level"] = self.compression_level
+        return options
+
+
+PROFILES = {
+    # small per-run parts: cheap to encode, read back once at compaction
+    "fast-ingest": WriterProfile("fast-ingest", "snappy", PARQUET_ROW_GROUP_SIZE, statistics="keys"),
+    # compacted and rarely rewritten data: smaller files, sorted for pruning
+    "archive": WriterProfile("archive", "zstd", PARQUET_ARCHIVE_ROW_GROUP_SIZE, sort_by_key=True),
+}
+DEFAULT_PROFILE = "fast-ingest"
+
+
+def get_profile(profile=DEFAULT_PROFILE):
+    if isinstance(profile, WriterProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown Parquet writer profile {profile!r}; expected one of {sorted(PROFILES)}") from None
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+STAGE_MANIFEST_PREFIX = "_stages"
+SKIPPED = "skipped: inputs unchanged"
+
+
+def manifest_key(stage):
+    return f"{STAGE_MANIFEST_PREFIX}/{stage}.json"
+
+
+def object_fingerprints(storage, prefixes):
+    """{key: etag} of every Parquet object under the given prefixes."""
+    return {
+        obj.key: obj.etag
+        for prefix in prefixes
+        for obj in storage.list(prefix)
+        if obj.key.endswith(".parquet")
+    }
+
+
+def file_fingerprints(root, extensions=(".sql", ".yml", ".yaml")):
+    """{relative path: sha256} of the files under root, e.g. a dbt project."""
+    fingerprints = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in ("target", "logs", "dbt_packages"))
+        for filename in sorted(filenames):
+            if filename.endswith(extensions):
+                path = os.path.join(dirpath, filename)
+                with open(path, "rb") as f:
+                    fingerprints[os.path.relpath(path, root)] = hashlib.sha256(f.read()).hexdigest()
+    return fingerprints
+
+
+def inputs_digest(fingerprints):
+    return hashlib.sha256(json.dumps(fingerprints, sort_keys=True).encode()).hexdigest()
+
+
+def read_stage_manifest(storage, stage):
+    try:
+        return json.loads(storage.read(manifest_key(stage)))
+    except FileNotFoundError:
+        return {}
+
+
+def inputs_unchanged(storage, stage, digest):
+    return read_stage_manifest(storage, stage).get("digest") == digest
+
+
+def record_stage_inputs(storage, stage, fingerprints):
+    """Remember what a stage just processed; call only after it succeeded."""
+    manifest = {
+        "stage": stage,
+        "digest": inputs_digest(fingerprints),
+        "inputs": len(fingerprints),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "fingerprints": fingerprints,
+    }
+    storage.write(manifest_key(stage), json.dumps(manifest, indent=2, sort_keys=True).encode(),
+                  content_type="application/json")
+    logger.info(f"Recorded {len(fingerprints)} inputs for stage {stage}: {manifest['digest'][:12]}")
+    return manifest
+
+
+def stage_metadata(fingerprints, skipped):
+    return {
+        "skipped": skipped,
+        "result": SKIPPED if skipped else "ran",
+        "inputs": len(fingerprints),
+        "inputs_digest": inputs_digest(fingerprints),
+    }
@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "65536"))
+
+
+class _Pipe:
+    """Blocking in-memory pipe between the Parquet writer and the storage upload.
+
+    write() blocks while more than max_buffer bytes are waiting, and read(n)
+    blocks until n bytes are available or the writer has closed. Handing the
+    uploader whole parts avoids the minio client's byte-by-byte part
+    concatenation, and the bound keeps memory at roughly one part.
+    """
+
+    def __init__(self, max_buffer):
+        self.max_buffer = max_buffer
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._eof = False
+        self._error = None
+
+    # Writer side, wrapped in pa.PythonFile
+    def write(self, data):
+        with self._cond:
+            while len(self._buffer) >= self.max_buffer and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            self._buffer += data
+            self.bytes_written += len(data)
+            self._cond.notify_all()
+        return len(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._eof
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    # Reader side, consumed by StorageBackend.write_stream
+    def read(self, size=-1):
+        with self._cond:
+            while self._error is None and not self._eof and (size < 0 or len(self._buffer) < size):
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            size = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._cond.notify_all()
+        return data
+
+    def fail(self, error):
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+
+class ParquetObjectWriter:
+    """Writes a Parquet file straight into storage without buffering it.
+
+    Row groups are encoded by a pyarrow ParquetWriter into a bounded pipe
+    that storage.write_stream drains from a background thread. On MinIO that
+    is a multipart upload, so memory stays around (parallel_uploads + 2) *
+    part_size however large the object gets. Use as a context manager; an
+    exception inside the block aborts the upload instead of completing it.
+    """
+
+    def __init__(self, storage, key, schema, content_type="application/octet-stream", **writer_kwargs):
+        self.key = key
+        self.storage = storage
+        self.num_rows = 0
+        self._upload_error = None
+        self._pipe = _Pipe(storage.stream_read_size)
+        self._thread = threading.Thread(
+            target=self._upload, args=(content_type,), name=f"storage-upload-{key}", daemon=True,
+        )
+        self._thread.start()
+        self._writer = pq.ParquetWriter(pa.PythonFile(self._pipe, mode="w"), schema, **writer_kwargs)
+
+    def _upload(self, content_type):
+        try:
+            self.storage.write_stream(self.key, self._pipe, content_type=content_type)
+        except Exception as e:
+            self._upload_error = e
+            # unblock the writer so the caller sees the failure
+            self._pipe.fail(IOError(f"Upload of {self.key} failed: {e}"))
+
+    @property
+    def bytes_written(self):
+        return self._pipe.bytes_written
+
+    def write_table(self, table, row_group_size=PARQUET_ROW_GROUP_SIZE):
+        self._writer.write_table(table, row_group_size=row_group_size)
+        self.num_rows += table.num_rows
+
+    def write_batch(self, batch):
+        self._writer.write_batch(batch)
+        self.num_rows += batch.num_rows
+
+    def close(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            finally:
+                self._writer = None
+                self._pipe.close()
+                self._thread.join()
+        if self._upload_error is not None:
+            raise self._upload_error
+        logger.info(f"Streamed {self.num_rows} rows ({self.bytes_written} bytes) to {self.storage.name}:{self.key}")
+
+    def abort(self, error=None):
+        self._pipe.fail(error or IOError(f"Upload of {self.key} aborted"))
+        self._thread.join()
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.abort(exc)
+            return False
+        self.close()
+        return False
+
+
+def stream_frame(storage, key, df, row_group_size=PARQUET_ROW_GROUP_SIZE, **kwargs):
+    """Stream a DataFrame to storage as Parquet; returns the bytes written.
+
+    The frame is converted one row group at a time, so neither a full Arrow
+    copy nor a serialized copy of the file is ever held in memory.
+    """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with ParquetObjectWriter(storage, key, schema, **kwargs) as writer:
+        for start in range(0, len(df), row_group_size):
+            chunk = df.iloc[start:start + row_group_size]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), row_group_size)
+    return writer.bytes_written
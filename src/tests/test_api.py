@@ -1,10 +1,15 @@
 import pandas as pd
+import pyarrow.parquet as pq
 from unittest.mock import patch, MagicMock
 from io import BytesIO
+from dagster import build_op_context
 
-from src.ingestion.youtubeapi import search_videos, merge_search_tables, upload_to_minio
-from src.ingestion.spotifyapi import get_spotify_token
-from src.ingestion.deezerapi import deezer_request
+from src.ingestion.youtubeapi import search_videos, merge_search_tables, youtube_search_op
+from src.ingestion.spotifyapi import get_spotify_token, get_album_tracks_batched, SpotifyTokenProvider, spotify_request
+from src.ingestion.columnar import ColumnarBuilder, DEEZER_TRACK_SCHEMA, SPOTIFY_TRACK_SCHEMA
+from src.ingestion.deezerapi import deezer_request, fetch_genre_tracks
+from src.storage.backends import MemoryBackend
+from src.storage.datasets import append_partition, list_parts, read_manifest, save_frame
 
 
 def test_search_videos():
@@ -14,25 +19,32 @@ def test_search_videos():
             "items": [{"id": {"videoId": "abc"}}, {"id": {"videoId": "def"}}]
         }
 
-        # Prepare a small DataFrame and convert to Parquet bytes
-        cached_df = pd.DataFrame({"video_id": ["x", "y"]})
-        parquet_buffer = BytesIO()
-        cached_df.to_parquet(parquet_buffer, index=False)
-        parquet_buffer.seek(0)
-
-        # Mock MinIO client to return Parquet bytes
-        mock_minio_client = MagicMock()
-        mock_minio_client.get_object.return_value.read.return_value = parquet_buffer.read()
+        # Results cached by an earlier run
+        storage = MemoryBackend()
+        cached_df = pd.DataFrame({"video_id": ["x", "y"], "genre": "pop"})
+        append_partition(storage, "youtube_search", cached_df, partition="pop")
 
         # Call search_videos
         df, _, _ = search_videos(
             youtube=mock_youtube,
-            search_queries=["pop"],
+            search_queries=["pop", "jazz"],
             max_results_per_query=2,
-            minio_client=mock_minio_client
+            storage=storage
         )
 
         assert set(df["video_id"]) == {"x", "y", "abc", "def"}
+        assert len(list_parts(storage, "youtube_search")) == 3
+        assert read_manifest(storage, "youtube_search")["partitions"]["pop"]["rows"] == 4
+        # jazz had nothing cached; its partition is read on its own and starts fresh
+        assert read_manifest(storage, "youtube_search")["partitions"]["jazz"]["rows"] == 2
+
+
+def test_youtube_search_op_counts_only_reused_genres():
+    # two of the twelve genres came back from youtube_videos_op
+    search_results = [pd.DataFrame({"video_id": ["a"], "genre": "pop"}), pd.DataFrame({"video_id": ["b"], "genre": "jazz"})]
+    output = next(youtube_search_op(build_op_context(), search_results=search_results))
+    assert output.metadata["search_calls_saved"].value == 2
+    assert output.metadata["quota_units_saved"].value == 200
 
 
 def merge_search_tables(df1, df2):
@@ -42,18 +54,18 @@ def merge_search_tables(df1, df2):
     return all_data_list.drop_duplicates()
 
 
-def test_upload_to_minio():
-    with patch("src.ingestion.youtubeapi.Minio") as MockMinio:
-        mock_instance = MockMinio.return_value
-        df = pd.DataFrame({"video_id": ["x"]})
+def test_save_frame():
+    storage = MemoryBackend()
+    df = pd.DataFrame({"video_id": ["x"]})
 
-        # Pass the mocked client explicitly
-        upload_to_minio(df=df, filename="test.parquet", minio_client=mock_instance)
+    save_frame(storage, "test.parquet", df)
 
-        mock_instance.put_object.assert_called()
+    assert storage.exists("test.parquet")
+    assert pd.read_parquet(BytesIO(storage.read("test.parquet"))).equals(df)
 
 def test_get_spotify_token():
-    with patch("src.ingestion.spotifyapi.requests.post") as mock_post:
+    with patch("src.ingestion.spotifyapi.get_http_client") as mock_client:
+        mock_post = mock_client.return_value.post
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = {"access_token": "token123"}
         mock_post.return_value.text = '{"access_token": "token123"}'
@@ -63,8 +75,104 @@ def test_get_spotify_token():
         assert token == "token123"
 
 def test_deezer_request():
-    with patch("src.ingestion.deezerapi.requests.get") as mock_get:
+    with patch("src.ingestion.deezerapi.get_http_client") as mock_client:
+        mock_get = mock_client.return_value.get
         mock_get.return_value.status_code = 200
         mock_get.return_value.json.return_value = {"data": "ok"}
         result = deezer_request("http://test.url")
-        assert result == {"data": "ok"}
\ No newline at end of file
+        assert result == {"data": "ok"}
+        # three attempts in all: the first plus two retries
+        assert mock_get.call_args.kwargs["retries"] == 2
+
+def test_fetch_genre_tracks_keeps_order():
+    def fake_request(url):
+        if "/genre/" in url:
+            gid = int(url.split("/genre/")[1].split("/")[0])
+            return {"data": [{"id": gid * 10 + i} for i in range(3)]}
+        aid = int(url.split("/artist/")[1].split("/")[0])
+        return {"data": [{"id": aid * 10 + n, "title": "t", "artist": {"name": "a"},
+                          "album": {"title": "b"}, "link": "l", "duration": 1} for n in range(2)]}
+
+    with patch("src.ingestion.deezerapi.deezer_request", side_effect=fake_request):
+        df = fetch_genre_tracks([1, 2], max_workers=4)
+
+    assert df["id"].tolist() == [100, 101, 110, 111, 120, 121, 200, 201, 210, 211, 220, 221]
+    assert df["genre_id"].tolist() == [1] * 6 + [2] * 6
+
+
+def test_get_album_tracks_batched_uses_multi_album_endpoint():
+    album_ids = [f"a{i}" for i in range(25)]
+
+    def fake_request(url, token=None):
+        ids = url.split("ids=")[1].split("&")[0].split(",")
+        albums = []
+        for aid in ids:
+            total = 60 if aid == "a3" else 2
+            items = [{"id": f"{aid}-t{n}"} for n in range(min(total, 50))]
+            albums.append({"id": aid, "tracks": {"items": items, "total": total}})
+        return {"albums": albums}
+
+    with patch("src.ingestion.spotifyapi.spotify_request", side_effect=fake_request) as mock_request, \
+         patch("src.ingestion.spotifyapi.get_album_tracks", return_value=[{"id": "long"}] * 10) as mock_paginate:
+        tracks = get_album_tracks_batched(album_ids, "token")
+
+    assert mock_request.call_count == 2
+    # the embedded first page is kept; only the rest is fetched
+    mock_paginate.assert_called_once_with("a3", "token", "US", offset=50)
+    assert len(tracks["a3"]) == 60 and tracks["a3"][49]["id"] == "a3-t49"
+    assert [t["id"] for t in tracks["a0"]] == ["a0-t0", "a0-t1"]
+
+
+def test_spotify_token_provider_caches_and_shares_token(tmp_path):
+    cache_path = str(tmp_path / "token.json")
+    fetch = MagicMock(side_effect=[{"access_token": "first", "expires_in": 3600},
+                                   {"access_token": "second", "expires_in": 3600}])
+    provider = SpotifyTokenProvider(fetch, cache_path=cache_path, refresh_margin=60)
+
+    assert provider.get_token() == "first"
+    assert provider.get_token() == "first"
+    assert fetch.call_count == 1
+
+    # A second process picks the token up from the shared file
+    other = SpotifyTokenProvider(MagicMock(), cache_path=cache_path)
+    assert other.get_token() == "first"
+
+    # Within the refresh margin the token is renewed
+    with patch("src.ingestion.spotifyapi.time.time", return_value=provider._expires_at - 30):
+        assert provider.get_token() == "second"
+
+
+def test_spotify_request_refreshes_token_once_on_401():
+    rejected, ok = MagicMock(status_code=401, text="expired"), MagicMock(status_code=200)
+    ok.json.return_value = {"items": []}
+    with patch("src.ingestion.spotifyapi.get_http_client") as mock_client, \
+         patch("src.ingestion.spotifyapi.spotify_tokens") as mock_tokens:
+        mock_client.return_value.get.side_effect = [rejected, ok]
+        mock_tokens.get_token.return_value = "fresh"
+        result = spotify_request("https://api.spotify.com/v1/search?q=pop", "stale")
+
+    assert result == {"items": []}
+    mock_tokens.invalidate.assert_called_once_with("stale")
+    assert mock_client.return_value.get.call_args.kwargs["headers"] == {"Authorization": "Bearer fresh"}
+
+
+def test_columnar_builder_types_and_row_groups(tmp_path):
+    sink = str(tmp_path / "tracks.parquet")
+    builder = ColumnarBuilder(DEEZER_TRACK_SCHEMA, chunk_size=2, sink=sink)
+    for i in range(5):
+        builder.append(i, f"t{i}", "artist", "album", "link", None if i == 3 else 200)
+    builder.close()
+
+    parquet_file = pq.ParquetFile(sink)
+    assert parquet_file.schema_arrow == DEEZER_TRACK_SCHEMA
+    assert parquet_file.metadata.num_row_groups == 3
+    assert parquet_file.read().column("duration").null_count == 1
+
+    builder = ColumnarBuilder(SPOTIFY_TRACK_SCHEMA)
+    builder.append("t1", "name", "artist", "album", "2024", 1000, None, "pop")
+    builder.append("t2", "name", "artist", "album", "2024", 1000, 42, "pop")
+    popularity = builder.to_pandas()["popularity"]
+    assert popularity.dtype == "Int64" and popularity.isna().tolist() == [True, False]
+
+    df = ColumnarBuilder(DEEZER_TRACK_SCHEMA).to_pandas()
+    assert df.empty and list(df.columns) == DEEZER_TRACK_SCHEMA.names
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from src.duckdb.engine import connect, ensure_extensions
+from src.duckdb.minio_to_duckdb import read_table
+from src.storage.backends import LocalBackend
+from src.storage.datasets import append_partition
+
+
+def test_connect_applies_limits_and_skips_installed_extensions(tmp_path):
+    con = connect(str(tmp_path / "music.duckdb"), extensions=["parquet"], memory_limit="256MB", threads=2,
+                  temp_directory=str(tmp_path / "spill"))
+    settings = dict(con.execute(
+        "SELECT name, value FROM duckdb_settings() WHERE name IN ('memory_limit', 'threads', 'temp_directory')"
+    ).fetchall())
+    assert settings["threads"] == "2" and settings["temp_directory"] == str(tmp_path / "spill")
+    assert settings["memory_limit"].startswith("244")  # 256 MB in MiB
+    # parquet is already installed (or built in), so nothing is downloaded again
+    assert ensure_extensions(con, ["parquet"]) == []
+
+
+def test_read_table_as_view_or_table(tmp_path):
+    storage = LocalBackend(tmp_path / "lake")
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["a", "b"], "popularity": [1, 2]}))
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["b"], "popularity": [5]}), skip_seen=False)
+    con = connect(str(tmp_path / "music.duckdb"))
+
+    def kind():
+        return con.execute("SELECT table_type FROM information_schema.tables WHERE table_name = 'spotify_tracks'").fetchone()[0]
+
+    assert read_table(con, storage, "spotify_tracks", "view") is None and kind() == "VIEW"
+    assert con.execute("SELECT * FROM spotify_tracks ORDER BY track_id").fetchall() == [("a", 1), ("b", 5)]
+
+    assert read_table(con, storage, "spotify_tracks") == 2 and kind() == "BASE TABLE"
+    assert read_table(con, storage, "spotify_tracks", "view") is None and kind() == "VIEW"
+
+
+def test_youtube_search_keeps_the_genre_searched_first(tmp_path):
+    storage = LocalBackend(tmp_path / "lake")
+    for genre in ["hip hop", "pop", "r&b"]:
+        append_partition(storage, "youtube_search", pd.DataFrame({"video_id": ["v1", genre], "genre": genre}), partition=genre)
+    con = connect(str(tmp_path / "music.duckdb"))
+
+    assert read_table(con, storage, "youtube_search") == 4
+    assert con.execute("SELECT genre FROM youtube_search WHERE video_id = 'v1'").fetchone()[0] == "pop"
@@ -0,0 +1,90 @@
+import requests
+from unittest.mock import patch
+
+from src.ingestion.http_cache import ResponseCache
+from src.ingestion.http_client import HttpClient, endpoint_key
+
+
+def make_response(status, body=b"{}", headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    response.headers.update(headers or {})
+    return response
+
+
+def test_endpoint_key_collapses_ids():
+    assert endpoint_key("https://api.deezer.com/artist/123/top?limit=50") == "api.deezer.com/artist/{id}/top"
+    assert endpoint_key("https://api.spotify.com/v1/albums/4aawyAB9vmqN3uQ7FjRGTy/tracks") == \
+        "api.spotify.com/v1/albums/{id}/tracks"
+
+
+def test_request_honours_retry_after_and_counts_stats():
+    client = HttpClient(max_retries=2, backoff_factor=0)
+    responses = [make_response(429, headers={"Retry-After": "7"}), make_response(200, b'{"ok": true}')]
+
+    with patch.object(client.session, "request", side_effect=responses) as mock_request, \
+         patch("src.ingestion.http_client.time.sleep") as mock_sleep:
+        response = client.get("https://api.spotify.com/v1/search?q=pop")
+
+    assert response.status_code == 200
+    assert mock_request.call_count == 2
+    assert mock_request.call_args.kwargs["timeout"] == (5, 30)
+    mock_sleep.assert_called_once_with(7.0)
+    stats = client.stats()["api.spotify.com/v1/search"]
+    assert stats["requests"] == 2
+    assert stats["retries"] == 1
+    assert stats["errors"] == 1
+    assert stats["bytes"] == len(b"{}") + len(b'{"ok": true}')
+
+
+def test_request_returns_last_response_when_retries_run_out():
+    client = HttpClient(max_retries=1, backoff_factor=0)
+    with patch.object(client.session, "request", return_value=make_response(503)):
+        response = client.get("https://api.deezer.com/chart")
+    assert response.status_code == 503
+    assert client.stats()["api.deezer.com/chart"]["retries"] == 1
+
+
+def test_cache_serves_fresh_entries_and_revalidates_stale_ones(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls=[(r"^api\.deezer\.com/album/", 60)])
+    client = HttpClient(max_retries=0, cache=cache)
+    url = "https://api.deezer.com/album/42/tracks"
+    first = make_response(200, b'{"data": [1]}', headers={"ETag": '"v1"'})
+
+    with patch.object(client.session, "request", side_effect=[first, make_response(304)]) as mock_request:
+        assert client.get(url).json() == {"data": [1]}
+        assert client.get(url).json() == {"data": [1]}
+        assert mock_request.call_count == 1
+
+        with patch("src.ingestion.http_cache.time.time", return_value=cache.get(cache.key_for("GET", url)).expires_at + 1):
+            assert client.get(url).json() == {"data": [1]}
+        assert mock_request.call_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_cache_skips_deezer_errors_sent_as_200(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    client = HttpClient(max_retries=0, cache=cache)
+    url = "https://api.deezer.com/artist/27/top"
+    quota = make_response(200, b'{"error": {"type": "Exception", "message": "Quota limit exceeded", "code": 4}}')
+    ok = make_response(200, b'{"data": [{"id": 3135556}]}')
+
+    with patch.object(client.session, "request", side_effect=[quota, ok, ok]) as mock_request:
+        assert "error" in client.get(url).json()
+        assert client.get(url).json() == {"data": [{"id": 3135556}]}
+        assert client.get(url).json() == {"data": [{"id": 3135556}]}
+        assert mock_request.call_count == 2
+    assert cache.stats()["rejected"] == 1 and cache.stats()["stores"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=25, ttls=[(".", 60)])
+    for name in ["a", "b", "c"]:
+        cache.put(name, f"https://x/{name}", make_response(200, b"0123456789"), ttl=60)
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
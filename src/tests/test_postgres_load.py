@@ -0,0 +1,182 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import duckdb
+import pandas as pd
+import psycopg
+import pytest
+
+from psycopg.errors import LockNotAvailable
+
+from src.duckdb.minio_to_duckdb import load_table
+from src.duckdb.postgres_load import (
+    SNAPSHOT_PREFIX, copy_load, diff_snapshot, incremental_load, merge_sql, postgres_type, rollback_table,
+    save_snapshot,
+)
+from src.storage.backends import LocalBackend
+from src.storage.datasets import append_partition
+
+requires_postgres = pytest.mark.skipif(not os.getenv("POSTGRES_TEST_DSN"),
+                                       reason="set POSTGRES_TEST_DSN to run against a real Postgres")
+
+
+def test_diff_snapshot_and_merge_apply_only_changes():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE tracks AS SELECT * FROM (VALUES ('a', 1, NULL), ('b', 2, 'x'), ('c', 3, 'y')) t(track_id, plays, tag)")
+    assert diff_snapshot(con, "tracks", ["track_id"]) is None
+    save_snapshot(con, "tracks", ["track_id"])
+
+    # the "Postgres" side: same SQL, run against a DuckDB schema
+    con.execute("CREATE SCHEMA bronze")
+    con.execute("CREATE TABLE bronze.tracks (track_id VARCHAR PRIMARY KEY, plays INTEGER, tag VARCHAR)")
+    con.execute("INSERT INTO bronze.tracks SELECT * FROM tracks")
+
+    # a updated, b unchanged (null tag still equal), c deleted, d new
+    con.execute("CREATE OR REPLACE TABLE tracks AS SELECT * FROM (VALUES ('a', 10, NULL), ('b', 2, 'x'), ('d', 4, NULL)) t(track_id, plays, tag)")
+    assert diff_snapshot(con, "tracks", ["track_id"]) == {"inserted": 1, "updated": 1, "deleted": 1}
+
+    con.execute("CREATE TABLE bronze._stage_tracks AS SELECT * FROM _changed_tracks")
+    con.execute("CREATE TABLE bronze._stage_tracks_deleted AS SELECT * FROM _deleted_tracks")
+    con.execute(merge_sql("bronze", "tracks", ["track_id", "plays", "tag"], ["track_id"]))
+    assert con.execute("SELECT * FROM bronze.tracks ORDER BY track_id").fetchall() == \
+        con.execute("SELECT * FROM tracks ORDER BY track_id").fetchall()
+
+    # a new column means the snapshot no longer lines up
+    save_snapshot(con, "tracks", ["track_id"])
+    con.execute("ALTER TABLE tracks ADD COLUMN genre VARCHAR")
+    assert diff_snapshot(con, "tracks", ["track_id"]) is None
+
+
+def test_incremental_load_connects_only_for_a_full_load():
+    con = duckdb.connect()
+    con.execute("ATTACH ':memory:' AS pg")  # stands in for the attached Postgres
+    con.execute("CREATE SCHEMA pg.bronze")
+    con.execute("CREATE TABLE tracks AS SELECT 'id' || range AS track_id, range AS plays FROM range(5)")
+    con.execute("CREATE TABLE pg.bronze.tracks AS SELECT * FROM tracks")
+    save_snapshot(con, "tracks", ["track_id"])
+
+    def refuse():
+        raise AssertionError("incremental loads must not open a COPY connection")
+
+    assert incremental_load(con, "bronze", "tracks", ["track_id"], refuse) == \
+        {"mode": "incremental", "inserted": 0, "updated": 0, "deleted": 0}
+
+
+def test_postgres_type_falls_back_to_text():
+    assert postgres_type("TIMESTAMP_NS") == "timestamp" and postgres_type("DECIMAL(18,3)") == "numeric"
+    assert postgres_type("VARCHAR[]") == "text[]" and postgres_type("BIGINT[][]") is None
+    assert postgres_type("STRUCT(k INTEGER)") is None and postgres_type("MAP(VARCHAR, INTEGER)") is None
+
+
+@requires_postgres
+def test_copy_load_replaces_table_and_adds_key():
+    con = duckdb.connect()
+    con.execute("""
+        CREATE TABLE tracks AS SELECT
+            'id' || range AS track_id, range::INTEGER AS popularity, range % 2 = 0 AS explicit,
+            TIMESTAMP '2024-01-01' + INTERVAL (range) MINUTE AS played_at, ['a', NULL] AS tags,
+            {'k': range} AS extra, CASE WHEN range % 3 = 0 THEN NULL ELSE 'x' END AS note
+        FROM range(2500)
+    """)
+    with psycopg.connect(os.environ["POSTGRES_TEST_DSN"]) as pg:
+        pg.execute("CREATE SCHEMA IF NOT EXISTS bronze")
+        assert copy_load(con, pg, "bronze", "tracks", ["track_id"], batch_rows=1000) == {"mode": "full", "rows": 2500}
+        assert copy_load(con, pg, "bronze", "tracks", ["track_id"]) == {"mode": "full", "rows": 2500}
+
+        assert pg.execute("SELECT count(*), count(note), sum(popularity) FROM bronze.tracks").fetchone() == (2500, 1666, 3123750)
+        assert pg.execute("SELECT tags, extra FROM bronze.tracks WHERE track_id = 'id7'").fetchone() == (["a", None], "{'k': 7}")
+        assert pg.execute("""
+            SELECT a.attname FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = 'bronze.tracks'::regclass AND i.indisprimary
+        """).fetchall() == [("track_id",)]
+        pg.execute("DROP TABLE bronze.tracks, bronze.tracks__previous")
+    assert con.execute(f"SELECT count(*) FROM {SNAPSHOT_PREFIX}tracks").fetchone()[0] == 2500
+    # only the key and a row hash are kept, not a second copy of the rows
+    assert [col[0] for col in con.execute(f"DESCRIBE {SNAPSHOT_PREFIX}tracks").fetchall()] == ["track_id", "_row_hash"]
+
+
+@requires_postgres
+def test_full_load_swaps_in_and_rolls_back():
+    con = duckdb.connect()
+    with psycopg.connect(os.environ["POSTGRES_TEST_DSN"]) as pg:
+        pg.execute("CREATE SCHEMA IF NOT EXISTS bronze")
+        pg.commit()
+
+        def load(plays):
+            con.execute(f"CREATE OR REPLACE TABLE albums AS SELECT range AS album_id, {plays} AS plays FROM range(10)")
+            copy_load(con, pg, "bronze", "albums", ["album_id"])
+
+        def live_plays():
+            return pg.execute("SELECT DISTINCT plays FROM bronze.albums").fetchall()
+
+        load(1)
+        load(2)
+        assert live_plays() == [(2,)]
+        assert pg.execute("SELECT DISTINCT plays FROM bronze.albums__previous").fetchall() == [(1,)]
+        assert pg.execute("SELECT to_regclass('bronze.albums__staging')").fetchone()[0] is None
+        assert pg.execute("SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = 'bronze.albums'::regclass").fetchall() == \
+            [("bronze.albums_pkey",)]
+
+        rollback_table(con, pg, "bronze", "albums")
+        assert live_plays() == [(1,)]
+        assert con.execute(f"SELECT count(*) FROM duckdb_tables() WHERE table_name = '{SNAPSHOT_PREFIX}albums'").fetchone()[0] == 0
+        rollback_table(con, pg, "bronze", "albums")
+        assert live_plays() == [(2,)]
+
+        # a third load replaces the oldest version
+        load(3)
+        assert pg.execute("SELECT DISTINCT plays FROM bronze.albums__previous").fetchall() == [(2,)]
+        pg.execute("DROP TABLE bronze.albums, bronze.albums__previous")
+        pg.commit()
+
+
+@requires_postgres
+def test_swap_waits_for_readers_only_as_long_as_the_lock_timeout():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE albums AS SELECT range AS album_id FROM range(10)")
+    dsn = os.environ["POSTGRES_TEST_DSN"]
+    with psycopg.connect(dsn) as pg, psycopg.connect(dsn) as reader, \
+            patch("src.duckdb.postgres_load.SWAP_LOCK_TIMEOUT", "100ms"):
+        pg.execute("CREATE SCHEMA IF NOT EXISTS bronze")
+        pg.commit()
+        copy_load(con, pg, "bronze", "albums", ["album_id"])
+
+        # a long-running reader: its open transaction keeps a lock on the live table
+        reader.execute("SELECT count(*) FROM bronze.albums")
+        with patch("src.duckdb.postgres_load.time.sleep") as mock_sleep:
+            with pytest.raises(LockNotAvailable):
+                copy_load(con, pg, "bronze", "albums", ["album_id"])
+            assert mock_sleep.call_count == 5
+            assert pg.execute("SELECT to_regclass('bronze.albums__staging')").fetchone()[0] is not None
+
+            mock_sleep.reset_mock(side_effect=True)
+            mock_sleep.side_effect = lambda delay: reader.rollback()
+            copy_load(con, pg, "bronze", "albums", ["album_id"])
+            assert mock_sleep.call_count == 1
+        assert pg.execute("SELECT to_regclass('bronze.albums__staging')").fetchone()[0] is None
+        pg.execute("DROP TABLE bronze.albums, bronze.albums__previous")
+        pg.commit()
+
+
+@requires_postgres
+def test_tables_load_in_parallel_within_connection_cap(tmp_path):
+    storage = LocalBackend(tmp_path / "lake")
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["t1", "t2"], "popularity": [10, 20]}))
+    append_partition(storage, "deezer_charts", pd.DataFrame({"id": [1, 2, 3], "title": ["a", "b", "c"]}))
+    con = duckdb.connect(str(tmp_path / "music.duckdb"))
+    pg_config = {"conninfo": os.environ["POSTGRES_TEST_DSN"]}
+    with psycopg.connect(**pg_config, autocommit=True) as pg:
+        pg.execute("CREATE SCHEMA IF NOT EXISTS bronze")
+
+    tables = ["spotify_tracks", "deezer_charts"]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        loads = dict(zip(tables, pool.map(
+            lambda table: load_table(con, storage, table, "incremental", pg_config, threading.BoundedSemaphore(1)), tables)))
+
+    assert loads["spotify_tracks"]["rows"] == 2 and loads["deezer_charts"]["rows"] == 3
+    assert set(loads["deezer_charts"]) >= {"read_seconds", "pg_wait_seconds", "write_seconds"}
+    with psycopg.connect(**pg_config, autocommit=True) as pg:
+        assert pg.execute("SELECT count(*) FROM bronze.deezer_charts").fetchone()[0] == 3
+        pg.execute("DROP TABLE bronze.spotify_tracks, bronze.deezer_charts")
@@ -0,0 +1,93 @@
+import sys
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.silver.silver import clean_incremental, clean_text, clean_text_column
+from src.storage.backends import MemoryBackend
+from src.storage.datasets import append_partition, list_parts, read_dataset
+
+CORPUS = [
+    "Official Music Video (4K) | #pop #2024",
+    "  leading and trailing\t\n",
+    "Beyoncé – ÇUFF IT 🔥🔥 [Lyrics]",
+    "r&b / hip-hop mix... vol.2!?",
+    "Ｆｕｌｌｗｉｄｔｈ　ｓｐａｃｅ and nbsp line sep\x1cfs",
+    "combining é and ١٢٣ and ² and 日本語のタイトル",
+    "under_score #tag_only ####",
+    "",
+    "   ",
+    None,
+]
+
+
+def test_clean_text_column_matches_clean_text():
+    # every code point Python knows about, 64 to a string, plus the corpus
+    code_points = [cp for cp in range(sys.maxunicode + 1)
+                   if not 0xD800 <= cp <= 0xDFFF and unicodedata.category(chr(cp)) != "Cn"]
+    texts = CORPUS + ["x " + "".join(map(chr, code_points[i:i + 64])) + " y" for i in range(0, len(code_points), 64)]
+    values = pd.Series(texts, dtype="str")
+
+    expected = [clean_text(text) for text in values]
+    cleaned = clean_text_column(values)
+
+    assert [None if pd.isna(v) else v for v in cleaned] == [None if pd.isna(v) else v for v in expected]
+    assert cleaned.isna().tolist() == values.isna().tolist()
+
+
+def test_clean_text_column_keeps_index_and_nulls():
+    values = pd.Series(["a  b", np.nan, "#c!"], index=[10, 20, 30], name="title", dtype=object)
+    cleaned = clean_text_column(values)
+    assert cleaned.index.tolist() == [10, 20, 30] and cleaned.name == "title"
+    assert cleaned.iloc[0] == "a b" and pd.isna(cleaned.iloc[1]) and cleaned.iloc[2] == "c!"
+
+    # concatenated str columns are backed by several Arrow chunks
+    chunked = pd.concat([pd.Series(["a  b", None], dtype="str"), pd.Series(["#c!"], dtype="str")], ignore_index=True)
+    assert clean_text_column(chunked).fillna("<null>").tolist() == ["a b", "<null>", "c!"]
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_incremental_clean_only_processes_new_parts(streaming):
+    storage = MemoryBackend()
+
+    def clean(full_refresh=False):
+        return clean_incremental(storage, full_refresh=full_refresh, streaming=streaming, workers=1)
+
+    append_partition(storage, "youtube_videos", pd.DataFrame({"video_id": ["a", "b"], "title": ["A  #1", "B!"], "views": [1, 2]}))
+    assert clean()["rows"] == 2
+    assert clean()["parts"] == 0
+
+    # a refreshed and a new video arrive in the next ingest, with a new column
+    append_partition(storage, "youtube_videos", pd.DataFrame({"video_id": ["b", "c"], "title": ["B!", "C\n\nc"], "views": [5, 3],
+                                                               "views_prev": [2.0, None]}), skip_seen=False)
+    summary = clean()
+    assert (summary["parts"], summary["rows"]) == (1, 2)
+
+    clean_df = read_dataset(storage, "youtube_videos_clean").sort_values("video_id")
+    assert clean_df["title"].tolist() == ["A 1", "B!", "C c"] and clean_df["views"].tolist() == [1, 5, 3]
+    assert len(list_parts(storage, "youtube_videos_clean")) == 2
+
+    summary = clean(full_refresh=True)
+    assert (summary["parts"], summary["rows"]) == (2, 4 if streaming else 3)
+    assert len(list_parts(storage, "youtube_videos_clean")) == 1
+    clean_df = read_dataset(storage, "youtube_videos_clean").sort_values("video_id")
+    assert clean_df["title"].tolist() == ["A 1", "B!", "C c"] and clean_df["views"].tolist() == [1, 5, 3]
+
+
+def test_streaming_clean_keeps_source_order_across_workers():
+    storage = MemoryBackend()
+    n = 5_000
+    for run in range(2):
+        append_partition(storage, "youtube_videos", pd.DataFrame({
+            "video_id": [f"{i:05d}" for i in range(n)],
+            "title": [f"video  {i} round {run} ✨" for i in range(n)],
+        }), skip_seen=False)
+
+    summary = clean_incremental(storage, workers=2, chunk_rows=700)
+
+    assert summary["rows"] == 2 * n
+    clean_df = read_dataset(storage, "youtube_videos_clean")
+    assert len(clean_df) == n and (clean_df["title"].str.endswith("round 1")).all()
+    assert clean_df["title"].iloc[0] == "video 0 round 1"
@@ -0,0 +1,346 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from minio import Minio
+
+from src.storage.compaction import compact_dataset
+from src.storage.backends import LocalBackend, MemoryBackend, MinioBackend
+from src.storage.datasets import (
+    append_partition, save_frame, key_index, list_parts, migrate_legacy_object, partition_of, read_dataset, read_manifest,
+    read_partition,
+)
+from src.storage.stage_inputs import inputs_digest, inputs_unchanged, object_fingerprints, record_stage_inputs
+from src.storage.streaming import ParquetObjectWriter, stream_frame
+
+
+@pytest.fixture(params=["memory", "local"])
+def storage(request, tmp_path):
+    return MemoryBackend() if request.param == "memory" else LocalBackend(tmp_path)
+
+
+def test_backends_share_semantics(storage):
+    storage.write("a/1.bin", b"0123456789")
+    storage.write("a/b/2.bin", b"x")
+    storage.write("c.bin", b"")
+
+    assert storage.read("a/1.bin", offset=2, length=3) == b"234"
+    assert [(o.key, o.size) for o in storage.list("a/")] == [("a/1.bin", 10), ("a/b/2.bin", 1)]
+    assert [o.key for o in storage.list("a/b")] == ["a/b/2.bin"] and [o.key for o in storage.list("a/1")] == ["a/1.bin"]
+    assert [o.key for o in storage.list("c")] == ["c.bin"] and storage.list("missing/") == []
+    assert storage.exists("c.bin") and not storage.exists("missing.bin")
+    with pytest.raises(FileNotFoundError):
+        storage.read("missing.bin")
+    storage.copy("a/1.bin", "d.bin")
+    storage.delete("a/1.bin")
+    storage.delete("a/1.bin")
+    assert [o.key for o in storage.list()] == ["a/b/2.bin", "c.bin", "d.bin"]
+    writes = storage.stats()["write"]
+    assert (writes["calls"], writes["bytes"]) == (3, 11)
+
+
+def test_local_list_walks_only_the_prefix(tmp_path):
+    storage = LocalBackend(tmp_path)
+    for key in ["youtube_search/genre=pop/p.parquet", "youtube_search_pop.parquet", "spotify_tracks/d=1/p.parquet"]:
+        storage.write(key, b"x")
+
+    # only the root is scanned: no directory there starts with "youtube_search_"
+    with patch("os.scandir", wraps=os.scandir) as mock_scandir:
+        assert [o.key for o in storage.list("youtube_search_")] == ["youtube_search_pop.parquet"]
+    assert mock_scandir.call_count == 1
+    with patch("os.scandir", wraps=os.scandir) as mock_scandir:
+        assert [o.key for o in storage.list("youtube_search/")] == ["youtube_search/genre=pop/p.parquet"]
+    assert [call.args[0] for call in mock_scandir.call_args_list] == \
+        [str(tmp_path / "youtube_search"), str(tmp_path / "youtube_search" / "genre=pop")]
+
+
+def test_stage_inputs_detect_rewritten_and_new_objects(storage):
+    append_partition(storage, "deezer_charts", pd.DataFrame({"id": [1], "title": ["a"]}), "2025-01-01")
+    inputs = object_fingerprints(storage, ["deezer_charts/"])
+    assert list(inputs) == list_parts(storage, "deezer_charts")
+    assert not inputs_unchanged(storage, "load", inputs_digest(inputs))
+
+    record_stage_inputs(storage, "load", inputs)
+    assert inputs_unchanged(storage, "load", inputs_digest(object_fingerprints(storage, ["deezer_charts/"])))
+
+    part = list_parts(storage, "deezer_charts")[0]
+    storage.write(part, pd.DataFrame({"id": [1], "title": ["b"]}).to_parquet())
+    assert not inputs_unchanged(storage, "load", inputs_digest(object_fingerprints(storage, ["deezer_charts/"])))
+
+
+def test_append_and_read_keep_newest_row_per_key(storage):
+    append_partition(storage, "deezer_charts", pd.DataFrame({"id": [1, 2], "title": ["a", "b"]}), "2025-01-01")
+    append_partition(storage, "deezer_charts", pd.DataFrame({"id": [2, 3], "title": ["B", "c"]}), "2025-01-02",
+                     skip_seen=False)
+
+    assert len(list_parts(storage, "deezer_charts")) == 2
+    df = read_dataset(storage, "deezer_charts").sort_values("id")
+    assert df["title"].tolist() == ["a", "B", "c"]
+
+
+def test_compaction_merges_parts_and_drops_superseded_rows(storage):
+    storage.write("deezer_genres.parquet", pd.DataFrame({"id": [1, 2], "title": ["old1", "old2"]}).to_parquet())
+    for title in ["x", "y"]:
+        append_partition(storage, "deezer_genres", pd.DataFrame({"id": [2, 3], "title": [title, title]}), "2025-02-01",
+                         skip_seen=False)
+
+    migrate_legacy_object(storage, "deezer_genres")
+    summary = compact_dataset(storage, "deezer_genres")
+
+    assert summary["parts_before"] == 3
+    assert summary["parts_after"] == 2
+    assert summary["rows_dropped"] == 3
+    assert read_dataset(storage, "deezer_genres").sort_values("id")["title"].tolist() == ["old1", "y", "y"]
+    assert compact_dataset(storage, "deezer_genres")["parts_after"] == 2
+
+
+def test_readers_migrate_a_legacy_only_dataset(storage):
+    storage.write("spotify_tracks.parquet", pd.DataFrame({"track_id": ["a", "b"], "popularity": [1, 2]}).to_parquet())
+    storage.write("youtube_search_pop.parquet", pd.DataFrame({"video_id": ["c"], "genre": "pop"}).to_parquet())
+
+    assert read_dataset(storage, "spotify_tracks")["track_id"].tolist() == ["a", "b"]
+    assert read_partition(storage, "youtube_search", "pop")["video_id"].tolist() == ["c"]
+    assert not storage.exists("spotify_tracks.parquet") and [o.key for o in storage.list("youtube_search_")] == []
+    # the migrated keys count as seen
+    assert append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["b"], "popularity": [9]})) is None
+
+
+def test_genre_partitions_replace_per_genre_objects(storage):
+    storage.write("youtube_search_r&b.parquet", pd.DataFrame({"video_id": ["a", "b"], "genre": "r&b"}).to_parquet())
+    storage.write("youtube_search_pop.parquet", pd.DataFrame({"video_id": ["c"], "genre": "pop"}).to_parquet())
+    migrate_legacy_object(storage, "youtube_search")
+    append_partition(storage, "youtube_search", pd.DataFrame({"video_id": ["b", "d"], "genre": "r&b"}), partition="r&b")
+
+    assert [o.key for o in storage.list("youtube_search_")] == []
+    assert sorted(read_partition(storage, "youtube_search", "r&b")["video_id"]) == ["a", "b", "d"]
+
+    compact_dataset(storage, "youtube_search")
+    assert [partition_of(key) for key in list_parts(storage, "youtube_search")] == ["genre=pop", "genre=r%26b"]
+    assert read_manifest(storage, "youtube_search")["partitions"] == {"pop": {"rows": 1}, "r&b": {"rows": 3}}
+    assert len(read_dataset(storage, "youtube_search")) == 4
+
+
+def test_archive_profile_sorts_and_dictionary_encodes_low_cardinality_columns():
+    storage = MemoryBackend()
+    df = pd.DataFrame({"id": range(999, -1, -1), "genre": ["pop", "rock"] * 500, "title": [uuid.uuid4().hex for _ in range(1000)]})
+    save_frame(storage, "t.parquet", df, profile="archive", key_columns=["id"])
+
+    parquet = pq.ParquetFile(BytesIO(storage.read("t.parquet")))
+    columns = {c.path_in_schema: c for c in (parquet.metadata.row_group(0).column(i) for i in range(3))}
+    assert columns["id"].compression == "ZSTD" and columns["id"].statistics.min == 0
+    assert "RLE_DICTIONARY" in columns["genre"].encodings
+    assert "RLE_DICTIONARY" not in columns["title"].encodings
+    assert parquet.read()["id"].to_pylist() == list(range(1000))
+
+
+def test_append_skips_keys_already_in_the_index(storage):
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["a", "b", "b"], "name": ["A", "B", "B2"]}))
+    assert append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["a"], "name": ["A2"]})) is None
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["a", "c"], "name": ["A3", "C"]}))
+
+    parts = list_parts(storage, "spotify_tracks")
+    assert [len(pd.read_parquet(BytesIO(storage.read(part)))) for part in parts] == [2, 1]
+    assert read_dataset(storage, "spotify_tracks").sort_values("track_id")["name"].tolist() == ["A", "B", "C"]
+
+    # Refreshes bypass the filter but still land in the index
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["a", "d"], "name": ["A4", "D"]}), skip_seen=False)
+    index = key_index(storage, "spotify_tracks")
+    assert index.contains(pd.DataFrame({"track_id": ["a", "d", "e"]})).tolist() == [True, True, False]
+
+
+def test_key_index_is_rebuilt_from_data(storage):
+    append_partition(storage, "deezer_charts", pd.DataFrame({"id": [1, 2], "title": ["a", "b"]}))
+    stored = storage.read("deezer_charts/_index/keys.npy")
+    storage.delete("deezer_charts/_index/keys.npy")
+
+    index = key_index(storage, "deezer_charts")
+    assert index.contains(pd.DataFrame({"id": [2, 3]})).tolist() == [True, False]
+    assert storage.read("deezer_charts/_index/keys.npy") == stored
+
+
+def test_key_index_keeps_keys_saved_by_another_writer(storage):
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["a"], "name": ["A"]}))
+    compaction = key_index(storage, "spotify_tracks")
+    kept = read_dataset(storage, "spotify_tracks")
+    compaction.load()
+
+    # an ingest lands while compaction is running
+    append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["b"], "name": ["B"]}))
+    compaction.merge(kept)
+    assert key_index(storage, "spotify_tracks").contains(pd.DataFrame({"track_id": ["a", "b"]})).tolist() == [True, True]
+
+    # a stale in-memory copy does not drop them either
+    compaction.add(pd.DataFrame({"track_id": ["c"]}))
+    assert key_index(storage, "spotify_tracks").contains(pd.DataFrame({"track_id": ["b", "c"]})).tolist() == [True, True]
+    assert append_partition(storage, "spotify_tracks", pd.DataFrame({"track_id": ["b"], "name": ["B2"]})) is None
+
+
+def test_projected_read_fetches_only_needed_column_chunks():
+    storage = MemoryBackend()
+    n = 20_000
+    df = pd.DataFrame({
+        "video_id": [f"{i:011d}" for i in range(n)],
+        "views": range(n),
+        "description": [uuid.uuid4().hex * 64 for _ in range(n)],
+    })
+    storage.write("youtube_videos/ingest_date=2025-01-01/part-1.parquet", df.to_parquet(row_group_size=5_000))
+    size = storage.size("youtube_videos/ingest_date=2025-01-01/part-1.parquet")
+
+    ids = read_dataset(storage, "youtube_videos", columns=["video_id"])
+    assert ids.columns.tolist() == ["video_id"] and len(ids) == n
+    assert storage.stats()["read"]["bytes"] < size / 10
+
+    fetched = storage.stats()["read"]["bytes"]
+    hits = read_dataset(storage, "youtube_videos", columns=["views"], filters=[("video_id", ">=", f"{n - 10:011d}")])
+    assert hits["views"].tolist() == list(range(n - 10, n))
+    assert storage.stats()["read"]["bytes"] - fetched < size / 10
+
+
+class StubS3(BaseHTTPRequestHandler):
+    """Local stand-in for the MinIO endpoints put_object uses.
+
+    Part bodies are kept only when keep_bodies is set, so large uploads can
+    be streamed through without the stub itself growing.
+    """
+
+    keep_bodies = True
+    objects = {}
+    uploads = {}
+
+    def _reply(self, status=200, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        digest, size, chunks = hashlib.md5(), 0, []
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1 << 20))
+            remaining -= len(chunk)
+            size += len(chunk)
+            digest.update(chunk)
+            if self.keep_bodies:
+                chunks.append(chunk)
+        return b"".join(chunks), size, digest.hexdigest()
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        self._body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = {}
+            body = f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            return self._reply(body=body.encode())
+        parts = self.uploads.pop(query["uploadId"][0])
+        ordered = [parts[n] for n in sorted(parts)]
+        self.objects[url.path] = {
+            "parts": [size for _, size in ordered],
+            "data": b"".join(data for data, _ in ordered),
+        }
+        body = f"<CompleteMultipartUploadResult><Key>{url.path}</Key><ETag>\"x\"</ETag></CompleteMultipartUploadResult>"
+        self._reply(body=body.encode())
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        data, size, digest = self._body()
+        if "uploadId" in query:
+            self.uploads[query["uploadId"][0]][int(query["partNumber"][0])] = (data, size)
+        else:
+            self.objects[url.path] = {"parts": [size], "data": data}
+        self._reply(headers={"ETag": f'"{digest}"'})
+
+    def do_DELETE(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.uploads.pop(query["uploadId"][0], None)
+        self._reply(204)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_minio():
+    StubS3.objects, StubS3.uploads, StubS3.keep_bodies = {}, {}, True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubS3)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Minio(f"127.0.0.1:{server.server_address[1]}", access_key="test", secret_key="test",
+                   secure=False, region="us-east-1")
+    yield lambda **kwargs: MinioBackend(client, bucket="bronze", **kwargs)
+    server.shutdown()
+
+
+def test_stream_frame_uploads_parquet_in_parts(stub_minio):
+    df = pd.DataFrame({"video_id": [uuid.uuid4().hex for _ in range(400_000)], "views": range(400_000)})
+
+    size = stream_frame(stub_minio(part_size=5 * 2**20), "youtube_videos/part.parquet", df)
+
+    stored = StubS3.objects["/bronze/youtube_videos/part.parquet"]
+    assert len(stored["parts"]) > 1
+    assert sum(stored["parts"]) == size
+    pd.testing.assert_frame_equal(pd.read_parquet(BytesIO(stored["data"])), df)
+
+
+def test_streaming_writer_aborts_upload_on_error(stub_minio):
+    table = pa.table({"id": pa.array(range(10))})
+    with pytest.raises(RuntimeError):
+        with ParquetObjectWriter(stub_minio(), "broken.parquet", table.schema) as writer:
+            writer.write_table(table)
+            raise RuntimeError("boom")
+    assert StubS3.objects == {} and StubS3.uploads == {}
+
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads RSS from /proc")
+def test_streaming_upload_memory_stays_flat(stub_minio):
+    StubS3.keep_bodies = False
+    total_bytes = int(os.getenv("STREAMING_TEST_BYTES", 2 * 2**30))
+    part_size = 16 * 2**20
+    # 8 MiB row group of incompressible values, written over and over
+    chunk = pa.table({"payload": pa.array([os.urandom(1024) for _ in range(8192)], pa.binary())})
+
+    samples, done = [], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            samples.append(_rss_bytes())
+            time.sleep(0.05)
+
+    baseline = _rss_bytes()
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        with ParquetObjectWriter(stub_minio(part_size=part_size), "big.parquet", chunk.schema,
+                                 compression="none", use_dictionary=False) as writer:
+            while writer.bytes_written < total_bytes:
+                writer.write_table(chunk)
+    finally:
+        done.set()
+        sampler.join()
+
+    stored = StubS3.objects["/bronze/big.parquet"]
+    assert sum(stored["parts"]) == writer.bytes_written >= total_bytes
+    # a handful of parts in flight, independent of the object size
+    assert max(samples) - baseline < 12 * part_size
+    half = len(samples) // 2
+    assert max(samples[half:]) <= max(samples[:half]) + 2 * part_size
@@ -0,0 +1,36 @@
+import pandas as pd
+
+from src.ingestion.youtube_refresh import plan_stats_refresh, refresh_capacity
+
+NOW = pd.Timestamp("2025-06-30T12:00:00Z")
+
+
+def make_videos():
+    return pd.DataFrame({
+        "video_id": ["fresh", "new_fast", "new_slow", "old_due", "old_recent", "never"],
+        "published_at": pd.to_datetime([
+            "2025-06-29", "2025-06-25", "2025-06-25", "2023-01-01", "2023-01-01", "2024-12-01"
+        ], utc=True),
+        "views": [1_000, 500_000, 1_000, 9_000_000, 9_000_000, 20_000],
+        "stats_fetched_at": pd.to_datetime([
+            "2025-06-30 06:00", "2025-06-28 00:00", "2025-06-28 00:00", "2025-05-01 00:00", "2025-06-20 00:00", None
+        ], utc=True),
+    })
+
+
+def test_plan_stats_refresh_respects_tiers_and_velocity():
+    planned = plan_stats_refresh(make_videos(), max_ids=10, now=NOW)
+    # "fresh" was refreshed today and "old_recent" (> 1 year old) within its 30-day tier
+    assert set(planned) == {"new_fast", "new_slow", "old_due", "never"}
+    assert planned[0] == "new_fast"
+
+
+def test_plan_stats_refresh_caps_and_excludes():
+    planned = plan_stats_refresh(make_videos(), max_ids=2, now=NOW, exclude=["new_fast"])
+    assert len(planned) == 2
+    assert "new_fast" not in planned
+
+
+def test_refresh_capacity_fills_partial_batches():
+    assert refresh_capacity(0, budget_units=2) == 100
+    assert refresh_capacity(120, budget_units=0) == 30